@@ -1,17 +1,28 @@
 import os
 import requests
 import base64
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import google.generativeai as genai
 import json
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlparse, parse_qs
 from datetime import datetime
 import pymongo
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
 import time
 import re
+import threading
+import hashlib
+import uuid
+import tarfile
+import random
+import sys
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
 load_dotenv()
 DESCOPE_PROJECT_ID = os.getenv("DESCOPE_PROJECT_ID")
@@ -32,11 +43,330 @@ client = pymongo.MongoClient(MONGO_URI)
 db = client["futurecommit"]
 users_collection = db["users"]
 
+
+def user_filter(user_id):
+    """
+    Filter for the users doc with this app userId. The unique userId index is partial on string ids, so the
+    query has to repeat the $type predicate for the planner to use it; a bare {"userId": x} scans.
+    """
+    return {"userId": {"$eq": user_id, "$type": "string"}}
+
+
 genai.configure(api_key=GOOGLE_API_KEY)
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": ["*"]}}, supports_credentials=True)
 
-def get_outbound_token(app_id: str, user_id: str):
+# -------------------------
+# Bounded in-process caches
+# -------------------------
+# Module-level caches live as long as the process; every per-user / per-query one is a BoundedLRU so a
+# long-lived worker can't grow without bound. Per-key locks come from a fixed set of stripes for the same reason.
+LOCK_STRIPES = 64
+
+
+class BoundedLRU:
+    """Thread-safe dict-like LRU holding at most maxsize entries; reads and writes refresh recency."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __getitem__(self, key):
+        value = self.get(key, _LRU_MISSING)
+        if value is _LRU_MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_LRU_MISSING = object()
+
+
+def striped_locks():
+    return [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def stripe_lock(stripes, key):
+    """The lock guarding key; unrelated keys occasionally share one, which only serializes them."""
+    return stripes[hash(key) % len(stripes)]
+
+
+# -------------------------
+# Shared HTTP client: one pooled keep-alive session per upstream host
+# -------------------------
+# Every outbound call goes through http_request(), which reuses TCP/TLS connections per host, applies a
+# default timeout and retries rate-limited / transient failures with jittered backoff (honouring Retry-After).
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "15"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = 0.5  # seconds; attempt n sleeps up to base * 2**n
+HTTP_BACKOFF_MAX = 8.0  # cap for both computed backoff and Retry-After
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+HTTP_DEFAULT_POOL_SIZE = 10
+HTTP_POOL_SIZES = {
+    # hosts hit from thread pools get larger pools so workers do not queue for a connection
+    "api.github.com": 32,
+    "www.googleapis.com": 16,
+    "slack.com": 8,
+    "api.descope.com": 8,
+}
+
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+
+
+def http_session(host: str):
+    """Returns the shared requests.Session for an upstream host, creating it on first use."""
+    with _http_sessions_lock:
+        session = _http_sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            size = HTTP_POOL_SIZES.get(host, HTTP_DEFAULT_POOL_SIZE)
+            # retries are handled in http_request so they can honour Retry-After and response status
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_sessions[host] = session
+        return session
+
+
+def _retry_after_seconds(resp):
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _should_retry(resp, idempotent):
+    if resp.status_code == 429:
+        return True  # the upstream rejected the request without acting on it
+    if resp.status_code == 403 and resp.headers.get("Retry-After"):
+        return True  # GitHub secondary rate limit
+    return idempotent and resp.status_code in HTTP_RETRY_STATUSES
+
+
+def http_request(method: str, url: str, retries: int = None, idempotent: bool = None, reauth: bool = True, **kwargs):
+    """
+    requests-compatible call through the pooled session for url's host.
+    - timeout defaults to HTTP_DEFAULT_TIMEOUT
+    - 429 (and GitHub's 403 + Retry-After) are always retried; 5xx and connection errors only for
+      idempotent requests (GET/PUT/DELETE/..., or idempotent=True for read-only POSTs)
+    - waits Retry-After when given, otherwise full-jitter exponential backoff
+    - a 401 for a cached Descope outbound token evicts it and retries once with a fresh token (reauth=False skips)
+    Returns the final Response (callers keep checking status_code) or raises the last connection error.
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in HTTP_IDEMPOTENT_METHODS
+    if retries is None:
+        retries = HTTP_MAX_RETRIES
+    kwargs.setdefault("timeout", HTTP_DEFAULT_TIMEOUT)
+    session = http_session(urlparse(url).hostname or "")
+
+    for attempt in range(retries + 1):
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+            connect_failed = isinstance(ex, requests.exceptions.ConnectTimeout)
+            if attempt >= retries or not (idempotent or connect_failed):
+                raise
+            time.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt)))
+            continue
+        if attempt >= retries or not _should_retry(resp, idempotent):
+            break
+        delay = _retry_after_seconds(resp)
+        if delay is None:
+            delay = random.uniform(0, HTTP_BACKOFF_BASE * 2 ** attempt)
+        print(f"retrying {method} {urlparse(url).hostname} after {resp.status_code} (attempt {attempt + 1})")
+        resp.close()
+        time.sleep(min(delay, HTTP_BACKOFF_MAX))
+    if resp.status_code == 401 and reauth:
+        return _retry_with_fresh_outbound_token(method, url, resp, retries, idempotent, kwargs)
+    return resp
+
+
+def _retry_with_fresh_outbound_token(method, url, resp, retries, idempotent, kwargs):
+    headers = kwargs.get("headers") or {}
+    scheme, _, stale = (headers.get("Authorization") or "").partition(" ")
+    fresh = refresh_outbound_access_token(stale) if stale else None
+    if not fresh:
+        return resp
+    print(f"retrying {method} {urlparse(url).hostname} with a refreshed outbound token after 401")
+    resp.close()
+    kwargs = dict(kwargs, headers={**headers, "Authorization": f"{scheme} {fresh}"})
+    return http_request(method, url, retries=retries, idempotent=idempotent, reauth=False, **kwargs)
+
+
+def http_get(url, **kwargs):
+    return http_request("GET", url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return http_request("POST", url, **kwargs)
+
+
+def http_put(url, **kwargs):
+    return http_request("PUT", url, **kwargs)
+
+
+def http_patch(url, **kwargs):
+    return http_request("PATCH", url, **kwargs)
+
+
+def _attempt_unless_stopped(attempt, key, stop):
+    if stop is not None and stop.is_set():
+        return False, False, None, False
+    try:
+        ok, value, retryable = attempt(key)
+    except Exception as e:
+        ok, value, retryable = False, {"reason": "exception", "detail": str(e)}, False
+    return True, ok, value, retryable
+
+
+def run_in_retry_rounds(keys, attempt, concurrency: int, retries: int, stop=None, on_result=None):
+    """
+    Fan-out for per-item upstream writes (playlist items, file uploads, permissions, ...).
+    Calls attempt(key) -> (ok, value, retryable) for every key on a pool of `concurrency` threads; keys
+    that failed with retryable=True are attempted again in up to `retries` later rounds, with full-jitter
+    backoff between rounds. Once `stop` (a threading.Event) is set, keys not yet started are skipped.
+    on_result(key, ok, value) runs on the calling thread after every attempt.
+    Returns {key: {"ok", "value" (result or last error), "attempts"}}; attempts == 0 means skipped.
+    """
+    keys = list(keys)
+    outcome = {k: {"ok": False, "value": None, "attempts": 0} for k in keys}
+    pending = keys
+    for round_no in range(retries + 1):
+        if not pending or (stop is not None and stop.is_set()):
+            break
+        if round_no:
+            time.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** round_no)))
+        retry = set()
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as pool:
+            futures = {pool.submit(_attempt_unless_stopped, attempt, k, stop): k for k in pending}
+            for fut in as_completed(futures):
+                k = futures[fut]
+                sent, ok, value, retryable = fut.result()
+                if not sent:
+                    continue
+                res = outcome[k]
+                res["attempts"] += 1
+                res["ok"], res["value"] = ok, value
+                if on_result:
+                    on_result(k, ok, value)
+                if not ok and retryable:
+                    retry.add(k)
+        pending = [k for k in pending if k in retry]
+    return outcome
+
+
+def _google_error_payload_reason(payload):
+    err = (payload or {}).get("error") if isinstance(payload, dict) else None
+    if not isinstance(err, dict):
+        return ""
+    return (err.get("errors") or [{}])[0].get("reason") or err.get("status") or ""
+
+
+def _google_error_reason(resp):
+    """The `reason` (or status) of a Google API error response, '' if there is none."""
+    try:
+        return _google_error_payload_reason(resp.json())
+    except Exception:
+        return ""
+
+
+# -------------------------
+# Descope outbound token cache
+# -------------------------
+# Tokens are cached per (app_id, user_id) until shortly before the expiry reported by Descope.
+# Set OUTBOUND_TOKEN_CACHE_MONGO=true to share the cache across serverless instances via MongoDB.
+OUTBOUND_TOKEN_REFRESH_SKEW = int(os.getenv("OUTBOUND_TOKEN_REFRESH_SKEW", "120"))  # seconds before expiry to refresh
+OUTBOUND_TOKEN_DEFAULT_TTL = int(os.getenv("OUTBOUND_TOKEN_DEFAULT_TTL", "600"))  # used when Descope reports no expiry
+OUTBOUND_TOKEN_CACHE_MONGO = os.getenv("OUTBOUND_TOKEN_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+OUTBOUND_TOKEN_CACHE_SIZE = int(os.getenv("OUTBOUND_TOKEN_CACHE_SIZE", "2048"))
+outbound_tokens_collection = db["outbound_tokens"]
+
+_outbound_token_cache = BoundedLRU(OUTBOUND_TOKEN_CACHE_SIZE)  # (app_id, user_id) -> {"token": token_json, "expiresAt": epoch}
+_outbound_token_owners = BoundedLRU(OUTBOUND_TOKEN_CACHE_SIZE)  # sha256(access token) -> (app_id, user_id)
+_outbound_token_locks = striped_locks()  # only one refresh per key runs at a time
+
+
+def _outbound_token_lock(key):
+    return stripe_lock(_outbound_token_locks, key)
+
+
+def _outbound_token_expires_at(token_json, now):
+    """
+    Returns the epoch (seconds) at which the outbound token expires.
+    Descope reports 'accessTokenExpiry' (unix seconds, sometimes as a string); a few shapes use
+    'expiresAt'/'expiresIn'. Falls back to OUTBOUND_TOKEN_DEFAULT_TTL when nothing usable is present.
+    """
+    token_field = token_json.get("token") if isinstance(token_json, dict) else None
+    sources = [token_field, token_json] if isinstance(token_field, dict) else [token_json]
+    for src in sources:
+        if not isinstance(src, dict):
+            continue
+        for key in ("accessTokenExpiry", "expiresAt", "expiry"):
+            value = src.get(key)
+            if value in (None, "", 0, "0"):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                try:
+                    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+                except ValueError:
+                    continue
+            # some responses use milliseconds
+            return value / 1000.0 if value > 1e12 else value
+        for key in ("expiresIn", "expires_in"):
+            if src.get(key):
+                try:
+                    return now + float(src.get(key))
+                except (TypeError, ValueError):
+                    continue
+    return now + OUTBOUND_TOKEN_DEFAULT_TTL
+
+
+def _outbound_token_is_fresh(entry, now):
+    return bool(entry) and entry["expiresAt"] - OUTBOUND_TOKEN_REFRESH_SKEW > now
+
+
+def _fetch_outbound_token(app_id: str, user_id: str):
     """
     Returns the token JSON from Descope mgmt API for the given outbound app and user.
     """
@@ -47,12 +377,114 @@ def get_outbound_token(app_id: str, user_id: str):
         "Authorization": f"Bearer {DESCOPE_PROJECT_ID}:{DESCOPE_MANAGEMENT_KEY}"
     }
     payload = {"appId": app_id, "userId": user_id, "options": {}}
-    r = requests.post(url, headers=headers, json=payload)
+    r = http_post(url, headers=headers, json=payload, timeout=10, idempotent=True)
     if r.status_code != 200:
         raise Exception(f"Failed to fetch token: {r.status_code} {r.text}")
     print(f"Descope token response: {r.json()}")
     return r.json()  # contains accessToken and other fields
 
+
+def _load_outbound_token_from_mongo(key):
+    try:
+        doc = outbound_tokens_collection.find_one(
+            {"appId": key[0], "userId": key[1]}, {"_id": 0, "token": 1, "expiresAt": 1}
+        )
+        if doc:
+            return {"token": doc["token"], "expiresAt": doc["expiresAt"]}
+    except Exception as e:
+        print("outbound token cache read failed:", e)
+    return None
+
+
+def _store_outbound_token_in_mongo(key, entry):
+    try:
+        outbound_tokens_collection.update_one(
+            {"appId": key[0], "userId": key[1]},
+            {"$set": {
+                "token": entry["token"],
+                "expiresAt": entry["expiresAt"],
+                "expireAt": datetime.utcfromtimestamp(entry["expiresAt"]),
+                "updatedAt": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        print("outbound token cache write failed:", e)
+
+
+def _outbound_token_fingerprint(access_token: str):
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+def _remember_outbound_token(key, entry):
+    _outbound_token_cache[key] = entry
+    access_token = extract_access_token(entry["token"])
+    if access_token:
+        _outbound_token_owners[_outbound_token_fingerprint(access_token)] = key
+
+
+def get_outbound_token(app_id: str, user_id: str, force_refresh: bool = False):
+    """
+    Returns the token JSON from Descope mgmt API for the given outbound app and user.
+    Responses are cached per (app_id, user_id) and refreshed OUTBOUND_TOKEN_REFRESH_SKEW seconds
+    before they expire; concurrent callers for the same key wait for a single refresh.
+    """
+    key = (app_id, user_id)
+    entry = _outbound_token_cache.get(key)
+    if not force_refresh and _outbound_token_is_fresh(entry, time.time()):
+        return entry["token"]
+
+    with _outbound_token_lock(key):
+        now = time.time()
+        entry = _outbound_token_cache.get(key)
+        if not force_refresh:
+            # another thread may have refreshed while we waited for the lock
+            if _outbound_token_is_fresh(entry, now):
+                return entry["token"]
+            if OUTBOUND_TOKEN_CACHE_MONGO:
+                entry = _load_outbound_token_from_mongo(key)
+                if _outbound_token_is_fresh(entry, now):
+                    _remember_outbound_token(key, entry)
+                    return entry["token"]
+
+        token_json = _fetch_outbound_token(app_id, user_id)
+        entry = {"token": token_json, "expiresAt": _outbound_token_expires_at(token_json, now)}
+        _remember_outbound_token(key, entry)
+        if OUTBOUND_TOKEN_CACHE_MONGO:
+            _store_outbound_token_in_mongo(key, entry)
+        return token_json
+
+
+def invalidate_outbound_token(app_id: str, user_id: str):
+    """Drop a cached token, e.g. after the provider rejected it with 401."""
+    key = (app_id, user_id)
+    _outbound_token_cache.pop(key, None)
+    if OUTBOUND_TOKEN_CACHE_MONGO:
+        try:
+            outbound_tokens_collection.delete_one({"appId": app_id, "userId": user_id})
+        except Exception as e:
+            print("outbound token cache delete failed:", e)
+
+
+def refresh_outbound_access_token(stale_access_token: str):
+    """
+    Called by http_request on a 401: if the rejected access token came from the outbound token cache, evicts it
+    (unless another request already replaced it) and returns a newer access token for the same app and user.
+    Returns None for tokens this process did not hand out, or when Descope has nothing newer.
+    """
+    key = _outbound_token_owners.get(_outbound_token_fingerprint(stale_access_token))
+    if not key:
+        return None
+    entry = _outbound_token_cache.get(key)
+    if not entry or extract_access_token(entry["token"]) == stale_access_token:
+        invalidate_outbound_token(*key)
+    try:
+        fresh = extract_access_token(get_outbound_token(*key))
+    except Exception as e:
+        print("outbound token refresh after 401 failed:", e)
+        return None
+    return fresh if fresh and fresh != stale_access_token else None
+
 def extract_access_token(token_json):
     """
     Robustly extract an OAuth access token from the Descope mgmt response.
@@ -76,72 +508,222 @@ def extract_access_token(token_json):
             if token_field.get(k):
                 return token_field.get(k)
 
-def fetch_github_user_and_collaborators(access_token, repo_name):
+# -------------------------
+# GitHub identity resolution (token -> login/id)
+# -------------------------
+GITHUB_IDENTITY_TTL = int(os.getenv("GITHUB_IDENTITY_TTL", "3600"))  # seconds before /user is revalidated
+GITHUB_IDENTITY_CACHE_SIZE = int(os.getenv("GITHUB_IDENTITY_CACHE_SIZE", "2048"))
+
+_github_identity_cache = BoundedLRU(GITHUB_IDENTITY_CACHE_SIZE)  # sha256(token) -> {"login", "id", "etag", "expiresAt"}
+
+
+def _github_token_fingerprint(access_token: str) -> str:
+    # never keep raw tokens as dict keys
+    return hashlib.sha256((access_token or "").encode("utf-8")).hexdigest()
+
+
+def _github_identity_from_db(login_id, fingerprint):
+    """
+    Read the persisted connectedAccounts.github mapping for login_id, but only if GET /user verified it for
+    the token with this fingerprint; a loginId alone must never vouch for whoever holds some other token.
+    """
+    if not login_id:
+        return None
+    try:
+        doc = users_collection.find_one(user_filter(login_id), {"_id": 0, "connectedAccounts.github": 1})
+    except Exception as e:
+        print("github identity lookup failed:", e)
+        return None
+    gh = ((doc or {}).get("connectedAccounts") or {}).get("github") or {}
+    if gh.get("login") and gh.get("tokenFingerprint") == fingerprint:
+        return {"login": gh.get("login"), "id": gh.get("id")}
+    return None
+
+
+def _persist_github_identity(login_id, identity, fingerprint):
+    if not login_id:
+        return
+    try:
+        users_collection.update_one(
+            user_filter(login_id),
+            {"$set": {
+                "connectedAccounts.github.id": identity.get("id"),
+                "connectedAccounts.github.login": identity.get("login"),
+                "connectedAccounts.github.tokenFingerprint": fingerprint,
+                "updatedAt": datetime.utcnow()
+            }}
+        )
+    except Exception as e:
+        print("github identity persist failed:", e)
+
+
+def resolve_github_identity(access_token: str, login_id: str = None):
+    """
+    Returns {"login": ..., "id": ...} for the GitHub user owning access_token.
+    Lookup order: in-process cache (revalidated with an ETag after GITHUB_IDENTITY_TTL),
+    then users_collection.connectedAccounts.github for login_id if it was verified for this same token,
+    then GET /user. Only identities GitHub confirmed for the token are cached.
+    Raises if GitHub rejects the request.
+    """
+    fp = _github_token_fingerprint(access_token)
+    now = time.time()
+    entry = _github_identity_cache.get(fp)
+    if entry and entry["expiresAt"] > now:
+        return {"login": entry["login"], "id": entry["id"]}
+
+    if entry is None:
+        stored = _github_identity_from_db(login_id, fp)
+        if stored:
+            _github_identity_cache[fp] = {**stored, "etag": None, "expiresAt": now + GITHUB_IDENTITY_TTL}
+            return stored
+
     headers = {
         "Authorization": f"token {access_token}",
         "Accept": "application/vnd.github+json",
         "User-Agent": "descope-demo-app"
     }
-    # get authenticated user (owner) login
-    user_resp = requests.get("https://api.github.com/user", headers=headers)
+    if entry and entry.get("etag"):
+        # 304 responses do not count against the GitHub rate limit
+        headers["If-None-Match"] = entry["etag"]
+    user_resp = http_get("https://api.github.com/user", headers=headers, timeout=8)
+    if user_resp.status_code == 304 and entry:
+        entry["expiresAt"] = now + GITHUB_IDENTITY_TTL
+        return {"login": entry["login"], "id": entry["id"]}
     if user_resp.status_code != 200:
+        _github_identity_cache.pop(fp, None)
         raise Exception(f"GitHub user request failed: {user_resp.status_code} {user_resp.text}")
-    user_login = user_resp.json().get("login")
-
-    collab_url = f"https://api.github.com/repos/{user_login}/{repo_name}/collaborators?per_page=100"
-    collab_resp = requests.get(collab_url, headers=headers)
-    if collab_resp.status_code != 200:
-        # Try reading collaborator listing failed; return empty list
-        return user_login, []
-    return user_login, collab_resp.json()
-
-def detect_languages_from_code_blobs(blobs):
-    tech_patterns = [
-        ("React", ["import React", "from 'react'", "from \"react\"", ".jsx", ".tsx"]),
-        ("Angular", ["@angular/core", "angular.module", "ng-controller", ".component.ts"]),
-        ("Vue", ["<template>", "export default {", "from 'vue'", "from \"vue\""]),
-        ("Ionic", ["@ionic/", "ionic-angular", "import { Ionic"]),
-        ("Flutter", ["import 'package:flutter/", "void main() {", "Flutter"]),
-        ("Docker", ["FROM ", "docker-compose", "CMD ", "ENTRYPOINT "]),
-        ("Jenkins", ["pipeline {", "Jenkinsfile", "node {", "stage("]),
-        ("TypeScript", [".ts", ".tsx"]),
-        ("JavaScript", [".js", "function ", "const ", "let "]),
-        ("Python", [".py", "def ", "import "]),
-        ("Java", [".java", "public class ", "import java."]),
-        ("Go", [".go", "package main", "func "]),
-        ("Ruby", [".rb", "def ", "end"]),
-        ("PHP", [".php", "<?php"]),
-        ("C++", [".cpp", "#include", "std::"]),
-        ("C#", [".cs", "namespace ", "using System"]),
-        ("HTML", [".html", "<html", "<div"]),
-        ("CSS", [".css", "{", "color:", "background:"]),
-        ("Markdown", [".md", "# ", "## "]),
-        ("Shell", [".sh", "#!/bin/bash", "echo "]),
-        ("Other", [])
-    ]
-    tech_counts = {}
-    for blob in blobs:
-        path = blob["path"].lower()
-        content = blob.get("content", "")
-        found = False
-        for tech, patterns in tech_patterns:
-            for pattern in patterns:
-                if pattern.startswith("."):
-                    if path.endswith(pattern):
-                        tech_counts[tech] = tech_counts.get(tech, 0) + len(content)
-                        found = True
-                        break
-                else:
-                    if pattern in content:
-                        tech_counts[tech] = tech_counts.get(tech, 0) + len(content)
-                        found = True
-                        break
-            if found:
-                break
-        if not found:
-            tech_counts["Other"] = tech_counts.get("Other", 0) + len(content)
-    # Remove zero-counts and return
-    return {k: v for k, v in tech_counts.items() if v > 0}
+    gh = user_resp.json()
+    identity = {"login": gh.get("login"), "id": gh.get("id")}
+    _github_identity_cache[fp] = {**identity, "etag": user_resp.headers.get("ETag"), "expiresAt": now + GITHUB_IDENTITY_TTL}
+    if entry is None or entry.get("login") != identity["login"]:
+        _persist_github_identity(login_id, identity, fp)
+    return identity
+
+
+def get_github_login(access_token: str, login_id: str = None):
+    """Shortcut for resolve_github_identity(...)["login"]."""
+    return resolve_github_identity(access_token, login_id).get("login")
+
+
+# -------------------------
+# Collaborator roster: GitHub login -> email -> Slack id, resolved once per repo
+# -------------------------
+COLLABORATOR_ROSTER_TTL = int(os.getenv("COLLABORATOR_ROSTER_TTL", "300"))  # seconds before the listing is revalidated
+COLLABORATOR_MAX_PAGES = int(os.getenv("COLLABORATOR_MAX_PAGES", "20"))  # 100 collaborators per page
+COLLABORATOR_ROSTER_CACHE_SIZE = int(os.getenv("COLLABORATOR_ROSTER_CACHE_SIZE", "256"))
+
+# (owner, repo) lowercased -> {"owner", "collaborators", "etag", "emails", "expiresAt"}
+_collaborator_rosters = BoundedLRU(COLLABORATOR_ROSTER_CACHE_SIZE)
+_collaborator_roster_locks = striped_locks()
+
+
+def _collaborator_roster_lock(key):
+    return stripe_lock(_collaborator_roster_locks, key)
+
+
+def _list_collaborators(headers, owner, repo_name, etag=None):
+    """
+    Lists every collaborator of owner/repo, following the Link header page by page.
+    Returns (status_code, etag, collaborators, complete); 304 means the cached listing is still current.
+    Page 1's ETag only vouches for page 1, so it is returned (and worth revalidating with) only when the
+    listing fits on one page. complete is False when a later page failed and the list is cut short.
+    """
+    url = f"https://api.github.com/repos/{owner}/{repo_name}/collaborators"
+    first_headers = {**headers, "If-None-Match": etag} if etag else headers
+    r = http_get(url, headers=first_headers, params={"per_page": 100}, timeout=10)
+    if r.status_code == 304:
+        return 304, etag, [], True
+    if r.status_code != 200:
+        return r.status_code, None, [], False
+    new_etag = r.headers.get("ETag") if not r.links.get("next") else None
+    collaborators = list(r.json() or [])
+    pages = 1
+    while r.links.get("next", {}).get("url") and pages < COLLABORATOR_MAX_PAGES:
+        r = http_get(r.links["next"]["url"], headers=headers, timeout=10)
+        if r.status_code != 200:
+            print(f"collaborator page {pages + 1} failed for {owner}/{repo_name}: {r.status_code}")
+            return 200, None, collaborators, False
+        collaborators.extend(r.json() or [])
+        pages += 1
+    return 200, new_etag, collaborators, True
+
+
+def _collaborator_emails(logins):
+    """Maps GitHub logins to the emails of users that linked that GitHub account here."""
+    emails = {}
+    if not logins:
+        return emails
+    try:
+        docs = users_collection.find(
+            {"connectedAccounts.github.login": {"$in": list(logins)}},
+            {"_id": 0, "email": 1, "connectedAccounts.github.login": 1}
+        )
+        for d in docs:
+            login = ((d.get("connectedAccounts") or {}).get("github") or {}).get("login")
+            if login and d.get("email") and login not in emails:
+                emails[login] = d["email"]
+    except Exception as e:
+        print("DB lookup error mapping collaborators to emails:", e)
+    return emails
+
+
+def collaborator_roster(access_token, repo_name, login_id=None, slack_token=None, force=False):
+    """
+    Returns the collaborator roster of the authenticated user's repo:
+      { owner, collaborators: [GitHub collaborator objects], logins, emailsByLogin, emails, cached }
+    The listing is cached per repo for COLLABORATOR_ROSTER_TTL, then revalidated with its ETag if it fits on
+    one page and relisted otherwise, so a meet + doc + channel session lists and maps the collaborators once.
+    A listing cut short by a failed page is returned but not cached.
+    With slack_token the emails are also resolved to Slack ids and the result gains
+      slackUserIds: {email: user id}, missingEmails: [...], lookupDetails: {...}
+    """
+    owner = get_github_login(access_token, login_id)
+    key = ((owner or "").lower(), (repo_name or "").lower())
+    with _collaborator_roster_lock(key):
+        entry = _collaborator_rosters.get(key)
+        cached = bool(entry) and not force and entry["expiresAt"] > time.time()
+        if not cached:
+            headers = {
+                "Authorization": f"token {access_token}",
+                "Accept": "application/vnd.github+json",
+                "User-Agent": "descope-demo-app"
+            }
+            status, etag, collaborators, complete = _list_collaborators(
+                headers, owner, repo_name, etag=(entry or {}).get("etag"))
+            if status == 304 and entry:
+                collaborators, etag = entry["collaborators"], entry["etag"]
+            elif status != 200:
+                # no access or repo missing: behave like an empty repo, but do not cache the failure
+                print(f"collaborator listing failed for {owner}/{repo_name}: {status}")
+                _collaborator_rosters.pop(key, None)
+                collaborators, etag = [], None
+            logins = [c.get("login") for c in collaborators if c.get("login")]
+            # linked accounts change independently of the listing, so the join is redone on every revalidation
+            entry = {
+                "owner": owner,
+                "collaborators": collaborators,
+                "etag": etag,
+                "emails": _collaborator_emails(logins),
+                "expiresAt": time.time() + COLLABORATOR_ROSTER_TTL
+            }
+            if status in (200, 304) and complete:
+                _collaborator_rosters[key] = entry
+            elif status == 200:
+                _collaborator_rosters.pop(key, None)
+
+    login_emails = entry["emails"]
+    roster = {
+        "owner": entry["owner"],
+        "collaborators": entry["collaborators"],
+        "logins": [c.get("login") for c in entry["collaborators"] if c.get("login")],
+        "emailsByLogin": login_emails,
+        "emails": list(dict.fromkeys(login_emails[c["login"]] for c in entry["collaborators"] if c.get("login") in login_emails)),
+        "cached": cached
+    }
+    if slack_token:
+        found, missing, details = slack_resolve_user_ids(slack_token, roster["emails"])
+        roster.update({"slackUserIds": found, "missingEmails": missing, "lookupDetails": details})
+    return roster
 
 @app.route("/api/user/register", methods=["POST"])
 def user_register():
@@ -153,7 +735,7 @@ def user_register():
         return jsonify({"error": "userId and email required"}), 400
 
     users_collection.update_one(
-        {"userId": user_id},
+        user_filter(user_id),
         {
             "$set": {
                 "email": email,
@@ -168,12 +750,104 @@ def user_register():
     )
     return jsonify({"success": True, "message": "User registered/updated successfully"})
 
+# -------------------------
+# Repository listing for /api/github/minimal
+# -------------------------
+GITHUB_REPO_PAGE_SIZE = 100
+GITHUB_PAGE_CONCURRENCY = int(os.getenv("GITHUB_PAGE_CONCURRENCY", "4"))
+GITHUB_GRAPHQL_BATCH_SIZE = 50
+
+
+def _iter_github_repo_pages(headers):
+    """
+    Yields pages of /user/repos in order. Page 1 is fetched first to learn the page count from the
+    Link header; the remaining pages are fetched concurrently.
+    """
+    url = "https://api.github.com/user/repos"
+    first = http_get(url, headers=headers, params={"per_page": GITHUB_REPO_PAGE_SIZE, "page": 1}, timeout=15)
+    if first.status_code != 200:
+        raise Exception(f"GitHub repos request failed: {first.status_code} {first.text}")
+    yield first.json()
+
+    last_url = first.links.get("last", {}).get("url")
+    if not last_url:
+        return
+    last_page = int(parse_qs(urlparse(last_url).query).get("page", ["1"])[0])
+
+    def fetch_page(page):
+        r = http_get(url, headers=headers, params={"per_page": GITHUB_REPO_PAGE_SIZE, "page": page}, timeout=15)
+        if r.status_code != 200:
+            raise Exception(f"GitHub repos request failed: {r.status_code} {r.text}")
+        return r.json()
+
+    with ThreadPoolExecutor(max_workers=GITHUB_PAGE_CONCURRENCY) as pool:
+        # map() keeps page order while the requests run in parallel
+        for page_data in pool.map(fetch_page, range(2, last_page + 1)):
+            yield page_data
+
+
+def _github_last_commit_dates(headers, repos):
+    """
+    Returns {full_name: committedDate of the default branch head} using one GraphQL query per
+    GITHUB_GRAPHQL_BATCH_SIZE repos. Repos GitHub cannot resolve are simply missing from the result.
+    """
+    dates = {}
+    for i in range(0, len(repos), GITHUB_GRAPHQL_BATCH_SIZE):
+        chunk = repos[i:i + GITHUB_GRAPHQL_BATCH_SIZE]
+        fields = []
+        for idx, repo in enumerate(chunk):
+            owner = repo.get("owner", {}).get("login")
+            fields.append(
+                f"r{idx}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo.get('name'))}) "
+                "{ nameWithOwner defaultBranchRef { target { ... on Commit { committedDate } } } }"
+            )
+        query = "query { " + " ".join(fields) + " }"
+        try:
+            r = http_post("https://api.github.com/graphql", headers=headers, json={"query": query}, timeout=20, idempotent=True)
+            if r.status_code != 200:
+                print("github graphql last-commit lookup failed:", r.status_code, r.text)
+                continue
+            # partial errors (deleted/renamed repos) still return data for the rest
+            data = r.json().get("data") or {}
+        except Exception as e:
+            print("github graphql last-commit lookup failed:", e)
+            continue
+        for node in data.values():
+            target = ((node or {}).get("defaultBranchRef") or {}).get("target") or {}
+            if node and target.get("committedDate"):
+                dates[node.get("nameWithOwner")] = target.get("committedDate")
+    return dates
+
+
+def _iter_owned_repo_batches(headers, user_login, precise=False):
+    """
+    Yields lists of {name, url, private, last_commit} per page of /user/repos.
+    last_commit is the repo's pushed_at unless precise=True, in which case the default branch head
+    commit date is looked up in bulk via GraphQL (falling back to pushed_at).
+    """
+    for page_data in _iter_github_repo_pages(headers):
+        owned = [r for r in page_data if r.get("owner", {}).get("login") == user_login or r.get("fork")]
+        dates = _github_last_commit_dates(headers, owned) if precise and owned else {}
+        yield [{
+            "name": repo.get("name"),
+            "url": repo.get("html_url"),
+            "private": repo.get("private"),
+            "last_commit": dates.get(repo.get("full_name")) or repo.get("pushed_at")
+        } for repo in owned]
+
+
 @app.route("/api/github/minimal", methods=["POST"])
 def github_minimal():
+    """
+    POST { loginId, preciseLastCommit?: bool, stream?: bool }
+    Returns { repos: [...] }, or with stream=true an NDJSON body of {"repos": [...]} lines (one per
+    page) followed by {"done": true, "count": n}.
+    """
     body = request.get_json() or {}
     login_id = body.get("loginId")
     if not login_id:
         return jsonify({"error": "loginId required"}), 400
+    precise = bool(body.get("preciseLastCommit"))
 
     try:
         token = get_outbound_token("github", login_id)
@@ -186,112 +860,773 @@ def github_minimal():
         "Accept": "application/vnd.github+json",
         "User-Agent": "descope-demo-app"
     }
-    user_resp = requests.get("https://api.github.com/user", headers=headers)
-    if user_resp.status_code != 200:
-        return jsonify({"error": "github user request failed", "detail": user_resp.text}), 500
-    user_login = user_resp.json().get("login")
+    try:
+        user_login = get_github_login(access_token, login_id)
+    except Exception as e:
+        return jsonify({"error": "github user request failed", "detail": str(e)}), 500
+
+    if body.get("stream"):
+        def generate():
+            count = 0
+            try:
+                for batch in _iter_owned_repo_batches(headers, user_login, precise):
+                    count += len(batch)
+                    yield {"repos": batch}
+            except Exception as e:
+                yield {"error": "github request failed", "detail": str(e)}
+                return
+            yield {"done": True, "count": count}
+        return event_stream_response(generate())
 
     repos = []
-    page = 1
-    while True:
-        r = requests.get("https://api.github.com/user/repos", headers=headers, params={"per_page": 50, "page": page})
+    try:
+        for batch in _iter_owned_repo_batches(headers, user_login, precise):
+            repos.extend(batch)
+    except Exception as e:
+        return jsonify({"error": "github request failed", "detail": str(e)}), 500
+
+    return jsonify({"repos": repos})
+
+# -------------------------
+# Repository snapshot (one tarball download instead of per-file contents calls)
+# -------------------------
+SNAPSHOT_CODE_EXTENSIONS = (
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".go", ".rb", ".php", ".c",
+    ".cpp", ".cs", ".html", ".css", ".md", ".sh"
+)
+SNAPSHOT_MAX_FILE_BYTES = int(os.getenv("SNAPSHOT_MAX_FILE_BYTES", "200000"))
+SNAPSHOT_MAX_FILES = int(os.getenv("SNAPSHOT_MAX_FILES", "200"))
+
+
+def _download_repo_snapshot(access_token, owner, repo_name, ref, extensions, max_file_bytes, max_files, paths=None):
+    url = f"https://api.github.com/repos/{owner}/{repo_name}/tarball"
+    if ref:
+        url += f"/{quote_plus(ref)}"
+    headers = {"Accept": "application/vnd.github+json", "User-Agent": "descope-demo-app"}
+    if access_token:
+        headers["Authorization"] = f"token {access_token}"
+    # GitHub redirects to codeload with a signed URL, so the token is not needed after the redirect
+    r = http_get(url, headers=headers, stream=True, timeout=30)
+    if r.status_code != 200:
+        raise Exception(f"Repo tarball request failed: {r.status_code} {r.text[:300]}")
+    r.raw.decode_content = True
+
+    files = []
+    try:
+        # "r|gz" reads the archive as a stream; nothing is written to disk
+        with tarfile.open(fileobj=r.raw, mode="r|gz") as tf:
+            for member in tf:
+                if not member.isfile() or member.size > max_file_bytes:
+                    continue
+                # entries are prefixed with "<owner>-<repo>-<sha>/"
+                path = member.name.split("/", 1)[1] if "/" in member.name else member.name
+                if paths is not None:
+                    if path not in paths:
+                        continue
+                elif not path.lower().endswith(extensions):
+                    continue
+                fobj = tf.extractfile(member)
+                if fobj is None:
+                    continue
+                content = fobj.read().decode("utf-8", errors="ignore")
+                files.append({"path": path, "content": content, "size": member.size})
+                if len(files) >= max_files:
+                    break
+    finally:
+        r.close()
+    return files
+
+
+def load_repo_snapshot(access_token, owner, repo_name, ref=None, extensions=SNAPSHOT_CODE_EXTENSIONS,
+                       max_file_bytes=SNAPSHOT_MAX_FILE_BYTES, max_files=SNAPSHOT_MAX_FILES, paths=None):
+    """
+    Returns a list of {"path", "content", "size"} for text files in the repository, read from a single
+    tarball download. Only files with a matching extension and at most max_file_bytes are kept;
+    pass `paths` to select an exact set of files instead of filtering by extension.
+    Within a request the snapshot is memoized, so every analysis consumer shares one download.
+    Returns [] if the archive cannot be fetched (empty repo, missing access, ...).
+    """
+    paths = frozenset(paths) if paths is not None else None
+    key = (owner, repo_name, ref, tuple(extensions), max_file_bytes, max_files, paths)
+    memo = None
+    if has_request_context():
+        memo = g.setdefault("repo_snapshots", {})
+        if key in memo:
+            return memo[key]
+    try:
+        files = _download_repo_snapshot(access_token, owner, repo_name, ref, tuple(extensions), max_file_bytes, max_files, paths)
+    except Exception as e:
+        print("repo snapshot failed:", e)
+        files = []
+    if memo is not None:
+        memo[key] = files
+    return files
+
+
+# -------------------------
+# Ranked repository file sampler (shared by every Gemini analysis prompt)
+# -------------------------
+SAMPLER_BYTE_BUDGET = int(os.getenv("SAMPLER_BYTE_BUDGET", "16000"))  # total content bytes handed to a prompt
+SAMPLER_PER_FILE_BYTES = int(os.getenv("SAMPLER_PER_FILE_BYTES", "4000"))
+SAMPLER_MAX_FILE_BYTES = 200000  # files larger than this (per tree `size`) are never sampled
+# above this the sample (byte_budget, ~16 KB) is read with blob calls; the tarball carries the whole repo
+SAMPLER_TARBALL_MAX_REPO_BYTES = int(os.getenv("SAMPLER_TARBALL_MAX_REPO_BYTES", str(1024 * 1024)))
+SAMPLER_BLOB_CONCURRENCY = 8
+
+SAMPLER_SKIP_DIRS = (
+    "node_modules/", "vendor/", "third_party/", "bower_components/", "dist/", "build/", "out/", ".next/",
+    "coverage/", "__pycache__/", ".venv/", "venv/", "site-packages/", "fixtures/", "__fixtures__/",
+    "testdata/", "__snapshots__/", "migrations/", ".git/", ".idea/", ".vscode/"
+)
+SAMPLER_SKIP_SUFFIXES = (
+    ".min.js", ".min.css", ".map", ".lock", "-lock.json", ".snap", ".pb.go", "_pb2.py", ".d.ts",
+    ".generated.ts", ".bundle.js", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".ico", ".pdf", ".zip",
+    ".woff", ".woff2", ".ttf", ".eot", ".mp4", ".mp3", ".jar", ".exe", ".dll", ".so", ".bin"
+)
+SAMPLER_MANIFESTS = {
+    "package.json": 100, "requirements.txt": 100, "pyproject.toml": 100, "setup.py": 90, "setup.cfg": 70,
+    "pipfile": 90, "go.mod": 100, "cargo.toml": 100, "pom.xml": 100, "build.gradle": 90, "build.gradle.kts": 90,
+    "gemfile": 90, "composer.json": 90, "pubspec.yaml": 100, "dockerfile": 70, "docker-compose.yml": 60,
+    "docker-compose.yaml": 60, "makefile": 50, "vercel.json": 40, "tsconfig.json": 40, "jenkinsfile": 50
+}
+SAMPLER_ENTRY_POINTS = {"main", "app", "index", "server", "__main__", "manage", "cli", "wsgi", "asgi", "program", "application"}
+SAMPLER_CODE_EXTENSIONS = SNAPSHOT_CODE_EXTENSIONS + (".kt", ".swift", ".dart", ".rs", ".vue", ".svelte", ".scala", ".h", ".hpp")
+
+
+def _sampler_score(path: str):
+    """Importance score for a tree path, or None if the file should never be sampled."""
+    lower = path.lower()
+    if any(lower.startswith(d) or f"/{d}" in lower for d in SAMPLER_SKIP_DIRS) or lower.endswith(SAMPLER_SKIP_SUFFIXES):
+        return None
+    base = lower.rsplit("/", 1)[-1]
+    depth = lower.count("/")
+    stem = base.rsplit(".", 1)[0]
+
+    if base.startswith("readme"):
+        score = 95 if depth == 0 else 35
+    elif base in SAMPLER_MANIFESTS:
+        score = SAMPLER_MANIFESTS[base]
+    elif lower.endswith(SAMPLER_CODE_EXTENSIONS):
+        score = 80 if stem in SAMPLER_ENTRY_POINTS else 30
+        if lower.endswith((".md", ".html", ".css")):
+            score -= 15
+    else:
+        return None
+    if any(part in ("test", "tests", "spec", "__tests__", "e2e", "examples", "docs") for part in lower.split("/")[:-1]):
+        score -= 25
+    return score - 5 * depth
+
+
+def resolve_default_branch(access_token, owner, repo_name):
+    """Returns the repository's default branch (memoized per request); falls back to 'main'."""
+    memo = g.setdefault("default_branches", {}) if has_request_context() else {}
+    key = (owner, repo_name)
+    if key in memo:
+        return memo[key]
+    headers = {"Accept": "application/vnd.github+json", "User-Agent": "descope-demo-app"}
+    if access_token:
+        headers["Authorization"] = f"token {access_token}"
+    branch = "main"
+    try:
+        r = http_get(f"https://api.github.com/repos/{owner}/{repo_name}", headers=headers, timeout=10)
+        if r.status_code == 200:
+            branch = r.json().get("default_branch") or "main"
+    except Exception as e:
+        print("default branch lookup failed:", e)
+    memo[key] = branch
+    return branch
+
+
+def get_repo_tree(access_token, owner, repo_name, branch):
+    """
+    Returns the recursive git tree JSON ({"sha", "tree", "truncated"}) for a branch, or None on failure.
+    Memoized per request so the analysis cache and the sampler share one tree read.
+    """
+    memo = g.setdefault("repo_trees", {}) if has_request_context() else {}
+    key = (owner, repo_name, branch)
+    if key in memo:
+        return memo[key]
+    headers = {"Accept": "application/vnd.github+json", "User-Agent": "descope-demo-app"}
+    if access_token:
+        headers["Authorization"] = f"token {access_token}"
+    tree_json = None
+    try:
+        tr = http_get(f"https://api.github.com/repos/{owner}/{repo_name}/git/trees/{quote_plus(branch)}",
+                          headers=headers, params={"recursive": 1}, timeout=15)
+        if tr.status_code == 200:
+            tree_json = tr.json()
+    except Exception as e:
+        print("repo tree request failed:", e)
+    memo[key] = tree_json
+    return tree_json
+
+
+def get_repo_tree_sha(access_token, owner, repo_name, branch):
+    """
+    Returns the root tree SHA of a branch, or None. Uses an already-read recursive tree when this request has one,
+    otherwise one small branches/<branch> call, so a cache lookup keyed by tree SHA never pays for the full tree.
+    """
+    trees = g.get("repo_trees", {}) if has_request_context() else {}
+    if trees.get((owner, repo_name, branch)):
+        return trees[(owner, repo_name, branch)].get("sha")
+    memo = g.setdefault("repo_tree_shas", {}) if has_request_context() else {}
+    key = (owner, repo_name, branch)
+    if key in memo:
+        return memo[key]
+    headers = {"Accept": "application/vnd.github+json", "User-Agent": "descope-demo-app"}
+    if access_token:
+        headers["Authorization"] = f"token {access_token}"
+    tree_sha = None
+    try:
+        r = http_get(f"https://api.github.com/repos/{owner}/{repo_name}/branches/{quote_plus(branch)}", headers=headers, timeout=10)
+        if r.status_code == 200:
+            tree_sha = ((r.json().get("commit") or {}).get("commit") or {}).get("tree", {}).get("sha")
+    except Exception as e:
+        print("branch request failed:", e)
+    if tree_sha is None:
+        tree_sha = (get_repo_tree(access_token, owner, repo_name, branch) or {}).get("sha")
+    memo[key] = tree_sha
+    return tree_sha
+
+
+def _fetch_blobs(access_token, owner, repo_name, items):
+    """Fetch raw blob contents for tree items concurrently; returns {path: content}."""
+    headers = {"Accept": "application/vnd.github.raw", "User-Agent": "descope-demo-app"}
+    if access_token:
+        headers["Authorization"] = f"token {access_token}"
+
+    def fetch(item):
+        r = http_get(f"https://api.github.com/repos/{owner}/{repo_name}/git/blobs/{item['sha']}", headers=headers, timeout=10)
         if r.status_code != 200:
-            return jsonify({"error": "github request failed", "detail": r.text}), 500
-        page_data = r.json()
-        if not page_data:
+            return item["path"], None
+        return item["path"], r.content.decode("utf-8", errors="ignore")
+
+    with ThreadPoolExecutor(max_workers=SAMPLER_BLOB_CONCURRENCY) as pool:
+        return {path: content for path, content in pool.map(fetch, items) if content is not None}
+
+
+def _truncate_utf8(text: str, max_bytes: int):
+    """text cut to at most max_bytes of UTF-8, never splitting a character."""
+    data = text.encode("utf-8")
+    if len(data) <= max_bytes:
+        return text
+    return data[:max_bytes].decode("utf-8", errors="ignore")
+
+
+def sample_repo_files(access_token, owner, repo_name, byte_budget=SAMPLER_BYTE_BUDGET, per_file_bytes=SAMPLER_PER_FILE_BYTES,
+                      max_files=None, default_branch=None):
+    """
+    Picks the most informative files of a repository within a byte budget.
+    - resolves the default branch (pass default_branch if the caller already has repo metadata)
+    - reads the recursive tree once and uses each blob's `size` to skip huge, vendored and generated files
+    - ranks files (root README, manifests, entry points, other source) and fills byte_budget in rank order
+    - reads the selected files from one tarball snapshot for small repos, otherwise with concurrent blob reads
+    - per_file_bytes and byte_budget count UTF-8 bytes of the returned content
+    Returns {"branch", "tree_sha", "files": [{"path", "content", "size"}], "truncated"}; files is [] on failure.
+    access_token may be None for public repositories.
+    """
+    branch = default_branch or resolve_default_branch(access_token, owner, repo_name)
+    result = {"branch": branch, "tree_sha": None, "files": [], "truncated": False}
+    tree_json = get_repo_tree(access_token, owner, repo_name, branch)
+    if not tree_json:
+        return result
+    result["tree_sha"] = tree_json.get("sha")
+    result["truncated"] = bool(tree_json.get("truncated"))
+
+    blobs = [it for it in tree_json.get("tree", []) if it.get("type") == "blob"]
+    ranked = []
+    for it in blobs:
+        if (it.get("size") or 0) > SAMPLER_MAX_FILE_BYTES or not it.get("size"):
+            continue
+        score = _sampler_score(it.get("path", ""))
+        if score is not None:
+            ranked.append((score, it))
+    # stable on ties: shallower paths first, then alphabetical
+    ranked.sort(key=lambda pair: (-pair[0], pair[1]["path"].count("/"), pair[1]["path"]))
+
+    selected = []
+    remaining = byte_budget
+    for _, it in ranked:
+        if remaining <= 0 or (max_files and len(selected) >= max_files):
             break
-        for repo in page_data:
-            if repo.get("owner", {}).get("login") == user_login or repo.get("fork"):
-                # Get last commit date
-                commits_url = repo.get("commits_url", "").replace("{/sha}", "")
-                last_commit = None
-                if commits_url:
-                    commits_resp = requests.get(commits_url, headers=headers, params={"per_page": 1})
-                    if commits_resp.status_code == 200 and commits_resp.json():
-                        last_commit = commits_resp.json()[0].get("commit", {}).get("author", {}).get("date")
-                repos.append({
-                    "name": repo.get("name"),
-                    "url": repo.get("html_url"),
-                    "private": repo.get("private"),
-                    "last_commit": last_commit
-                })
-        page += 1
+        allot = min(it["size"], per_file_bytes, remaining)
+        selected.append((it, allot))
+        remaining -= allot
+    if not selected:
+        return result
+
+    repo_bytes = sum(it.get("size") or 0 for it in blobs)
+    if repo_bytes <= SAMPLER_TARBALL_MAX_REPO_BYTES:
+        snapshot = load_repo_snapshot(access_token, owner, repo_name, ref=branch, max_files=len(selected),
+                                      max_file_bytes=SAMPLER_MAX_FILE_BYTES, paths=[it["path"] for it, _ in selected])
+        contents = {f["path"]: f["content"] for f in snapshot}
+    else:
+        contents = {}
+    missing = [it for it, _ in selected if it["path"] not in contents]
+    if missing:
+        contents.update(_fetch_blobs(access_token, owner, repo_name, missing))
 
-    return jsonify({"repos": repos})
+    for it, allot in selected:
+        if it["path"] in contents:
+            content = _truncate_utf8(contents[it["path"]], allot)
+            result["files"].append({"path": it["path"], "content": content, "size": it["size"]})
+    return result
 
-@app.route("/api/github/repo/details", methods=["POST"])
-def github_repo_details():
-    import json
-    body = request.get_json() or {}
-    login_id = body.get("loginId")
-    repo_name = body.get("repoName")
-    if not login_id or not repo_name:
-        return jsonify({"error": "loginId and repoName required"}), 400
 
+# -------------------------
+# Technology detection: extension index + one-pass content markers, weighted by bytes
+# -------------------------
+TECH_DETECT_LARGE_REPO_FILES = int(os.getenv("TECH_DETECT_LARGE_REPO_FILES", "2000"))  # above this, skip Gemini
+TECH_DETECT_MIN_SHARE = 0.02  # languages below this share of code bytes are not reported
+TECH_DETECT_MAX_LANGUAGES = 8
+
+TECH_EXTENSIONS = {
+    ".py": "Python", ".pyi": "Python", ".ipynb": "Jupyter Notebook",
+    ".js": "JavaScript", ".mjs": "JavaScript", ".cjs": "JavaScript", ".jsx": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript", ".mts": "TypeScript", ".cts": "TypeScript",
+    ".java": "Java", ".kt": "Kotlin", ".kts": "Kotlin", ".scala": "Scala", ".groovy": "Groovy",
+    ".go": "Go", ".rs": "Rust", ".rb": "Ruby", ".php": "PHP", ".swift": "Swift", ".dart": "Dart",
+    ".c": "C", ".h": "C", ".cpp": "C++", ".cc": "C++", ".cxx": "C++", ".hpp": "C++", ".hh": "C++",
+    ".cs": "C#", ".fs": "F#", ".m": "Objective-C", ".mm": "Objective-C", ".r": "R", ".lua": "Lua",
+    ".ex": "Elixir", ".exs": "Elixir", ".erl": "Erlang", ".hs": "Haskell", ".clj": "Clojure", ".jl": "Julia",
+    ".html": "HTML", ".htm": "HTML", ".css": "CSS", ".scss": "SCSS", ".sass": "SCSS", ".less": "Less",
+    ".vue": "Vue", ".svelte": "Svelte", ".sh": "Shell", ".bash": "Shell", ".zsh": "Shell", ".ps1": "PowerShell",
+    ".sql": "SQL", ".md": "Markdown", ".mdx": "Markdown", ".tf": "HCL",
+}
+# files recognised by name alone: (language or None, framework or None)
+TECH_FILENAMES = {
+    "dockerfile": (None, "Docker"), "docker-compose.yml": (None, "Docker"), "docker-compose.yaml": (None, "Docker"),
+    "jenkinsfile": ("Groovy", "Jenkins"), "makefile": ("Makefile", None), "pubspec.yaml": (None, "Flutter"),
+    "angular.json": (None, "Angular"), "next.config.js": (None, "Next.js"), "nuxt.config.js": (None, "Nuxt"),
+    "manage.py": ("Python", "Django"), "vercel.json": (None, "Vercel"), "serverless.yml": (None, "Serverless"),
+}
+# languages that are documentation/markup only and never headline a repository
+TECH_NON_CODE = {"Markdown"}
+# content markers -> framework; matched in one pass by a single compiled alternation
+TECH_MARKERS = {
+    "React": ["from 'react'", 'from "react"', "import React", '"react":', "require('react')"],
+    "Next.js": ["from 'next/", 'from "next/', '"next":'],
+    "Angular": ["@angular/core"],
+    "Vue": ["from 'vue'", 'from "vue"', '"vue":'],
+    "Svelte": ['"svelte":', "from 'svelte"],
+    "Ionic": ["@ionic/", "ionic-angular"],
+    "Flutter": ["package:flutter/"],
+    "React Native": ["from 'react-native'", 'from "react-native"', '"react-native":'],
+    "Express": ["require('express')", 'require("express")', "from 'express'", '"express":'],
+    "NestJS": ["@nestjs/"],
+    "Tailwind CSS": ['"tailwindcss":', "@tailwind "],
+    "Django": ["from django", "import django", "django=="],
+    "Flask": ["from flask import", "import flask", "flask=="],
+    "FastAPI": ["from fastapi", "fastapi=="],
+    "PyTorch": ["import torch", "torch=="],
+    "TensorFlow": ["import tensorflow", "tensorflow=="],
+    "Spring": ["org.springframework"],
+    "Rails": ["Rails.application", "gem 'rails'", 'gem "rails"'],
+    "Laravel": ["Illuminate\\", '"laravel/framework"'],
+    ".NET": ["using Microsoft.AspNetCore", "using System;"],
+    "Gin": ["github.com/gin-gonic/gin"],
+}
+_TECH_MARKER_OWNER = {m: fw for fw, markers in TECH_MARKERS.items() for m in markers}
+
+
+def _literal_trie_pattern(words):
+    """
+    Regex source matching any of words, factored into a prefix trie. re tries a flat alternation
+    branch by branch at every position; the trie form rejects a position after one character test.
+    Longer words win over their prefixes at the same position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+_TECH_MARKER_RE = re.compile(_literal_trie_pattern(_TECH_MARKER_OWNER))
+# same rule as _sampler_score's SAMPLER_SKIP_DIRS check, as one search per path
+_TECH_SKIP_DIRS_RE = re.compile("(?:^|/)" + _literal_trie_pattern(SAMPLER_SKIP_DIRS))
+
+
+def classify_path(path: str):
+    """Returns (language, framework) for a repository path from its file name or extension alone."""
+    lower = (path or "").lower()
+    base = lower.rsplit("/", 1)[-1]
+    if base in TECH_FILENAMES:
+        return TECH_FILENAMES[base]
+    if base.startswith("dockerfile"):  # Dockerfile.dev, dockerfile.prod, ...
+        return None, "Docker"
+    dot = base.rfind(".")
+    return (TECH_EXTENSIONS.get(base[dot:]) if dot > 0 else None), None
+
+
+def detect_technologies(files=None, tree_items=None):
+    """
+    Byte-weighted technology detection without Gemini.
+    - files: [{"path", "content"}] read from the repo; scanned once each for framework markers
+    - tree_items: git tree entries ({"path", "type", "size"}); when given, language bytes come from the
+      whole tree (sizes only, no content reads) instead of from the sampled files
+    Vendored and generated paths (SAMPLER_SKIP_DIRS / SAMPLER_SKIP_SUFFIXES) are ignored.
+    Returns {"languages": {name: bytes}, "frameworks": {name: bytes}}, each sorted by bytes descending.
+    """
+    languages = {}
+    frameworks = {}
+
+    def skipped(lower):
+        return lower.endswith(SAMPLER_SKIP_SUFFIXES) or _TECH_SKIP_DIRS_RE.search(lower) is not None
+
+    def count(path, size):
+        if skipped(path.lower()):
+            return
+        language, framework = classify_path(path)
+        if language:
+            languages[language] = languages.get(language, 0) + size
+        if framework:
+            frameworks[framework] = frameworks.get(framework, 0) + max(size, 1)
+
+    for it in tree_items or []:
+        if it.get("type") == "blob":
+            count(it.get("path", ""), it.get("size") or 0)
+    for f in files or []:
+        path, content = f.get("path", ""), f.get("content") or ""
+        if tree_items is None:
+            count(path, len(content))
+        if skipped(path.lower()):
+            continue
+        # every framework is credited at most once per file, with the file's full weight
+        for framework in {_TECH_MARKER_OWNER[m] for m in set(_TECH_MARKER_RE.findall(content))}:
+            frameworks[framework] = frameworks.get(framework, 0) + len(content)
+
+    def ranked(counts):
+        return dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+    return {"languages": ranked(languages), "frameworks": ranked(frameworks)}
+
+
+def summarize_technologies(detected):
+    """Turns detect_technologies output into the (languages, frameworks) name lists the routes return."""
+    code = {k: v for k, v in detected["languages"].items() if k not in TECH_NON_CODE}
+    total = sum(code.values()) or 1
+    languages = [k for k, v in code.items() if v / total >= TECH_DETECT_MIN_SHARE][:TECH_DETECT_MAX_LANGUAGES]
+    return languages, list(detected["frameworks"])
+
+
+# -------------------------
+# Gemini response cache (model + normalized prompt hash)
+# -------------------------
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", str(6 * 3600)))  # seconds a stored response lives in MongoDB
+GEMINI_CACHE_LRU_SIZE = int(os.getenv("GEMINI_CACHE_LRU_SIZE", "512"))
+gemini_cache_collection = db["gemini_cache"]
+
+_gemini_lru = BoundedLRU(GEMINI_CACHE_LRU_SIZE)  # key -> {"text", "createdAt": epoch}
+
+
+def _gemini_cache_key(model_name: str, prompt: str) -> str:
+    # indentation and blank-line noise from the f-string templates must not change the key
+    normalized = "\n".join(line.strip() for line in (prompt or "").strip().splitlines())
+    normalized = re.sub(r"\n{3,}", "\n\n", normalized)
+    return hashlib.sha256(f"{model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def _gemini_cache_get(key, max_age):
+    oldest = time.time() - max_age
+    entry = _gemini_lru.get(key)
+    if entry and entry["createdAt"] >= oldest:
+        return entry["text"]
     try:
-        token = get_outbound_token("github", login_id)
-        access_token = token['token']["accessToken"]
+        doc = gemini_cache_collection.find_one({"key": key, "createdAt": {"$gte": oldest}}, {"_id": 0, "text": 1, "createdAt": 1})
     except Exception as e:
-        return jsonify({"error": "failed to retrieve github token", "detail": str(e)}), 500
+        print("gemini cache read failed:", e)
+        return None
+    if doc:
+        _gemini_cache_remember(key, doc["text"], doc["createdAt"])
+        return doc["text"]
+    return None
 
-    headers = {
-        "Authorization": f"token {access_token}",
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "descope-demo-app"
-    }
 
-    user_resp = requests.get("https://api.github.com/user", headers=headers)
-    if user_resp.status_code != 200:
-        return jsonify({"error": "github user request failed", "detail": user_resp.text}), 500
-    user_login = user_resp.json().get("login")
+def _gemini_cache_remember(key, text, created_at):
+    _gemini_lru[key] = {"text": text, "createdAt": created_at}
 
-    repo_resp = requests.get(f"https://api.github.com/repos/{user_login}/{repo_name}", headers=headers)
-    if repo_resp.status_code != 200:
-        return jsonify({"error": "repo fetch failed", "detail": repo_resp.text}), 500
-    repo = repo_resp.json()
-    description = repo.get("description")
-    repo_url = repo.get("html_url")
 
-    # Gather code files for Gemini analysis
-    tree_url = f"https://api.github.com/repos/{user_login}/{repo_name}/git/trees/main?recursive=1"
-    tree_resp = requests.get(tree_url, headers=headers)
-    tree = tree_resp.json().get("tree", []) if tree_resp.status_code == 200 else []
-    code_contents = []
-    for item in tree:
-        if item["type"] == "blob" and (
-            item["path"].endswith(".py") or item["path"].endswith(".js") or item["path"].endswith(".jsx") or item["path"].endswith(".ts") or item["path"].endswith(".tsx") or
-            item["path"].endswith(".java") or item["path"].endswith(".go") or item["path"].endswith(".rb") or item["path"].endswith(".php") or item["path"].endswith(".c") or
-            item["path"].endswith(".cpp") or item["path"].endswith(".cs") or item["path"].endswith(".html") or item["path"].endswith(".css") or item["path"].endswith(".md") or
-            item["path"].endswith(".sh")
-        ):
-            file_url = f"https://api.github.com/repos/{user_login}/{repo_name}/contents/{item['path']}"
-            file_resp = requests.get(file_url, headers=headers)
-            if file_resp.status_code == 200:
-                file_data = file_resp.json()
-                try:
-                    content = base64.b64decode(file_data.get("content", "")).decode("utf-8", errors="ignore")
-                    code_contents.append(f"File: {item['path']}\n{content[:1500]}")
-                except Exception:
-                    continue
-            if len(code_contents) >= 10:
-                break
+def gemini_cache_store(prompt: str, text: str, model_name: str = GEMINI_MODEL):
+    """Store a generated response for prompt (used directly by callers that generate outside gemini_generate_text)."""
+    key = _gemini_cache_key(model_name, prompt)
+    now = time.time()
+    _gemini_cache_remember(key, text, now)
+    try:
+        gemini_cache_collection.update_one(
+            {"key": key},
+            {"$set": {"text": text, "model": model_name, "createdAt": now,
+                      "expireAt": datetime.utcfromtimestamp(now + GEMINI_CACHE_TTL)}},
+            upsert=True
+        )
+    except Exception as e:
+        print("gemini cache write failed:", e)
+
+
+def gemini_cached_text(prompt: str, model_name: str = GEMINI_MODEL, max_age: int = GEMINI_CACHE_TTL):
+    """Returns the cached response for prompt if one younger than max_age seconds exists, else None."""
+    if max_age <= 0:
+        return None
+    return _gemini_cache_get(_gemini_cache_key(model_name, prompt), min(max_age, GEMINI_CACHE_TTL))
+
+
+def gemini_generate_text(prompt: str, model_name: str = GEMINI_MODEL, max_age: int = GEMINI_CACHE_TTL, regenerate: bool = False):
+    """
+    generate_content(prompt).text with a two-tier cache (in-process LRU, then MongoDB with a TTL index).
+    - max_age: per-call freshness in seconds, at most GEMINI_CACHE_TTL; older cached responses are ignored (0 disables reads)
+    - regenerate: skip the cache read (the fresh response still replaces the cached one)
+    Exceptions from the model propagate so callers keep their existing fallbacks.
+    """
+    if not regenerate:
+        cached = gemini_cached_text(prompt, model_name, max_age)
+        if cached is not None:
+            return cached
+    model = genai.GenerativeModel(model_name)
+    response = model.generate_content(prompt)
+    text = response.text or ""
+    if text.strip():
+        gemini_cache_store(prompt, text, model_name)
+    return text
+
+
+def gemini_stream_text(prompt: str, model_name: str = GEMINI_MODEL, max_age: int = GEMINI_CACHE_TTL, regenerate: bool = False):
+    """
+    Streaming counterpart of gemini_generate_text: yields text chunks as the model produces them.
+    A cached response is yielded as one chunk; a completed stream is stored under the same cache key,
+    so a later gemini_generate_text call with the same prompt is a cache hit.
+    """
+    if not regenerate:
+        cached = gemini_cached_text(prompt, model_name, max_age)
+        if cached is not None:
+            yield cached
+            return
+    model = genai.GenerativeModel(model_name)
+    parts = []
+    for chunk in model.generate_content(prompt, stream=True):
+        try:
+            text = chunk.text
+        except ValueError:
+            # chunk without text parts (e.g. only safety/finish metadata)
+            continue
+        if text:
+            parts.append(text)
+            yield text
+    text = "".join(parts)
+    if text.strip():
+        gemini_cache_store(prompt, text, model_name)
+
+
+def stream_gemini_generation(prepare, regenerate: bool = False):
+    """
+    Event generator for the streaming variants of the long generation endpoints.
+    prepare() -> (prompt, finish) runs after the first event is sent, so slow inputs (repo sampling, commit
+    loading) don't hold back the first byte; finish(text_or_None) -> dict builds the final payload exactly
+    like the non-streaming endpoint (including its fallback when generation fails).
+    Events: {"stage": "preparing"}, {"stage": "generating"}, {"delta": str}..., then {"done": true, **payload}.
+    """
+    yield {"stage": "preparing"}
+    try:
+        prompt, finish = prepare()
+    except Exception as e:
+        yield {"error": "prepare_failed", "detail": str(e)}
+        return
+    yield {"stage": "generating"}
+    parts = []
+    try:
+        for chunk in gemini_stream_text(prompt, regenerate=regenerate):
+            parts.append(chunk)
+            yield {"delta": chunk}
+    except Exception as e:
+        print("gemini stream error:", e)
+        parts = []
+    yield {"done": True, **finish("".join(parts) or None)}
+
+
+def event_stream_response(events):
+    """
+    Serializes an iterable of dict events: NDJSON by default (like /api/github/minimal?stream), or SSE
+    "data:" frames when the client sends Accept: text/event-stream.
+    """
+    sse = "text/event-stream" in (request.headers.get("Accept") or "")
+
+    def body():
+        for event in events:
+            line = json.dumps(event)
+            yield f"data: {line}\n\n" if sse else line + "\n"
+
+    resp = Response(stream_with_context(body()), mimetype="text/event-stream" if sse else "application/x-ndjson")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # keep reverse proxies from buffering the stream
+    return resp
+
+
+# -------------------------
+# Token-budgeted prompt assembly
+# -------------------------
+# Variable prompt content (file samples, commit lists, ...) is fitted into a per-route token budget.
+# Tokens are estimated locally (~4 chars/token); set PROMPT_COUNT_TOKENS=true to log exact counts from
+# the model's count_tokens endpoint instead (costs one extra round trip per prompt).
+PROMPT_SECTION_BUDGETS = {
+    "repo_details": 5000,
+    "description_suggest": 3000,
+    "readme_suggest": 6000,
+    "feature_ideas": 6000,
+    "release_notes": 5000,
+    "project_document": 1500,
+}
+PROMPT_DEFAULT_BUDGET = 4000
+PROMPT_CHARS_PER_TOKEN = 4
+PROMPT_COUNT_TOKENS = os.getenv("PROMPT_COUNT_TOKENS", "false").lower() in ("1", "true", "yes")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + PROMPT_CHARS_PER_TOKEN - 1) // PROMPT_CHARS_PER_TOKEN
+
+
+def count_prompt_tokens(prompt: str, model_name: str = GEMINI_MODEL) -> int:
+    if PROMPT_COUNT_TOKENS:
+        try:
+            return genai.GenerativeModel(model_name).count_tokens(prompt).total_tokens
+        except Exception as e:
+            print("count_tokens failed, using estimate:", e)
+    return estimate_tokens(prompt)
+
+
+def fit_prompt_sections(route: str, sections: list, budget: int = None):
+    """
+    Fits prompt sections into the route's token budget and returns {name: text}.
+    Each section is {"name", "items": [str, ...], "priority": int (lower first, default 0),
+    "max_tokens": optional cap, "separator": default "\n\n"}.
+    Sections are filled in priority order, whole items first; the first item that does not fit is
+    truncated to the remaining space and the section stops there. Lower-priority sections get what is left.
+    """
+    budget = budget or PROMPT_SECTION_BUDGETS.get(route, PROMPT_DEFAULT_BUDGET)
+    remaining = budget
+    fitted = {}
+    report = []
+    for sec in sorted(sections, key=lambda x: x.get("priority", 0)):
+        sep = sec.get("separator", "\n\n")
+        allowance = min(remaining, sec.get("max_tokens") or remaining)
+        used = 0
+        kept = []
+        for item in sec.get("items") or []:
+            cost = estimate_tokens(item) + (estimate_tokens(sep) if kept else 0)
+            if used + cost <= allowance:
+                kept.append(item)
+                used += cost
+                continue
+            room = allowance - used - (estimate_tokens(sep) if kept else 0)
+            if room > 20:  # a few tokens of a file is noise, not context
+                kept.append(item[:room * PROMPT_CHARS_PER_TOKEN])
+                used += room
+            break
+        remaining -= used
+        fitted[sec["name"]] = sep.join(kept)
+        report.append(f"{sec['name']}={used}t ({len(kept)}/{len(sec.get('items') or [])} items)")
+    print(f"prompt[{route}] sections {budget - remaining}/{budget} tokens: {', '.join(report)}")
+    return fitted
+
+
+def log_prompt_tokens(route: str, prompt: str):
+    """Logs the size of the final prompt so budgets can be tuned from real traffic."""
+    print(f"prompt[{route}] total ~{count_prompt_tokens(prompt)} tokens")
+
+
+# -------------------------
+# Repo analysis cache, keyed by (owner, repo, tree_sha)
+# -------------------------
+# A tree SHA identifies the exact repository contents, so analysis stored under it never goes stale;
+# a push produces a new tree SHA and therefore a cache miss.
+REPO_ANALYSIS_LRU_SIZE = int(os.getenv("REPO_ANALYSIS_LRU_SIZE", "256"))
+repo_analysis_collection = db["repo_analysis"]
+
+_repo_analysis_lru = BoundedLRU(REPO_ANALYSIS_LRU_SIZE)  # (owner, repo, tree_sha) -> analysis dict
+
+
+def get_repo_analysis(owner, repo_name, tree_sha):
+    """
+    Returns the stored analysis {languages, frameworks, sampledFiles, summaries} for this exact tree,
+    or None. Checks the in-process LRU first, then MongoDB.
+    """
+    if not tree_sha:
+        return None
+    key = (owner, repo_name, tree_sha)
+    doc = _repo_analysis_lru.get(key)
+    if doc is not None:
+        return doc
+    try:
+        doc = repo_analysis_collection.find_one({"owner": owner, "repo": repo_name, "treeSha": tree_sha}, {"_id": 0})
+    except Exception as e:
+        print("repo analysis cache read failed:", e)
+        return None
+    if doc:
+        _repo_analysis_lru[key] = doc
+    return doc
+
+
+def save_repo_analysis(owner, repo_name, tree_sha, languages=None, frameworks=None, sampled_files=None, summaries=None):
+    """Merge analysis results for a tree into the cache. summaries is a dict, e.g. {"description": "..."}."""
+    if not tree_sha:
+        return
+    key = (owner, repo_name, tree_sha)
+    fields = {}
+    if languages is not None:
+        fields["languages"] = languages
+    if frameworks is not None:
+        fields["frameworks"] = frameworks
+    if sampled_files is not None:
+        fields["sampledFiles"] = sampled_files
+    for name, text in (summaries or {}).items():
+        fields[f"summaries.{name}"] = text
+
+    # start from the full stored document so the LRU copy never shadows fields only MongoDB has
+    doc = dict(get_repo_analysis(owner, repo_name, tree_sha) or {"owner": owner, "repo": repo_name, "treeSha": tree_sha})
+    for field, value in fields.items():
+        if field.startswith("summaries."):
+            doc["summaries"] = {**(doc.get("summaries") or {}), field.split(".", 1)[1]: value}
+        else:
+            doc[field] = value
+    _repo_analysis_lru[key] = doc
+    try:
+        repo_analysis_collection.update_one(
+            {"owner": owner, "repo": repo_name, "treeSha": tree_sha},
+            {"$set": {**fields, "updatedAt": datetime.utcnow()}, "$setOnInsert": {"createdAt": datetime.utcnow()}},
+            upsert=True
+        )
+    except Exception as e:
+        print("repo analysis cache write failed:", e)
+
 
-    # Use Gemini to get frameworks and languages
+# -------------------------
+# Repo details service (used by /api/github/repo/details and, in-process, by the LinkedIn/Docs/release-notes flows)
+# -------------------------
+def _detect_repo_technologies(code_contents):
+    """Ask Gemini for the main languages/frameworks of the sampled files. Returns (languages, frameworks)."""
+    files_text = fit_prompt_sections("repo_details", [{"name": "files", "items": code_contents, "separator": "\n"}])["files"]
     prompt = f"""
     You are an expert software engineer. Given the following code files from a GitHub repository, analyze and list the main programming languages and frameworks used in this project. Return your answer as a JSON object with keys 'languages' and 'frameworks', each mapping to an array of strings. Only include the most relevant ones.
 
-    {chr(10).join(code_contents)}
+    {files_text}
 
     JSON:
     """
+    log_prompt_tokens("repo_details", prompt)
     languages = []
     frameworks = []
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        print(f"Gemini response: {response.text.strip()}")
+        response_text = gemini_generate_text(prompt).strip()
+        print(f"Gemini response: {response_text}")
         # Extract JSON from Gemini response robustly
-        response_text = response.text.strip()
         # Find the first '{' and last '}' to extract JSON block
         start = response_text.find('{')
         end = response_text.rfind('}')
@@ -304,13 +1639,26 @@ def github_repo_details():
         print("Gemini extraction error:", e)
         languages = []
         frameworks = []
+    return languages, frameworks
+
+
+def _commit_summary(c):
+    commit = c.get("commit", {})
+    return {
+        "sha": c.get("sha"),
+        "date": commit.get("author", {}).get("date"),
+        "message": commit.get("message"),
+        "author": c.get("author", {}).get("login") if c.get("author") else commit.get("author", {}).get("name")
+    }
 
-    # Get all commits (pagination)
+
+def _fetch_repo_commits(headers, owner, repo_name):
+    """Get all commits (pagination) as [{sha, date, message, author}], most recent first."""
     commits = []
     page = 1
     while True:
-        commits_resp = requests.get(
-            f"https://api.github.com/repos/{user_login}/{repo_name}/commits",
+        commits_resp = http_get(
+            f"https://api.github.com/repos/{owner}/{repo_name}/commits",
             headers=headers,
             params={"per_page": 100, "page": page}
         )
@@ -320,22 +1668,300 @@ def github_repo_details():
         if not page_data:
             break
         for c in page_data:
-            commit = c.get("commit", {})
-            date = commit.get("author", {}).get("date")
-            message = commit.get("message")
-            commits.append({"date": date, "message": message})
+            commits.append(_commit_summary(c))
         page += 1
+    return commits
 
-    return jsonify({
+
+# -------------------------
+# Incremental commit-history store
+# -------------------------
+# Commits are persisted per repo in repo_commits; repo_commit_sync remembers the newest stored commit
+# and the ETag of the last "since <newest>" listing, so an unchanged repo costs one 304 response.
+# A history rewrite (force-push) is detected with a compare call and triggers a full relisting that
+# prunes the commits no longer reachable from the default branch. Only the request holding a repo's sync claim
+# writes, so two syncs never interleave their writes and prunes. Reads return a window (newest first) and a cursor.
+REPO_COMMITS_SYNC_INTERVAL = int(os.getenv("REPO_COMMITS_SYNC_INTERVAL", "30"))  # seconds between syncs of one repo
+REPO_COMMITS_SYNC_CLAIM_TTL = int(os.getenv("REPO_COMMITS_SYNC_CLAIM_TTL", "300"))  # a crashed sync frees its claim after this
+REPO_COMMITS_WINDOW = int(os.getenv("REPO_COMMITS_WINDOW", "500"))  # commits per read unless the caller asks for another size
+REPO_COMMITS_MAX_WINDOW = int(os.getenv("REPO_COMMITS_MAX_WINDOW", "5000"))
+REPO_COMMITS_PAGE_CONCURRENCY = int(os.getenv("REPO_COMMITS_PAGE_CONCURRENCY", "4"))
+repo_commits_collection = db["repo_commits"]
+repo_commit_sync_collection = db["repo_commit_sync"]
+
+
+def _fetch_commit_pages(headers, owner, repo_name, params, etag=None):
+    """
+    Lists commits with the given params. Page 1 is fetched first (conditionally when etag is given),
+    remaining pages from its Link header are fetched concurrently.
+    Returns (status_code, etag, [commit summaries]); status 304 means nothing changed.
+    """
+    url = f"https://api.github.com/repos/{owner}/{repo_name}/commits"
+    first_headers = {**headers, "If-None-Match": etag} if etag else headers
+    first = http_get(url, headers=first_headers, params={**params, "per_page": 100, "page": 1}, timeout=15)
+    if first.status_code == 304:
+        return 304, etag, []
+    if first.status_code != 200:
+        raise Exception(f"GitHub commits request failed: {first.status_code} {first.text}")
+    commits = [_commit_summary(c) for c in first.json()]
+
+    last_url = first.links.get("last", {}).get("url")
+    if last_url:
+        last_page = int(parse_qs(urlparse(last_url).query).get("page", ["1"])[0])
+
+        def fetch_page(page):
+            r = http_get(url, headers=headers, params={**params, "per_page": 100, "page": page}, timeout=15)
+            if r.status_code != 200:
+                raise Exception(f"GitHub commits request failed: {r.status_code} {r.text}")
+            return [_commit_summary(c) for c in r.json()]
+
+        with ThreadPoolExecutor(max_workers=REPO_COMMITS_PAGE_CONCURRENCY) as pool:
+            for page_commits in pool.map(fetch_page, range(2, last_page + 1)):
+                commits.extend(page_commits)
+    return 200, first.headers.get("ETag"), commits
+
+
+def _commits_fast_forward(headers, owner, repo_name, old_sha, new_sha):
+    """True when new_sha still contains old_sha (compare status ahead/identical); False when it was rewritten."""
+    r = http_get(f"https://api.github.com/repos/{owner}/{repo_name}/compare/{old_sha}...{new_sha}",
+                 headers=headers, params={"per_page": 1}, timeout=15)
+    if r.status_code == 404:
+        return False  # old head no longer exists
+    if r.status_code != 200:
+        raise Exception(f"GitHub compare request failed: {r.status_code} {r.text}")
+    return r.json().get("status") in ("ahead", "identical")
+
+
+def _claim_repo_commit_sync(key):
+    """
+    Takes the repo's sync claim with a conditional update on its sync state. Returns (claim id, state) or
+    (None, None) while another request holds an unexpired claim.
+    """
+    now = datetime.utcnow()
+    try:
+        repo_commit_sync_collection.update_one(key, {"$setOnInsert": key}, upsert=True)
+    except pymongo.errors.DuplicateKeyError:
+        pass  # a concurrent first sync created it
+    claim = uuid.uuid4().hex
+    state = repo_commit_sync_collection.find_one_and_update(
+        {**key, "$or": [{"claimedUntil": {"$exists": False}}, {"claimedUntil": None}, {"claimedUntil": {"$lt": now}}]},
+        {"$set": {"claim": claim, "claimedUntil": now + timedelta(seconds=REPO_COMMITS_SYNC_CLAIM_TTL)}},
+        projection={"_id": 0},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    return (claim, state) if state else (None, None)
+
+
+def sync_repo_commits(headers, owner, repo_name, force=False):
+    """
+    Brings the stored history of owner/repo up to date and returns the number of commits written.
+    The first sync stores the full history; later syncs only list commits since the newest stored one.
+    When the stored head is no longer an ancestor of the branch (force-push), the full history is listed
+    again and stored commits that are not part of it are deleted.
+    While another request holds the repo's sync claim this returns 0 without syncing, unless the repo was never
+    synced, in which case it raises so the caller does not read a half-written history.
+    """
+    key = {"owner": owner, "repo": repo_name}
+    state = repo_commit_sync_collection.find_one(key, {"_id": 0}) or {}
+    if not force and state.get("syncedAt") and (datetime.utcnow() - state["syncedAt"]).total_seconds() < REPO_COMMITS_SYNC_INTERVAL:
+        return 0
+    claim, claimed_state = _claim_repo_commit_sync(key)
+    if not claim:
+        if not state.get("syncedAt"):
+            raise Exception(f"first commit sync of {owner}/{repo_name} is still running")
+        return 0
+    state = claimed_state
+    release = {"claim": None, "claimedUntil": None}
+    if not force and state.get("syncedAt") and (datetime.utcnow() - state["syncedAt"]).total_seconds() < REPO_COMMITS_SYNC_INTERVAL:
+        # another request finished a sync between our read and the claim
+        repo_commit_sync_collection.update_one({**key, "claim": claim}, {"$set": release})
+        return 0
+    try:
+        return _sync_repo_commits_claimed(headers, owner, repo_name, key, claim, state)
+    except Exception:
+        repo_commit_sync_collection.update_one({**key, "claim": claim}, {"$set": release})
+        raise
+
+
+def _sync_repo_commits_claimed(headers, owner, repo_name, key, claim, state):
+    """The body of sync_repo_commits, run while holding the claim; the final state write also releases it."""
+    head_date = state.get("headDate")
+    params = {"since": head_date} if head_date else {}
+    # the stored ETag belongs to the listing "since headDate"; only reuse it for that exact query
+    etag = state.get("etag") if head_date and state.get("etagSince") == head_date else None
+    status, new_etag, commits = _fetch_commit_pages(headers, owner, repo_name, params, etag=etag)
+
+    full = not head_date
+    if status == 200 and head_date and state.get("headSha"):
+        # the listing starts at the branch head; an empty one means the branch moved behind the stored head
+        if not commits or not _commits_fast_forward(headers, owner, repo_name, state["headSha"], commits[0]["sha"]):
+            print(f"history of {owner}/{repo_name} was rewritten, relisting")
+            status, new_etag, commits = _fetch_commit_pages(headers, owner, repo_name, {})
+            full, head_date = True, None
+
+    update = {"syncedAt": datetime.utcnow(), "claim": None, "claimedUntil": None}
+    if status == 200:
+        # a full listing tags every commit with its generation, so unreachable leftovers can be pruned
+        generation = uuid.uuid4().hex if full else None
+        if commits:
+            tag = {"syncGen": generation} if generation else {}
+            repo_commits_collection.bulk_write([
+                pymongo.UpdateOne({**key, "sha": c["sha"]}, {"$set": {**key, **c, **tag}}, upsert=True)
+                for c in commits if c.get("sha")
+            ], ordered=False)
+        if generation and state.get("syncedAt"):
+            repo_commits_collection.delete_many({**key, "syncGen": {"$ne": generation}})
+        if commits:
+            newest = max(commits, key=lambda c: c.get("date") or "")
+            if newest.get("date") and newest["date"] != head_date:
+                update.update({"headSha": newest.get("sha"), "headDate": newest["date"], "etag": None, "etagSince": None})
+            else:
+                update.update({"etag": new_etag, "etagSince": head_date})
+        else:
+            update.update({"etag": new_etag, "etagSince": head_date})
+    repo_commit_sync_collection.update_one({**key, "claim": claim}, {"$set": update})
+    return len(commits)
+
+
+def read_repo_commits(owner, repo_name, limit=REPO_COMMITS_WINDOW, cursor=None):
+    """
+    Returns (commits, next_cursor) from the store, most recent first: a window of limit commits (limit=None
+    reads the whole history). cursor is the opaque value returned by the previous call ("<date>|<sha>"); next_cursor is
+    None at the end of history.
+    """
+    query = {"owner": owner, "repo": repo_name}
+    if cursor and "|" in cursor:
+        c_date, c_sha = cursor.split("|", 1)
+        query["$or"] = [{"date": {"$lt": c_date}}, {"date": c_date, "sha": {"$lt": c_sha}}]
+    found = (repo_commits_collection.find(query, {"_id": 0, "sha": 1, "date": 1, "message": 1, "author": 1})
+             .sort([("date", -1), ("sha", -1)]))
+    if limit:
+        found = found.limit(limit + 1)
+    docs = list(found)
+    next_cursor = None
+    if limit and len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = f"{docs[-1].get('date')}|{docs[-1].get('sha')}"
+    return docs, next_cursor
+
+
+def load_repo_commits(headers, owner, repo_name, limit=REPO_COMMITS_WINDOW, cursor=None):
+    """
+    Sync-then-read wrapper used by routes. Returns (commits, next_cursor); if the store is unavailable
+    the history is listed live from GitHub instead (no cursor).
+    """
+    try:
+        if not cursor:
+            sync_repo_commits(headers, owner, repo_name)
+        return read_repo_commits(owner, repo_name, limit=limit, cursor=cursor)
+    except Exception as e:
+        print("commit store unavailable, listing live:", e)
+        commits = _fetch_repo_commits(headers, owner, repo_name)
+        return (commits[:limit] if limit else commits), None
+
+
+def build_repo_details(login_id, repo_name, commits_limit=REPO_COMMITS_WINDOW, commits_cursor=None):
+    """
+    Collects repo metadata, language/framework analysis (Gemini, or detect_technologies on large repos) and a
+    window of the commit history: commits_limit commits, newest first, starting after commits_cursor; the
+    payload carries the cursor of the next window (None at the end of history).
+    Returns (status_code, payload) where payload is the details dict on 200 and {"error", "detail"} otherwise.
+    """
+    if not login_id or not repo_name:
+        return 400, {"error": "loginId and repoName required"}
+
+    try:
+        token = get_outbound_token("github", login_id)
+        access_token = token['token']["accessToken"]
+    except Exception as e:
+        return 500, {"error": "failed to retrieve github token", "detail": str(e)}
+
+    headers = {
+        "Authorization": f"token {access_token}",
+        "Accept": "application/vnd.github+json",
+        "User-Agent": "descope-demo-app"
+    }
+
+    try:
+        user_login = get_github_login(access_token, login_id)
+    except Exception as e:
+        return 500, {"error": "github user request failed", "detail": str(e)}
+
+    repo_resp = http_get(f"https://api.github.com/repos/{user_login}/{repo_name}", headers=headers)
+    if repo_resp.status_code != 200:
+        return 500, {"error": "repo fetch failed", "detail": repo_resp.text}
+    repo = repo_resp.json()
+
+    # Reuse the language/framework analysis when the tree has not changed since it was computed
+    branch = repo.get("default_branch") or "main"
+    tree_sha = get_repo_tree_sha(access_token, user_login, repo_name, branch)
+    analysis = get_repo_analysis(user_login, repo_name, tree_sha) or {}
+    if "languages" in analysis and "frameworks" in analysis:
+        languages, frameworks = analysis["languages"], analysis["frameworks"]
+    else:
+        # only a miss reads the recursive tree (shared with the sampler through the per-request memo)
+        tree_json = get_repo_tree(access_token, user_login, repo_name, branch) or {}
+        sample = sample_repo_files(access_token, user_login, repo_name, default_branch=branch)
+        tree_items = tree_json.get("tree") or []
+        detected = detect_technologies(sample["files"], tree_items=tree_items or None)
+        blob_count = sum(1 for it in tree_items if it.get("type") == "blob")
+        if blob_count >= TECH_DETECT_LARGE_REPO_FILES or tree_json.get("truncated"):
+            # the sample covers a tiny fraction of a large repo; the byte-weighted index over the whole tree is better
+            languages, frameworks = summarize_technologies(detected)
+        else:
+            # Use Gemini to get frameworks and languages, falling back to the index if it returns nothing
+            code_contents = [f"File: {f['path']}\n{f['content']}" for f in sample["files"]]
+            languages, frameworks = _detect_repo_technologies(code_contents)
+            if not languages and not frameworks:
+                languages, frameworks = summarize_technologies(detected)
+        if languages or frameworks:
+            save_repo_analysis(user_login, repo_name, sample["tree_sha"], languages=languages, frameworks=frameworks,
+                               sampled_files=[f["path"] for f in sample["files"]])
+
+    commits, next_cursor = load_repo_commits(headers, user_login, repo_name, limit=commits_limit, cursor=commits_cursor)
+
+    return 200, {
         "name": repo_name,
-        "url": repo_url,
-        "description": description,
+        "url": repo.get("html_url"),
+        "description": repo.get("description"),
         "languages": languages,
         "frameworks": frameworks,
-        "commits": commits
-    })
+        "commits": commits,
+        "commitsCursor": next_cursor
+    }
+
+
+def get_repo_details(login_id, repo_name, commits_limit=REPO_COMMITS_WINDOW, commits_cursor=None):
+    """
+    In-process entry point for repo details. Results are memoized for the current request so flows
+    that need details more than once (e.g. doc + release notes) only build them once.
+    Returns (status_code, payload) like build_repo_details.
+    """
+    if not has_request_context():
+        return build_repo_details(login_id, repo_name, commits_limit, commits_cursor)
+    memo = g.setdefault("repo_details", {})
+    key = (login_id, repo_name, commits_limit, commits_cursor)
+    if key not in memo:
+        memo[key] = build_repo_details(login_id, repo_name, commits_limit, commits_cursor)
+    return memo[key]
 
-def gemini_make_youtube_queries(languages, frameworks, repo_name=None, repo_description=None, top_k=6):
+
+@app.route("/api/github/repo/details", methods=["POST"])
+def github_repo_details():
+    """
+    POST { loginId, repoName, commitsLimit?, commitsCursor? }
+    commits holds the newest commitsLimit commits (default REPO_COMMITS_WINDOW, at most REPO_COMMITS_MAX_WINDOW)
+    after commitsCursor; pass the returned commitsCursor to read the next window (null at the end of history).
+    """
+    body = request.get_json() or {}
+    try:
+        commits_limit = min(max(1, int(body.get("commitsLimit") or REPO_COMMITS_WINDOW)), REPO_COMMITS_MAX_WINDOW)
+    except (TypeError, ValueError):
+        return jsonify({"error": "commitsLimit must be an integer"}), 400
+    status, payload = get_repo_details(body.get("loginId"), body.get("repoName"), commits_limit, body.get("commitsCursor"))
+    return jsonify(payload), status
+
+def gemini_make_youtube_queries(languages, frameworks, repo_name=None, repo_description=None, top_k=6, regenerate=False):
     prompt = f"""
     You are an expert learning curator and software engineering teacher. The user has a GitHub repository. The most important languages are: {languages}. The main frameworks are: {frameworks}. The repository name is: {repo_name or 'unknown'}. Repo description: {repo_description or 'none'}.
 
@@ -347,9 +1973,7 @@ def gemini_make_youtube_queries(languages, frameworks, repo_name=None, repo_desc
 
     Return only valid JSON.
     """
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    resp = model.generate_content(prompt)
-    text = resp.text.strip()
+    text = gemini_generate_text(prompt, regenerate=regenerate).strip()
     print(f"Gemini YouTube queries response: {text}")
     # robust JSON extraction
     start = text.find('{')
@@ -370,11 +1994,121 @@ def gemini_make_youtube_queries(languages, frameworks, repo_name=None, repo_desc
 
 
 # Helper: search YouTube (server API key)
+# -------------------------
+# YouTube Data API quota accounting
+# -------------------------
+# Units spent per Pacific-time day (when Google resets the quota) are tracked in MongoDB so concurrent
+# users share one view of the project's budget. Accounting fails open if MongoDB is unreachable.
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+YOUTUBE_QUOTA_WARN_RATIO = float(os.getenv("YOUTUBE_QUOTA_WARN_RATIO", "0.8"))
+YOUTUBE_QUOTA_COSTS = {
+    "search.list": 100,
+    "playlists.insert": 50,
+    "playlistItems.insert": 50,
+    "playlistItems.update": 50,
+    "playlistItems.list": 1,
+}
+youtube_quota_collection = db["youtube_quota"]
+
+
+def youtube_quota_day():
+    return datetime.now(ZoneInfo("America/Los_Angeles")).strftime("%Y-%m-%d")
+
+
+def _youtube_quota_warn(used, day):
+    if used >= YOUTUBE_DAILY_QUOTA * YOUTUBE_QUOTA_WARN_RATIO:
+        print(f"warning: YouTube quota {used}/{YOUTUBE_DAILY_QUOTA} units used for {day}")
+
+
+def youtube_quota_status(day=None):
+    day = day or youtube_quota_day()
+    try:
+        doc = youtube_quota_collection.find_one({"_id": day}, {"units": 1}) or {}
+    except Exception as e:
+        print("youtube quota read failed:", e)
+        doc = {}
+    used = doc.get("units", 0)
+    return {"day": day, "used": used, "limit": YOUTUBE_DAILY_QUOTA, "remaining": max(0, YOUTUBE_DAILY_QUOTA - used)}
+
+
+def youtube_quota_reserve(units: int, day=None):
+    """
+    Atomically reserves units from the day's budget before a multi-call operation.
+    Returns False when the reservation would exceed YOUTUBE_DAILY_QUOTA.
+    """
+    day = day or youtube_quota_day()
+    try:
+        youtube_quota_collection.update_one(
+            {"_id": day},
+            {"$setOnInsert": {"units": 0, "expireAt": datetime.utcnow() + timedelta(days=3)}},
+            upsert=True
+        )
+        doc = youtube_quota_collection.find_one_and_update(
+            {"_id": day, "units": {"$lte": YOUTUBE_DAILY_QUOTA - units}},
+            {"$inc": {"units": units}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+    except Exception as e:
+        print("youtube quota reserve failed:", e)
+        return True
+    if doc is None:
+        print(f"warning: YouTube quota reservation of {units} units refused for {day}")
+        return False
+    _youtube_quota_warn(doc["units"], day)
+    return True
+
+
+def youtube_quota_charge(units: int, day=None):
+    """Records units spent without a reservation; negative units release the unused part of one."""
+    if not units:
+        return
+    day = day or youtube_quota_day()
+    try:
+        doc = youtube_quota_collection.find_one_and_update(
+            {"_id": day},
+            {"$inc": {"units": units}, "$setOnInsert": {"expireAt": datetime.utcnow() + timedelta(days=3)}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if units > 0 and doc:
+            _youtube_quota_warn(doc["units"], day)
+    except Exception as e:
+        print("youtube quota charge failed:", e)
+
+
+YOUTUBE_SEARCH_CACHE_TTL = int(os.getenv("YOUTUBE_SEARCH_CACHE_TTL", str(6 * 3600)))  # seconds results are reused
+YOUTUBE_SEARCH_CACHE_SIZE = int(os.getenv("YOUTUBE_SEARCH_CACHE_SIZE", "512"))
+_youtube_search_cache = BoundedLRU(YOUTUBE_SEARCH_CACHE_SIZE)  # (query, max_results) -> {"videos": [...], "expiresAt": epoch}
+
+
+def _youtube_search_key(query, max_results):
+    return (' '.join((query or '').lower().split()), max_results)
+
+
+def _youtube_search_cached(query, max_results):
+    entry = _youtube_search_cache.get(_youtube_search_key(query, max_results))
+    if entry and entry["expiresAt"] > time.time():
+        return entry["videos"]
+    return None
+
+
 def youtube_search(query, max_results=5):
+    cached = _youtube_search_cached(query, max_results)
+    if cached is not None:
+        return cached
+    cost = YOUTUBE_QUOTA_COSTS["search.list"]
+    if not youtube_quota_reserve(cost):
+        return []
     q = quote_plus(query)
     url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&type=video&maxResults={max_results}&q={q}&key={YOUTUBE_API_KEY}"
-    r = requests.get(url)
+    try:
+        r = http_get(url)
+    except Exception:
+        youtube_quota_charge(-cost)
+        raise
     if r.status_code != 200:
+        # the reservation is given back so failed searches do not eat into the shared daily budget
+        youtube_quota_charge(-cost)
         return []
     data = r.json()
     videos = []
@@ -390,8 +2124,58 @@ def youtube_search(query, max_results=5):
         'url': f"https://youtube.com/watch?v={vid}"
         })
     print(videos)
+    _youtube_search_cache[_youtube_search_key(query, max_results)] = {
+        "videos": videos, "expiresAt": time.time() + YOUTUBE_SEARCH_CACHE_TTL}
     return videos
 
+YOUTUBE_SEARCH_CONCURRENCY = int(os.getenv("YOUTUBE_SEARCH_CONCURRENCY", "4"))
+YOUTUBE_SUGGESTION_TARGET = 12
+
+
+def youtube_search_many(queries, max_results=6, target=YOUTUBE_SUGGESTION_TARGET):
+    """
+    Runs youtube_search for every query on a bounded thread pool, dedupes by videoId as results
+    arrive and cancels the searches that have not started once `target` videos are collected.
+    Returned videos are ordered by query position, then by rank within the query.
+    Cached queries cost nothing, so the quota is only read when some query has to hit the API.
+    """
+    if not queries:
+        return []
+    misses = [q for q in queries if _youtube_search_cached(q, max_results) is None]
+    if misses:
+        # each search costs 100 units; only run as many as the remaining daily budget allows
+        affordable = youtube_quota_status()["remaining"] // YOUTUBE_QUOTA_COSTS["search.list"]
+        if affordable < len(misses):
+            print(f"warning: YouTube quota low, running {affordable} of {len(misses)} searches")
+            skipped = set(misses[affordable:])
+            queries = [q for q in queries if q not in skipped]
+            if not queries:
+                return []
+    pool = ThreadPoolExecutor(max_workers=min(YOUTUBE_SEARCH_CONCURRENCY, len(queries)))
+    futures = {pool.submit(youtube_search, q, max_results): idx for idx, q in enumerate(queries)}
+    seen = set()
+    picked = []  # (query index, rank, video)
+    try:
+        for fut in as_completed(futures):
+            try:
+                vids = fut.result()
+            except Exception as e:
+                print("youtube search failed:", e)
+                continue
+            for rank, v in enumerate(vids):
+                if not v.get('videoId') or v['videoId'] in seen:
+                    continue
+                seen.add(v['videoId'])
+                picked.append((futures[fut], rank, v))
+            if len(picked) >= target:
+                break
+    finally:
+        # stop waiting: queued searches are dropped and in-flight ones are abandoned with this request
+        pool.shutdown(wait=False, cancel_futures=True)
+    picked.sort(key=lambda t: (t[0], t[1]))
+    return [v for _, _, v in picked[:target]]
+
+
 @app.route('/api/youtube/suggestions', methods=['POST'])
 def youtube_suggestions():
     body = request.get_json() or {}
@@ -403,32 +2187,200 @@ def youtube_suggestions():
 
 
     try:
-        queries, playlist_plan = gemini_make_youtube_queries(languages, frameworks, repo_name, repo_description)
+        queries, playlist_plan = gemini_make_youtube_queries(languages, frameworks, repo_name, repo_description,
+                                                             regenerate=bool(body.get('regenerate')))
     except Exception as e:
         queries, playlist_plan = [], {}
 
 
-    # For each query, run a server-side YouTube search and dedupe results
-    all_videos = []
-    seen = set()
-    for q in queries:
-        vids = youtube_search(q, max_results=6)
-        for v in vids:
-            if v['videoId'] in seen:
-                continue
-            seen.add(v['videoId'])
-            all_videos.append(v)
-            if len(all_videos) >= 12:
-                break
+    # Run the server-side YouTube searches in parallel and dedupe results
+    all_videos = youtube_search_many(queries, max_results=6, target=YOUTUBE_SUGGESTION_TARGET)
 
 
     # return top N videos and playlist plan
     return jsonify({
     'queries': queries,
     'playlist_plan': playlist_plan,
-    'videos': all_videos[:12]
+    'videos': all_videos[:YOUTUBE_SUGGESTION_TARGET]
     })
 
+# -------------------------
+# Playlist insertion engine
+# -------------------------
+# The Data API has no batch endpoint for playlistItems, so items are inserted on a small pool. Concurrent
+# appends can land out of order; a fix-up pass moves only the misplaced items afterwards.
+YOUTUBE_INSERT_CONCURRENCY = int(os.getenv("YOUTUBE_INSERT_CONCURRENCY", "4"))
+YOUTUBE_INSERT_RETRIES = int(os.getenv("YOUTUBE_INSERT_RETRIES", "3"))  # retry rounds for failed items
+YOUTUBE_PLAYLIST_MAX_ITEMS = 50
+YOUTUBE_ORDER_FIX_RATIO = 0.25  # share of items expected to land out of order (budgeted as playlistItems.update)
+YOUTUBE_RETRYABLE_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "backendError", "SERVICE_UNAVAILABLE")
+YOUTUBE_PLAYLIST_ITEMS_URL = "https://www.googleapis.com/youtube/v3/playlistItems"
+
+
+def _youtube_insert_item(headers, playlist_id, video_id):
+    """One playlistItems.insert. Returns (item, error, retryable)."""
+    item = {'snippet': {'playlistId': playlist_id, 'resourceId': {'kind': 'youtube#video', 'videoId': video_id}}}
+    try:
+        # retries are done per item by the engine, so every attempt is counted against the quota
+        r = http_post(f"{YOUTUBE_PLAYLIST_ITEMS_URL}?part=snippet", headers=headers, json=item, retries=0)
+    except requests.exceptions.RequestException as e:
+        return None, {"reason": "connection_error", "detail": str(e)}, True
+    if r.status_code in (200, 201):
+        return r.json(), None, False
+    reason = _google_error_reason(r)
+    # 409: concurrent writes to the same playlist conflicted; nothing was inserted
+    retryable = r.status_code in (409, 429) or r.status_code >= 500 or reason in YOUTUBE_RETRYABLE_REASONS
+    return None, {"status": r.status_code, "reason": reason}, retryable
+
+
+def _longest_increasing_run(seq):
+    """Indexes (into seq) of one longest strictly increasing subsequence, O(n log n)."""
+    tails, tail_idx, prev = [], [], [None] * len(seq)
+    for i, x in enumerate(seq):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < x:
+                lo = mid + 1
+            else:
+                hi = mid
+        prev[i] = tail_idx[lo - 1] if lo else None
+        if lo == len(tails):
+            tails.append(x)
+            tail_idx.append(i)
+        else:
+            tails[lo] = x
+            tail_idx[lo] = i
+    out, i = [], tail_idx[-1] if tail_idx else None
+    while i is not None:
+        out.append(i)
+        i = prev[i]
+    return out[::-1]
+
+
+def _youtube_fix_playlist_order(headers, playlist_id, item_ids, budget_units=None):
+    """
+    Moves items of a playlist holding exactly item_ids (the one we just filled) into item_ids order.
+    Items on a longest already-ordered run stay put; every other item is moved right after its
+    predecessor in item_ids, which is the minimum number of playlistItems.update calls (50 units each).
+    When the moves cost more than budget_units and the day's remaining quota can't cover the difference,
+    the playlist is left as inserted. Best-effort: failures stop the pass. Returns (moves, units).
+    """
+    current, snippets, units = [], {}, 0
+    page_token = None
+    while True:
+        params = {"part": "snippet", "playlistId": playlist_id, "maxResults": 50}
+        if page_token:
+            params["pageToken"] = page_token
+        r = http_get(YOUTUBE_PLAYLIST_ITEMS_URL, headers=headers, params=params)
+        units += YOUTUBE_QUOTA_COSTS["playlistItems.list"]
+        if r.status_code != 200:
+            print("playlist order check failed:", r.status_code, r.text)
+            return 0, units
+        data = r.json()
+        for it in data.get("items", []):
+            current.append(it["id"])
+            snippets[it["id"]] = it.get("snippet") or {}
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            break
+
+    rank = {item_id: i for i, item_id in enumerate(item_ids)}
+    ranked = [item_id for item_id in current if item_id in rank]
+    keep = {ranked[i] for i in _longest_increasing_run([rank[item_id] for item_id in ranked])}
+    to_move = [k for k, item_id in enumerate(item_ids) if item_id not in keep and item_id in snippets]
+    cost = len(to_move) * YOUTUBE_QUOTA_COSTS["playlistItems.update"]
+    if budget_units is not None and cost > budget_units and youtube_quota_status()["remaining"] < cost - budget_units:
+        print(f"playlist {playlist_id}: skipping reorder of {len(to_move)} items, quota too low")
+        return 0, units
+
+    moves = 0
+    for k in to_move:
+        item_id = item_ids[k]
+        current.remove(item_id)
+        # the predecessor can be missing from a lagging playlistItems.list; fall back to the nearest listed one
+        prev = next((item_ids[j] for j in range(k - 1, -1, -1) if item_ids[j] in snippets), None)
+        pos = current.index(prev) + 1 if prev is not None else 0
+        body = {"id": item_id, "snippet": {"playlistId": playlist_id, "resourceId": snippets[item_id].get("resourceId"), "position": pos}}
+        r = http_put(f"{YOUTUBE_PLAYLIST_ITEMS_URL}?part=snippet", headers=headers, json=body)
+        units += YOUTUBE_QUOTA_COSTS["playlistItems.update"]
+        if r.status_code != 200:
+            print("playlist reorder failed:", r.status_code, r.text)
+            break
+        current.insert(pos, item_id)
+        moves += 1
+    return moves, units
+
+
+def youtube_order_fix_budget(n_items: int):
+    """Quota units reserved for playlistItems.update moves when a playlist of n_items is reordered."""
+    return round(n_items * YOUTUBE_ORDER_FIX_RATIO) * YOUTUBE_QUOTA_COSTS["playlistItems.update"]
+
+
+def youtube_playlist_quota_estimate(n_items: int, preserve_order=True):
+    units = YOUTUBE_QUOTA_COSTS["playlists.insert"] + n_items * YOUTUBE_QUOTA_COSTS["playlistItems.insert"]
+    if preserve_order:
+        units += YOUTUBE_QUOTA_COSTS["playlistItems.list"] + youtube_order_fix_budget(n_items)
+    return units
+
+
+def youtube_insert_playlist_items(headers, playlist_id, video_ids, preserve_order=True, on_progress=None):
+    """
+    Adds video_ids to a playlist with bounded concurrency (YOUTUBE_INSERT_CONCURRENCY).
+    - only failed items are retried, in up to YOUTUBE_INSERT_RETRIES rounds with full-jitter backoff,
+      and only for rate-limit / conflict / transient errors
+    - quotaExceeded stops the items not yet sent (reported as "skipped")
+    - preserve_order moves items that landed out of order back into video_ids order
+    on_progress(done, total) is called as items complete.
+    Returns (results, units): results follow video_ids order as
+    {videoId, status: added|failed|skipped, attempts, playlistItemId?, error?}; units is the quota spent.
+    """
+    units = 0
+    done = 0
+    quota_exceeded = threading.Event()
+
+    def insert(i):
+        item, error, retryable = _youtube_insert_item(headers, playlist_id, video_ids[i])
+        if error and error.get("reason") == "quotaExceeded":
+            quota_exceeded.set()
+        return (True, item, False) if item else (False, error, retryable)
+
+    def counted(i, ok, value):
+        nonlocal units, done
+        units += YOUTUBE_QUOTA_COSTS["playlistItems.insert"]
+        if ok:
+            done += 1
+            if on_progress:
+                on_progress(done, len(video_ids))
+
+    outcome = run_in_retry_rounds(range(len(video_ids)), insert, YOUTUBE_INSERT_CONCURRENCY, YOUTUBE_INSERT_RETRIES,
+                                  stop=quota_exceeded, on_result=counted)
+    results = []
+    for i, video_id in enumerate(video_ids):
+        o = outcome[i]
+        res = {"videoId": video_id, "attempts": o["attempts"]}
+        if o["ok"]:
+            res.update(status="added", playlistItemId=o["value"].get("id"))
+        elif not o["attempts"]:
+            res["status"] = "skipped"  # never sent: the daily quota ran out
+        else:
+            res.update(status="failed", error=o["value"])
+        results.append(res)
+
+    added_ids = [r["playlistItemId"] for r in results if r["status"] == "added"]
+    if preserve_order and len(added_ids) > 1:
+        # the playlist is already filled: a failed reorder must not fail the request
+        try:
+            moves, fix_units = _youtube_fix_playlist_order(headers, playlist_id, added_ids,
+                                                           budget_units=youtube_order_fix_budget(len(video_ids)))
+            units += fix_units
+            if moves:
+                print(f"playlist {playlist_id}: moved {moves} items back into order")
+        except Exception as e:
+            print(f"playlist {playlist_id}: reorder failed:", e)
+    return results, units
+
+
 @app.route('/api/youtube/create-playlist', methods=['POST'])
 def youtube_create_playlist():
     body = request.get_json() or {}
@@ -440,7 +2392,8 @@ def youtube_create_playlist():
 
     if not login_id or not video_ids:
         return jsonify({'error': 'loginId and videoIds are required'}), 400
-    
+    video_ids = video_ids[:YOUTUBE_PLAYLIST_MAX_ITEMS]
+    preserve_order = bool(body.get('preserveOrder', True))
 
 
     # get user OAuth access token from Descope outbound app
@@ -456,38 +2409,45 @@ def youtube_create_playlist():
         return jsonify({'error': 'no access token available for user, ask them to connect YouTube'}), 400
 
 
-    # create playlist
-    headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
-    create_url = 'https://www.googleapis.com/youtube/v3/playlists?part=snippet,status'
-    body_payload = {
-    'snippet': {'title': playlist_title, 'description': playlist_description},
-    'status': {'privacyStatus': 'private'}
-    }
-    r = requests.post(create_url, headers=headers, json=body_payload)
-    print(f"Create playlist response: {r.status_code} {r.text}")
-    if r.status_code not in (200, 201):
-        return jsonify({'error': 'failed to create playlist', 'detail': r.text}), 500
-    playlist = r.json()
-    playlist_id = playlist.get('id')
-
-
-    # add videos to playlist
-    added = []
-    for vid in video_ids[:50]:
-        add_url = 'https://www.googleapis.com/youtube/v3/playlistItems?part=snippet'
-        item = {
-            'snippet': {
-            'playlistId': playlist_id,
-            'resourceId': {'kind': 'youtube#video', 'videoId': vid}
-            }
+    # reserve the quota this playlist needs up front so concurrent users can't overdraw the daily budget
+    quota_day = youtube_quota_day()
+    reserved = youtube_playlist_quota_estimate(len(video_ids), preserve_order)
+    if not youtube_quota_reserve(reserved, quota_day):
+        return jsonify({'error': 'youtube_quota_low', 'detail': 'not enough YouTube API quota left today to create this playlist',
+                        'quota': youtube_quota_status(quota_day)}), 429
+
+    spent = 0
+    try:
+        # create playlist
+        headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+        create_url = 'https://www.googleapis.com/youtube/v3/playlists?part=snippet,status'
+        body_payload = {
+        'snippet': {'title': playlist_title, 'description': playlist_description},
+        'status': {'privacyStatus': 'private'}
         }
-        ar = requests.post(add_url, headers=headers, json=item)
-        if ar.status_code in (200, 201):
-            added.append(vid)
+        r = http_post(create_url, headers=headers, json=body_payload)
+        spent += YOUTUBE_QUOTA_COSTS["playlists.insert"]
+        print(f"Create playlist response: {r.status_code} {r.text}")
+        if r.status_code not in (200, 201):
+            return jsonify({'error': 'failed to create playlist', 'detail': r.text}), 500
+        playlist = r.json()
+        playlist_id = playlist.get('id')
 
+        # add videos to playlist
+        results, units = youtube_insert_playlist_items(headers, playlist_id, video_ids,
+                                                       preserve_order=preserve_order)
+        spent += units
+    finally:
+        youtube_quota_charge(spent - reserved, quota_day)
 
     playlist_url = f'https://www.youtube.com/playlist?list={playlist_id}'
-    return jsonify({'playlistId': playlist_id, 'playlistUrl': playlist_url, 'added': added})
+    return jsonify({
+        'playlistId': playlist_id,
+        'playlistUrl': playlist_url,
+        'added': [res['videoId'] for res in results if res['status'] == 'added'],
+        'results': results,
+        'quota': youtube_quota_status(quota_day)
+    })
 
 @app.route("/api/github/repo/collaborators", methods=["POST"])
 def github_repo_collaborators():
@@ -508,22 +2468,11 @@ def github_repo_collaborators():
     
     print(2)
 
-    headers = {
-        "Authorization": f"token {access_token}",
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "descope-demo-app"
-    }
-    
-    print(3)
-
-    user_resp = requests.get("https://api.github.com/user", headers=headers)
-    user_login = user_resp.json().get("login")
-
-    collab_url = f"https://api.github.com/repos/{user_login}/{repo_name}/collaborators"
-    collab_resp = requests.get(collab_url, headers=headers)
-    if collab_resp.status_code != 200:
-        return jsonify({"collaborators": []})
-    return jsonify({"collaborators": collab_resp.json()})
+    try:
+        roster = collaborator_roster(access_token, repo_name, login_id, force=bool(body.get("refresh")))
+    except Exception as e:
+        return jsonify({"error": "github user request failed", "detail": str(e)}), 500
+    return jsonify({"collaborators": roster["collaborators"]})
 
 @app.route("/api/github/description-apply", methods=["POST"])
 def github_description_apply():
@@ -546,15 +2495,15 @@ def github_description_apply():
         "User-Agent": "descope-demo-app"
     }
     # Get username
-    user_resp = requests.get("https://api.github.com/user", headers=headers)
-    if user_resp.status_code != 200:
-        return jsonify({"error": "github user request failed", "detail": user_resp.text}), 500
-    user_login = user_resp.json().get("login")
+    try:
+        user_login = get_github_login(access_token, login_id)
+    except Exception as e:
+        return jsonify({"error": "github user request failed", "detail": str(e)}), 500
 
 
     patch_url = f"https://api.github.com/repos/{user_login}/{repo_name}"
     patch_data = {"description": description}
-    patch_resp = requests.patch(patch_url, headers=headers, json=patch_data)
+    patch_resp = http_patch(patch_url, headers=headers, json=patch_data)
     if patch_resp.status_code not in (200, 201):
         return jsonify({"error": "failed to update description", "detail": patch_resp.text}), 500
 
@@ -582,51 +2531,41 @@ def github_description_suggest():
         "User-Agent": "descope-demo-app"
     }
 
-    user_resp = requests.get("https://api.github.com/user", headers=headers)
-    user_login = user_resp.json().get("login")
+    try:
+        user_login = get_github_login(access_token, login_id)
+    except Exception as e:
+        return jsonify({"error": "github user request failed", "detail": str(e)}), 500
+
+    # A description derived from this exact tree is reused unless the client asks for a new one
+    branch = resolve_default_branch(access_token, user_login, repo_name)
+    tree_sha = get_repo_tree_sha(access_token, user_login, repo_name, branch)
+    cached = (get_repo_analysis(user_login, repo_name, tree_sha) or {}).get("summaries", {}).get("description")
+    if cached and not body.get("regenerate"):
+        return jsonify({"suggested": cached})
 
     # Gather code files for Gemini analysis
-    tree_url = f"https://api.github.com/repos/{user_login}/{repo_name}/git/trees/main?recursive=1"
-    tree_resp = requests.get(tree_url, headers=headers)
-    tree = tree_resp.json().get("tree", []) if tree_resp.status_code == 200 else []
-    code_contents = []
-    for item in tree:
-        if item["type"] == "blob" and (
-            item["path"].endswith(".py") or item["path"].endswith(".js") or item["path"].endswith(".jsx") or item["path"].endswith(".ts") or item["path"].endswith(".tsx") or
-            item["path"].endswith(".java") or item["path"].endswith(".go") or item["path"].endswith(".rb") or item["path"].endswith(".php") or item["path"].endswith(".c") or
-            item["path"].endswith(".cpp") or item["path"].endswith(".cs") or item["path"].endswith(".html") or item["path"].endswith(".css") or item["path"].endswith(".md") or
-            item["path"].endswith(".sh")
-        ):
-            file_url = f"https://api.github.com/repos/{user_login}/{repo_name}/contents/{item['path']}"
-            file_resp = requests.get(file_url, headers=headers)
-            if file_resp.status_code == 200:
-                file_data = file_resp.json()
-                try:
-                    content = base64.b64decode(file_data.get("content", "")).decode("utf-8", errors="ignore")
-                    code_contents.append(f"File: {item['path']}\n{content[:1500]}")
-                except Exception:
-                    continue
-            if len(code_contents) >= 10:
-                break
+    sample = sample_repo_files(access_token, user_login, repo_name, default_branch=branch)
+    code_contents = [f"File: {f['path']}\n{f['content']}" for f in sample["files"]]
 
+    files_text = fit_prompt_sections("description_suggest", [{"name": "files", "items": code_contents, "separator": "\n"}])["files"]
     prompt = f"""
 You are an expert software engineer. Given the following code files from a GitHub repository, write a concise (1-2 sentence) description of what this repository does and its main purpose.It should not exceed 300 characters.
 
-{chr(10).join(code_contents)}
+{files_text}
 
 Description:
 """
+    log_prompt_tokens("description_suggest", prompt)
     suggested = ""
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
-        suggested = response.text.strip()
+        suggested = gemini_generate_text(prompt, regenerate=bool(body.get("regenerate"))).strip()
+        save_repo_analysis(user_login, repo_name, sample["tree_sha"], summaries={"description": suggested})
     except Exception as e:
         suggested = "No description available."
 
     return jsonify({"suggested": suggested})
 
-def generate_linkedin_text_from_repo(repo_details):
+def generate_linkedin_text_from_repo(repo_details, regenerate=False):
     """
     Use Gemini to create a polished LinkedIn project update and a concise project description for Profile API.
     Returns: { 'post_text': str, 'project_title': str, 'project_description': str }
@@ -659,9 +2598,7 @@ repo_url: {repo_details.get("url") or '' }
 last_commit: {last_commit}
 """
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        out_text = resp.text.strip()
+        out_text = gemini_generate_text(prompt, regenerate=regenerate).strip()
         # extract first JSON block
         start = out_text.find('{')
         end = out_text.rfind('}')
@@ -714,7 +2651,7 @@ def create_linkedin_profile_project(access_token, person_id, title, description,
         # members should be list of {"memberId": "urn:li:person:...", "name": {...localized...}}; simple fallback:
         payload["members"] = members
 
-    r = requests.post(api_url, headers=headers, json=payload, timeout=20)
+    r = http_post(api_url, headers=headers, json=payload, timeout=20)
     try:
         return r.status_code, r.json(), r.headers
     except Exception:
@@ -757,7 +2694,7 @@ def create_linkedin_ugc_post(access_token, author_urn, post_text, repo_url=None,
         "visibility": {"com.linkedin.ugc.MemberNetworkVisibility": visibility}
     }
 
-    r = requests.post(api_url, headers=headers, json=payload, timeout=20)
+    r = http_post(api_url, headers=headers, json=payload, timeout=20)
     try:
         return r.status_code, r.json()
     except Exception:
@@ -810,7 +2747,7 @@ def create_linkedin_ugc_post(access_token: str, author_urn: str, text: str, repo
     }
 
     # Do the POST
-    resp = requests.post(url, headers=headers, json=payload, timeout=15)
+    resp = http_post(url, headers=headers, json=payload, timeout=15)
     try:
         parsed = resp.json()
     except ValueError:
@@ -832,7 +2769,7 @@ def linkedin_create_project_update():
     Flow (UGC-only):
       - Get Descope outbound token for LinkedIn
       - Get LinkedIn member id (userinfo via OIDC) -> construct author urn
-      - Fetch GitHub repo details (reuse existing local endpoint)
+      - Fetch GitHub repo details (in-process repo details service)
       - Use Gemini to create text/title/description
       - Create UGC post (article if repo_url provided, otherwise text-only)
     """
@@ -854,7 +2791,7 @@ def linkedin_create_project_update():
 
     # 2) get member id (URN) via OIDC userinfo
     try:
-        userinfo_resp = requests.get(
+        userinfo_resp = http_get(
             "https://api.linkedin.com/v2/userinfo",
             headers={"Authorization": f"Bearer {linkedin_access_token}"},
             timeout=10
@@ -875,22 +2812,11 @@ def linkedin_create_project_update():
     except Exception as e:
         return jsonify({"error": "linkedin /userinfo failed", "detail": str(e)}), 500
 
-    # 3) fetch repo details (local helper endpoint)
-    try:
-        local_resp = requests.post(
-            "https://mcp-hackathon-7buc.vercel.app/api/github/repo/details",
-            json={"loginId": login_id, "repoName": repo_name},
-            timeout=30
-        )
-        if local_resp.status_code != 200:
-            repo_details = {"name": repo_name, "url": f"https://github.com/{repo_name}", "description": ""}
-        else:
-            repo_details = local_resp.json()
-    except Exception as e:
-        repo_details = {"name": repo_name, "url": f"https://github.com/{repo_name}", "description": ""}
+    # 3) fetch repo details (in-process service)
+    repo_details = fetch_local_repo_details(login_id, repo_name)
 
     # 4) generate LinkedIn text via Gemini
-    gen = generate_linkedin_text_from_repo(repo_details)
+    gen = generate_linkedin_text_from_repo(repo_details, regenerate=bool(body.get("regenerate")))
     post_text = gen.get("post_text") or f"Project update: {repo_details.get('name')}"
     project_title = gen.get("project_title") or repo_details.get("name")
     project_description = gen.get("project_description") or (repo_details.get("description") or "")
@@ -960,10 +2886,7 @@ def outbound_link_provider():
             "Accept": "application/vnd.github+json",
             "User-Agent": "descope-demo-app"
         }
-        r = requests.get("https://api.github.com/user", headers=headers)
-        if r.status_code != 200:
-            return jsonify({"error": "github user request failed", "detail": r.text}), 500
-        gh = r.json()
+        gh = resolve_github_identity(access_token)
         gh_id = gh.get("id")
         gh_login = gh.get("login")
     except Exception as e:
@@ -972,12 +2895,12 @@ def outbound_link_provider():
     # store mapping in users_collection; prefer app_user_id -> userId if present, otherwise email
     filter_query = {}
     if app_user_id:
-        filter_query = {"userId": app_user_id}
+        filter_query = user_filter(app_user_id)
     elif email:
         filter_query = {"email": email}
     elif descope_user_id:
         # you may have stored userId = descope_user_id previously; try both fields
-        filter_query = {"userId": descope_user_id}
+        filter_query = user_filter(descope_user_id)
 
     if not filter_query:
         return jsonify({"error": "no user identifier provided to link account"}), 400
@@ -1009,7 +2932,7 @@ def outbound_link_provider():
             linked_to = "email (upsert)"
         else:
             # fallback: create new doc keyed by userId if we have descope_user_id/app_user_id
-            users_collection.update_one({"userId": descope_user_id or app_user_id}, {"$set": {
+            users_collection.update_one(user_filter(descope_user_id or app_user_id), {"$set": {
                 "connectedAccounts.github": {
                     "id": gh_id,
                     "login": gh_login,
@@ -1029,57 +2952,253 @@ def outbound_link_provider():
         "linkedTo": linked_to
     })
 
+# -------------------------
+# Background jobs for multi-step workflows
+# -------------------------
+# Workflows are plain functions (body, job_id) -> (status_code, payload), registered with @job_workflow.
+# Routes run them inline, or with {"async": true} in the body enqueue them on a local worker pool and
+# return 202 with a job id; progress and results live in MongoDB and are read via GET /api/jobs/<id>.
+# The pool lives in the API process, so async jobs only make sense where that process outlives the response
+# (not on serverless); the stored body lets a worker re-run a job, and jobs that stop reporting are failed.
+# No page uses this path yet: the frontend calls the synchronous endpoints.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL = int(os.getenv("JOB_TTL", str(7 * 24 * 3600)))  # finished and abandoned jobs are dropped by a TTL index
+# a queued/running job with no update for this long lost its worker (process frozen or recycled)
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", str(15 * 60)))
+# running jobs refresh updatedAt this often, so a long step is not mistaken for a lost worker
+JOB_HEARTBEAT_INTERVAL = min(60, JOB_STALE_AFTER // 3)
+JOB_ACTIVE_STATES = ["queued", "running"]
+jobs_collection = db["jobs"]
+
+JOB_WORKFLOWS = {}
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_running_jobs = set()
+_running_jobs_lock = threading.Lock()
+_job_heartbeat_thread = None
+
+
+def job_workflow(kind: str):
+    """Registers fn(body, job_id) -> (status_code, payload) as a workflow that can run as a job."""
+    def register(fn):
+        JOB_WORKFLOWS[kind] = fn
+        return fn
+    return register
+
+
+def _job_update(job_id, fields: dict, push: dict = None):
+    fields = dict(fields, updatedAt=datetime.utcnow())
+    update = {"$set": fields}
+    if push:
+        update["$push"] = push
+    try:
+        jobs_collection.update_one({"_id": job_id}, update)
+    except Exception as e:
+        print("job update failed:", job_id, e)
+
+
+def job_step(job_id, name: str, **detail):
+    """Records that a workflow started step `name`; a no-op when the workflow runs inline (job_id None)."""
+    if not job_id:
+        return
+    _job_update(job_id, {"currentStep": name}, push={"steps": {"name": name, "startedAt": datetime.utcnow(), **detail}})
+
+
+def job_progress(job_id, done: int, total: int, step: str = None):
+    """Records fine-grained progress inside the current step (e.g. chunks written); no-op inline."""
+    if not job_id:
+        return
+    _job_update(job_id, {"progress": {"step": step, "done": done, "total": total}})
+
+
+def _job_heartbeat_loop():
+    """One thread per process: bumps updatedAt of every job this process is running, in a single write."""
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _running_jobs_lock:
+            job_ids = list(_running_jobs)
+        if not job_ids:
+            continue
+        try:
+            jobs_collection.update_many({"_id": {"$in": job_ids}, "status": "running"},
+                                        {"$set": {"updatedAt": datetime.utcnow()}})
+        except Exception as e:
+            print("job heartbeat failed:", e)
+
+
+def _track_running_job(job_id, running: bool):
+    global _job_heartbeat_thread
+    with _running_jobs_lock:
+        if not running:
+            _running_jobs.discard(job_id)
+            return
+        _running_jobs.add(job_id)
+        if _job_heartbeat_thread is None:
+            _job_heartbeat_thread = threading.Thread(target=_job_heartbeat_loop, name="job-heartbeat", daemon=True)
+            _job_heartbeat_thread.start()
+
+
+def _run_job(job_id, kind, body):
+    _job_update(job_id, {"status": "running", "startedAt": datetime.utcnow()})
+    _track_running_job(job_id, True)
+    try:
+        status_code, payload = JOB_WORKFLOWS[kind](body, job_id)
+    except Exception as e:
+        print("job failed:", job_id, kind, e)
+        _job_update(job_id, {"status": "failed", "statusCode": 500, "error": str(e), "finishedAt": datetime.utcnow()})
+        return
+    finally:
+        _track_running_job(job_id, False)
+    # stored as JSON text: payloads carry upstream responses whose keys (e.g. emails) aren't valid Mongo field names
+    _job_update(job_id, {
+        "status": "succeeded" if status_code < 400 else "failed",
+        "statusCode": status_code,
+        "result": json.dumps(payload, default=str),
+        "finishedAt": datetime.utcnow()
+    })
+
+
+def fail_stale_jobs(job_id=None):
+    """
+    Marks queued/running jobs whose last update is older than JOB_STALE_AFTER as failed (all of them, or just
+    job_id). Returns the number of jobs failed.
+    """
+    now = datetime.utcnow()
+    query = {"status": {"$in": JOB_ACTIVE_STATES}, "updatedAt": {"$lt": now - timedelta(seconds=JOB_STALE_AFTER)}}
+    if job_id:
+        query["_id"] = job_id
+    try:
+        res = jobs_collection.update_many(query, {"$set": {
+            "status": "failed",
+            "statusCode": 504,
+            "error": "job stopped reporting progress (worker lost)",
+            "updatedAt": now,
+            "finishedAt": now
+        }})
+        return res.modified_count
+    except Exception as e:
+        print("stale job sweep failed:", e)
+        return 0
+
+
+def enqueue_job(kind: str, body: dict):
+    """Stores a queued job (with its body, so it can be re-run) and submits it to the worker pool. Returns the job id."""
+    fail_stale_jobs()
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    jobs_collection.insert_one({
+        "_id": job_id,
+        "type": kind,
+        "loginId": body.get("loginId"),
+        # JSON text for the same reason as result below
+        "body": json.dumps({k: v for k, v in body.items() if k != "async"}, default=str),
+        "status": "queued",
+        "steps": [],
+        "createdAt": now,
+        "updatedAt": now,
+        "expireAt": now + timedelta(seconds=JOB_TTL)
+    })
+    _job_executor.submit(_run_job, job_id, kind, body)
+    return job_id
+
+
+def run_workflow_request(kind: str, body: dict):
+    """Route helper: runs the workflow inline, or enqueues it when the body has async: true."""
+    if body.get("async"):
+        try:
+            job_id = enqueue_job(kind, body)
+        except Exception as e:
+            return jsonify({"error": "enqueue_failed", "detail": str(e)}), 500
+        return jsonify({"jobId": job_id, "status": "queued", "statusUrl": f"/api/jobs/{job_id}"}), 202
+    status_code, payload = JOB_WORKFLOWS[kind](body, None)
+    return jsonify(payload), status_code
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    GET /api/jobs/<id>?loginId=...
+    Returns { jobId, type, status: queued|running|succeeded|failed, currentStep, steps, progress, statusCode, result, error }.
+    result is the payload the synchronous endpoint would have returned.
+    """
+    try:
+        job = jobs_collection.find_one({"_id": job_id}, {"body": 0})
+        if job and job.get("status") in JOB_ACTIVE_STATES and fail_stale_jobs(job_id):
+            job = jobs_collection.find_one({"_id": job_id}, {"body": 0})
+    except Exception as e:
+        return jsonify({"error": "job lookup failed", "detail": str(e)}), 500
+    # jobs are only visible to the user that started them
+    if not job or (job.get("loginId") and job.get("loginId") != request.args.get("loginId")):
+        return jsonify({"error": "job not found"}), 404
+
+    def iso(dt):
+        return dt.isoformat() + "Z" if isinstance(dt, datetime) else dt
+
+    return jsonify({
+        "jobId": job["_id"],
+        "type": job.get("type"),
+        "status": job.get("status"),
+        "currentStep": job.get("currentStep"),
+        "steps": [dict(st, startedAt=iso(st.get("startedAt"))) for st in job.get("steps") or []],
+        "progress": job.get("progress"),
+        "statusCode": job.get("statusCode"),
+        "result": json.loads(job["result"]) if job.get("result") else None,
+        "error": job.get("error"),
+        "createdAt": iso(job.get("createdAt")),
+        "updatedAt": iso(job.get("updatedAt")),
+        "finishedAt": iso(job.get("finishedAt"))
+    }), 200
+
+
 @app.route("/api/meet/create-and-invite", methods=["POST"])
 def meet_create_and_invite():
+    """
+    POST { loginId, repoName, title?, async? }
+    Creates a Calendar event with a Meet link and invites the collaborators that have accounts here.
+    With async: true returns 202 { jobId } and the result is read from /api/jobs/<id>.
+    """
     body = request.get_json() or {}
+    if not body.get("loginId") or not body.get("repoName"):
+        return jsonify({"error": "loginId and repoName required"}), 400
+    return run_workflow_request("meet_create_and_invite", body)
+
+
+@job_workflow("meet_create_and_invite")
+def run_meet_create_and_invite(body, job_id=None):
     login_id = body.get("loginId")
     repo_name = body.get("repoName")
     custom_title = body.get("title")
 
-    if not login_id or not repo_name:
-        return jsonify({"error": "loginId and repoName required"}), 400
-
     # 1) get GitHub token so we can list collaborators
+    job_step(job_id, "github_token")
     try:
         gh_token_json = get_outbound_token("github", login_id)
         gh_access_token = extract_access_token(gh_token_json)
         if not gh_access_token:
-            return jsonify({"error": "no github access token from Descope", "detail": gh_token_json}), 500
+            return 500, {"error": "no github access token from Descope", "detail": gh_token_json}
     except Exception as e:
-        return jsonify({"error": "failed to retrieve github token", "detail": str(e)}), 500
+        return 500, {"error": "failed to retrieve github token", "detail": str(e)}
 
     # 2) fetch collaborators using helper (must return owner and list)
+    job_step(job_id, "collaborators")
+    # 3) collaborator emails come joined from the users collection
     try:
-        owner_login, collaborators = fetch_github_user_and_collaborators(gh_access_token, repo_name)
-        collab_logins = [c.get("login") for c in collaborators if c.get("login")]
+        emails = collaborator_roster(gh_access_token, repo_name, login_id)["emails"]
     except Exception as e:
-        return jsonify({"error": "failed to list collaborators", "detail": str(e)}), 500
-
-    # 3) find collaborator emails from DB
-    emails = []
-    if collab_logins:
-        try:
-            docs = users_collection.find({"connectedAccounts.github.login": {"$in": collab_logins}})
-            for d in docs:
-                em = d.get("email")
-                if em:
-                    emails.append(em)
-        except Exception as e:
-            print("DB lookup error mapping collaborators to emails:", str(e))
-
-    emails = list(dict.fromkeys(emails))
+        return 500, {"error": "failed to list collaborators", "detail": str(e)}
 
     # 4) get Google Calendar token from the right outbound app id
+    job_step(job_id, "google_token")
     try:
         google_app_id = GOOGLE_CALENDAR_OUTBOUND_APP_ID
         google_token_json = get_outbound_token(google_app_id, login_id)
         google_access_token = extract_access_token(google_token_json)
         if not google_access_token:
-            return jsonify({"error": "no google calendar access token from Descope", "detail": google_token_json}), 500
+            return 500, {"error": "no google calendar access token from Descope", "detail": google_token_json}
     except Exception as e:
-        return jsonify({"error": "failed to retrieve google calendar token", "detail": str(e)}), 500
+        return 500, {"error": "failed to retrieve google calendar token", "detail": str(e)}
 
     # 5) create calendar event (try conferenceData; fallback to plain event)
+    job_step(job_id, "create_event")
     try:
         now = datetime.utcnow()
         start_dt = now + timedelta(minutes=2)
@@ -1110,7 +3229,7 @@ def meet_create_and_invite():
             "Accept": "application/json",
             "Content-Type": "application/json"
         }
-        r = requests.post(create_url, headers=headers, json=event_payload, timeout=20)
+        r = http_post(create_url, headers=headers, json=event_payload, timeout=20)
 
         if r.status_code not in (200, 201):
             # return Google's full error body so client can display useful info
@@ -1120,28 +3239,28 @@ def meet_create_and_invite():
                 ge = r.json()
                 reason = ge.get("error", {}).get("details", [{}])[0].get("reason", "")
                 if ge.get("error", {}).get("status") == "PERMISSION_DENIED" or "insufficientPermissions" in google_error_body:
-                    return jsonify({
+                    return 403, {
                         "error": "google_insufficient_scope",
                         "message": "Google returned insufficient scopes for the token. The user must re-consent to the Google Calendar outbound app with calendar scopes.",
                         "google_response": ge
-                    }), 403
+                    }
             except Exception:
                 pass
 
             # try fallback: event without conferenceData
             fallback_payload = {k: v for k, v in event_payload.items() if k != "conferenceData"}
-            r2 = requests.post("https://www.googleapis.com/calendar/v3/calendars/primary/events?sendUpdates=all", headers=headers, json=fallback_payload, timeout=20)
+            r2 = http_post("https://www.googleapis.com/calendar/v3/calendars/primary/events?sendUpdates=all", headers=headers, json=fallback_payload, timeout=20)
             if r2.status_code in (200, 201):
                 ev = r2.json()
-                return jsonify({
+                return 200, {
                     "success": True,
                     "meetLink": None,
                     "eventId": ev.get("id"),
                     "invited": emails,
                     "warning": "conference creation failed but event was created.", "google_response": r.text
-                }), 200
+                }
             else:
-                return jsonify({"error": "google_api_error", "google_response": r.text, "status_code": r.status_code}), 500
+                return 500, {"error": "google_api_error", "google_response": r.text, "status_code": r.status_code}
 
         event = r.json()
         meet_link = event.get("hangoutLink")
@@ -1156,41 +3275,35 @@ def meet_create_and_invite():
 
     except Exception as e:
         print("EXCEPTION during meet creation:", str(e))
-        return jsonify({"error": "failed_to_create_meet", "detail": str(e)}), 500
+        return 500, {"error": "failed_to_create_meet", "detail": str(e)}
 
-    return jsonify({
+    return 200, {
         "success": True,
         "meetLink": meet_link,
         "eventId": event_id,
         "invited": emails
-    })
+    }
+
 
 def fetch_local_repo_details(login_id, repo_name):
     try:
-        local_resp = requests.post(
-        "https://mcp-hackathon-7buc.vercel.app/api/github/repo/details",
-        json={"loginId": login_id, "repoName": repo_name},
-        timeout=30,
-        )
-        if local_resp.status_code == 200:
-            return local_resp.json()
-    except Exception:
-        pass
+        status, details = get_repo_details(login_id, repo_name)
+        if status == 200:
+            return details
+        print("repo details unavailable:", status, details)
+    except Exception as e:
+        print("repo details failed:", e)
     return {"name": repo_name, "url": f"https://github.com/{repo_name}",
     "description": ""}
 
 # New: strong LinkedIn-style preview generator (detailed)
-def generate_linkedin_preview(repo_details, top_hashtags=None):
+def _linkedin_preview_prompt(repo_details):
     name = repo_details.get("name") or "Project"
     description = repo_details.get("description") or ""
     languages = repo_details.get("languages") or []
     frameworks = repo_details.get("frameworks") or []
     repo_url = repo_details.get("url") or f"https://github.com/{name}"
-    hashtags = top_hashtags or ([(frameworks[0] if frameworks else
-    (languages[0] if languages else "Project"))] if frameworks or languages else
-    [])
-    hashtag_str = " ".join([f"#{h.replace(' ', '')}" for h in hashtags[:2]])
-    prompt = f"""
+    return f"""
     You are an expert technical writer and social media editor specialized in
     LinkedIn posts for software projects.
     Given the repository details below, write a **detailed LinkedIn-style project
@@ -1214,10 +3327,21 @@ def generate_linkedin_preview(repo_details, top_hashtags=None):
     repo_url: {repo_url}
     JSON:
     """
+
+
+def _linkedin_preview_from_text(repo_details, text, top_hashtags=None):
+    """Builds the preview dict from the model output; falls back to a deterministic preview if text is unusable."""
+    name = repo_details.get("name") or "Project"
+    description = repo_details.get("description") or ""
+    languages = repo_details.get("languages") or []
+    frameworks = repo_details.get("frameworks") or []
+    repo_url = repo_details.get("url") or f"https://github.com/{name}"
+    hashtags = top_hashtags or ([(frameworks[0] if frameworks else
+    (languages[0] if languages else "Project"))] if frameworks or languages else
+    [])
+    hashtag_str = " ".join([f"#{h.replace(' ', '')}" for h in hashtags[:2]])
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        text = resp.text.strip()
+        text = (text or "").strip()
         # Extract JSON block robustly
         s = text.find("{")
         e = text.rfind("}")
@@ -1252,16 +3376,40 @@ def generate_linkedin_preview(repo_details, top_hashtags=None):
     "repo_url": repo_url,
     }
 
+
+def generate_linkedin_preview(repo_details, top_hashtags=None, regenerate=False):
+    text = None
+    try:
+        text = gemini_generate_text(_linkedin_preview_prompt(repo_details), regenerate=regenerate)
+    except Exception as e:
+        print("preview generation error:", e)
+    return _linkedin_preview_from_text(repo_details, text, top_hashtags)
+
 # Route: preview-only (no tokens required)
 @app.route("/api/linkedin/preview", methods=["POST"])
 def linkedin_preview():
+    """
+    POST { loginId?, repoName, regenerate?, stream? }
+    Returns the preview JSON, or with stream=true an NDJSON/SSE event stream (see stream_gemini_generation)
+    whose final "done" event carries the same preview fields.
+    """
     body = request.get_json() or {}
     login_id = body.get("loginId")
     repo_name = body.get("repoName")
     if not repo_name:
         return jsonify({"error": "repoName required"}), 400
+    if body.get("stream"):
+        def prepare():
+            repo_details = fetch_local_repo_details(login_id, repo_name)
+
+            def finish(text):
+                preview = _linkedin_preview_from_text(repo_details, text)
+                preview["generatedAt"] = datetime.utcnow().isoformat() + "Z"
+                return preview
+            return _linkedin_preview_prompt(repo_details), finish
+        return event_stream_response(stream_gemini_generation(prepare, regenerate=bool(body.get("regenerate"))))
     repo_details = fetch_local_repo_details(login_id, repo_name)
-    preview = generate_linkedin_preview(repo_details)
+    preview = generate_linkedin_preview(repo_details, regenerate=bool(body.get("regenerate")))
     # add a 'generatedAt' timestamp for client
     preview["generatedAt"] = datetime.utcnow().isoformat() + "Z"
     return jsonify(preview), 200
@@ -1288,7 +3436,7 @@ def linkedin_create_post():
 "detail": str(e)}), 500
 # 2) get member id (URN) via OIDC userinfo
     try:
-        userinfo_resp = requests.get(
+        userinfo_resp = http_get(
         "https://api.linkedin.com/v2/userinfo",
         headers={"Authorization": f"Bearer {linkedin_access_token}"},
         timeout=10
@@ -1320,7 +3468,7 @@ def linkedin_create_post():
         str(e)}), 500
 
 
-def gemini_make_google_queries(languages, frameworks, repo_name=None, repo_description=None, top_k=6):
+def gemini_make_google_queries(languages, frameworks, repo_name=None, repo_description=None, top_k=6, regenerate=False):
     """
     Use Gemini to generate good search queries (3-6 words) to find official docs, tutorials, and blog posts
     relevant to the repo. Returns (queries:list, description: str)
@@ -1333,9 +3481,7 @@ that will find official documentation pages, high-quality blog posts, and tutori
 Return a JSON object: {{ "queries": [ ... ], "notes": "brief note" }} and nothing else.
 """
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        text = resp.text.strip()
+        text = gemini_generate_text(prompt, regenerate=regenerate).strip()
         s = text.find("{")
         e = text.rfind("}")
         if s != -1 and e != -1:
@@ -1360,6 +3506,126 @@ Return a JSON object: {{ "queries": [ ... ], "notes": "brief note" }} and nothin
             seen.append(q)
     return seen[:top_k], "Fallback queries generated"
 
+# -------------------------
+# Google Custom Search: shared query -> results cache and parallel fan-out
+# -------------------------
+CUSTOM_SEARCH_CACHE_TTL = int(os.getenv("CUSTOM_SEARCH_CACHE_TTL", str(24 * 3600)))  # seconds results are reused
+CUSTOM_SEARCH_NEGATIVE_TTL = int(os.getenv("CUSTOM_SEARCH_NEGATIVE_TTL", "300"))  # seconds a rejected query is not retried
+# 403 reasons that clear on their own; other 4xx (bad query, bad key, daily quota spent) are worth negative-caching
+CUSTOM_SEARCH_TRANSIENT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+CUSTOM_SEARCH_CONCURRENCY = int(os.getenv("CUSTOM_SEARCH_CONCURRENCY", "6"))
+CUSTOM_SEARCH_LATENCY_BUDGET = float(os.getenv("CUSTOM_SEARCH_LATENCY_BUDGET", "6"))  # seconds the route waits for searches
+CUSTOM_SEARCH_LRU_SIZE = int(os.getenv("CUSTOM_SEARCH_LRU_SIZE", "1024"))
+search_cache_collection = db["search_cache"]
+
+_search_cache = BoundedLRU(CUSTOM_SEARCH_LRU_SIZE)  # cache key -> {"items": [...], "error": str|None, "expiresAt": epoch}
+
+
+def _search_cache_key(query: str, num: int):
+    # identical queries from different users share one entry regardless of case/spacing
+    return f"{GOOGLE_SEARCH_CX}|{num}|{' '.join((query or '').lower().split())}"
+
+
+def _search_cache_get(key):
+    now = time.time()
+    entry = _search_cache.get(key)
+    if entry and entry["expiresAt"] > now:
+        return entry
+    try:
+        doc = search_cache_collection.find_one({"key": key}, {"_id": 0, "items": 1, "error": 1, "expiresAt": 1})
+    except Exception as e:
+        print("search cache read failed:", e)
+        return None
+    # the TTL monitor only runs once a minute, so check expiry explicitly
+    if doc and doc.get("expiresAt", 0) > now:
+        _search_cache[key] = doc
+        return doc
+    return None
+
+
+def _search_cache_put(key, items, error=None):
+    ttl = CUSTOM_SEARCH_NEGATIVE_TTL if error else CUSTOM_SEARCH_CACHE_TTL
+    entry = {"items": items, "error": error, "expiresAt": time.time() + ttl}
+    _search_cache[key] = entry
+    try:
+        search_cache_collection.update_one(
+            {"key": key},
+            {"$set": {**entry, "expireAt": datetime.utcfromtimestamp(entry["expiresAt"])}},
+            upsert=True
+        )
+    except Exception as e:
+        print("search cache write failed:", e)
+
+
+def _custom_search_error_is_final(resp):
+    if not 400 <= resp.status_code < 500 or resp.status_code in (408, 429):
+        return False
+    return _google_error_reason(resp) not in CUSTOM_SEARCH_TRANSIENT_REASONS
+
+
+def custom_search(query: str, num: int = 5, timeout: float = 8, retries: int = None):
+    """
+    Returns Custom Search items [{title, link, snippet}] for a query, served from the shared cache when
+    possible. Deterministic 4xx rejections are cached for CUSTOM_SEARCH_NEGATIVE_TTL so such a query is not
+    re-sent on every request (the daily quota is shared by all users); 429, 5xx and network errors are not.
+    """
+    key = _search_cache_key(query, num)
+    cached = _search_cache_get(key)
+    if cached:
+        return cached.get("items") or []
+    try:
+        url = "https://www.googleapis.com/customsearch/v1"
+        params = {"key": CUSTOM_SEARCH_API_KEY, "cx": GOOGLE_SEARCH_CX, "q": query, "num": num}
+        r = http_get(url, params=params, timeout=timeout, retries=retries)
+        if r.status_code != 200:
+            print("customsearch error", r.status_code, r.text)
+            if _custom_search_error_is_final(r):
+                _search_cache_put(key, [], error=f"{r.status_code}")
+            return []
+        items = [{"title": it.get("title"), "link": it.get("link"), "snippet": it.get("snippet")}
+                 for it in r.json().get("items", [])]
+    except Exception as e:
+        print("customsearch request failed", e)
+        return []
+    _search_cache_put(key, items)
+    return items
+
+
+def custom_search_many(queries, num=5, budget=CUSTOM_SEARCH_LATENCY_BUDGET):
+    """
+    Runs custom_search for all queries in parallel and returns {query: items} for the searches that
+    finished within `budget` seconds; slower ones are left out of this response.
+    No search outlives the budget: each one gets the remaining budget as its timeout and no retries, and
+    searches that have not started by then are cancelled, so nothing spends quota after the response.
+    """
+    results = {}
+    if not queries:
+        return results
+    deadline = time.monotonic() + budget
+
+    def search(query):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return custom_search(query, num, timeout=min(8, remaining), retries=0)
+
+    pool = ThreadPoolExecutor(max_workers=min(CUSTOM_SEARCH_CONCURRENCY, len(queries)))
+    futures = {pool.submit(search, q): q for q in queries}
+    try:
+        done, _ = wait(futures, timeout=budget)
+        for fut in done:
+            try:
+                items = fut.result()
+            except Exception as e:
+                print("customsearch request failed", e)
+                continue
+            if items is not None:
+                results[futures[fut]] = items
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
 @app.route("/api/google/suggestions", methods=["POST"])
 def google_suggestions():
     """
@@ -1375,38 +3641,24 @@ def google_suggestions():
     repo_description = body.get("description")
 
     try:
-        queries, notes = gemini_make_google_queries(languages, frameworks, repo_name, repo_description)
+        queries, notes = gemini_make_google_queries(languages, frameworks, repo_name, repo_description,
+                                                    regenerate=bool(body.get("regenerate")))
     except Exception as e:
         print("gemini google queries failed:", e)
         queries, notes = [], ""
 
     results = []
     if GOOGLE_SEARCH_CX and queries:
-        # call Google Custom Search JSON API for each query
+        # call Google Custom Search JSON API for all queries in parallel (cached per query)
+        by_query = custom_search_many(queries)
         for q in queries:
-            try:
-                url = "https://www.googleapis.com/customsearch/v1"
-                params = {"key": CUSTOM_SEARCH_API_KEY, "cx": GOOGLE_SEARCH_CX, "q": q, "num": 5}
-                r = requests.get(url, params=params, timeout=8)
-                if r.status_code != 200:
-                    print("customsearch error", r.status_code, r.text)
-                    continue
-                data = r.json()
-                for item in data.get("items", []):
-                    results.append({
-                        "title": item.get("title"),
-                        "link": item.get("link"),
-                        "snippet": item.get("snippet"),
-                        "queryMatched": q
-                    })
-                    # limit total results to ~20
-                    if len(results) >= 20:
-                        break
+            for item in by_query.get(q, []):
+                results.append({**item, "queryMatched": q})
+                # limit total results to ~20
                 if len(results) >= 20:
                     break
-            except Exception as e:
-                print("customsearch request failed", e)
-                continue
+            if len(results) >= 20:
+                break
 
     # If CX not present, return queries only (client can show them)
     return jsonify({
@@ -1417,19 +3669,76 @@ def google_suggestions():
     }), 200
 
 
+DRIVE_UPLOAD_CONCURRENCY = int(os.getenv("DRIVE_UPLOAD_CONCURRENCY", "6"))
+DRIVE_UPLOAD_RETRIES = 3
+DRIVE_MAX_FILES = 50
+DRIVE_RETRYABLE_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "backendError", "internalError")
+
+
+def _drive_generate_ids(headers, count: int):
+    """Pre-allocates Drive file ids (one call for up to 1000) so upload retries can't create duplicates."""
+    try:
+        r = http_get("https://www.googleapis.com/drive/v3/files/generateIds", headers=headers,
+                     params={"count": count, "space": "drive"}, timeout=10)
+        if r.status_code == 200:
+            return r.json().get("ids") or []
+        print("Drive generateIds failed:", r.status_code, r.text)
+    except requests.exceptions.RequestException as e:
+        print("Drive generateIds failed:", e)
+    return []
+
+
+def _drive_upload_text_file(access_token: str, folder_id: str, name: str, content: str, file_id: str = None):
+    """One multipart upload of a small text file. Returns (ok, file_or_error, retryable)."""
+    boundary = "-------driveUploadBoundary"
+    metadata = {"name": name, "parents": [folder_id], "mimeType": "text/plain"}
+    if file_id:
+        metadata["id"] = file_id
+    body = (
+        f"--{boundary}\r\n"
+        "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+        f"{json.dumps(metadata)}\r\n"
+        f"--{boundary}\r\n"
+        "Content-Type: text/plain; charset=UTF-8\r\n\r\n"
+        f"{content}\r\n"
+        f"--{boundary}--\r\n"
+    ).encode("utf-8")
+    up_headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": f"multipart/related; boundary={boundary}"
+    }
+    up_url = "https://www.googleapis.com/upload/drive/v3/files?uploadType=multipart"
+    try:
+        # retried per file by the caller; with a pre-generated id a repeated upload is harmless
+        ur = http_post(up_url, headers=up_headers, data=body, timeout=20, retries=0)
+    except requests.exceptions.RequestException as e:
+        return False, {"reason": "connection_error", "detail": str(e)}, bool(file_id)
+    if ur.status_code in (200, 201):
+        return True, ur.json(), False
+    if ur.status_code == 409 and file_id:
+        # an earlier attempt with this id was stored but its response was lost
+        return True, {"id": file_id, "name": name, "mimeType": "text/plain"}, False
+    reason = _google_error_reason(ur)
+    rate_limited = ur.status_code == 429 or reason in ("rateLimitExceeded", "userRateLimitExceeded")
+    transient = ur.status_code >= 500 or reason in DRIVE_RETRYABLE_REASONS
+    return False, {"status": ur.status_code, "reason": reason, "detail": ur.text[:300]}, rate_limited or (transient and bool(file_id))
+
+
 def _drive_create_folder_and_files(access_token: str, folder_name: str, items: list):
     """
     - access_token: user's google OAuth token (Drive access)
     - folder_name: name for the folder
     - items: list of { title, link, snippet } to store as small .txt files in folder
-    Returns: (folder_id, files_created:list)
+    Files are uploaded on a bounded pool (DRIVE_UPLOAD_CONCURRENCY); failed uploads are retried per file.
+    Returns: (folder_id, files_created:list, results:list) where results has one
+    { name, status: created|failed, attempts, id?, error? } per item, in item order.
     """
     headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json"}
 
     # 1) create folder
     print("Creating Drive folder:", folder_name)
     meta = {"name": folder_name, "mimeType": "application/vnd.google-apps.folder"}
-    r = requests.post("https://www.googleapis.com/drive/v3/files", headers={**headers, "Content-Type": "application/json"}, json=meta, timeout=10)
+    r = http_post("https://www.googleapis.com/drive/v3/files", headers={**headers, "Content-Type": "application/json"}, json=meta, timeout=10)
     print("Drive folder creation response:", r.status_code, r.text)
     if r.status_code not in (200, 201):
         # surface Google's error for debugging / re-consent detection
@@ -1437,37 +3746,35 @@ def _drive_create_folder_and_files(access_token: str, folder_name: str, items: l
     folder = r.json()
     folder_id = folder.get("id")
 
-    files_created = []
-    # 2) upload each item as a small .txt file into the folder using multipart upload
-    for idx, it in enumerate(items[:50]):  # safety: max 50 files
+    # 2) upload each item as a small .txt file into the folder (the batch endpoint does not take media uploads)
+    specs = []
+    for idx, it in enumerate(items[:DRIVE_MAX_FILES]):  # safety: max 50 files
         title = (it.get("title") or f"resource-{idx+1}").replace("/", "-")[:200]
-        name = f"{title}.txt"
-        content = f"{it.get('title','')}\n{it.get('link','')}\n\n{it.get('snippet','')}\n"
-        # prepare multipart body
-        boundary = "-------driveUploadBoundary"
-        metadata = {"name": name, "parents": [folder_id], "mimeType": "text/plain"}
-        body = (
-            f"--{boundary}\r\n"
-            "Content-Type: application/json; charset=UTF-8\r\n\r\n"
-            f"{json.dumps(metadata)}\r\n"
-            f"--{boundary}\r\n"
-            "Content-Type: text/plain; charset=UTF-8\r\n\r\n"
-            f"{content}\r\n"
-            f"--{boundary}--\r\n"
-        ).encode("utf-8")
-        up_headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": f"multipart/related; boundary={boundary}"
-        }
-        up_url = "https://www.googleapis.com/upload/drive/v3/files?uploadType=multipart"
-        ur = requests.post(up_url, headers=up_headers, data=body, timeout=20)
-        if ur.status_code in (200, 201):
-            created = ur.json()
+        specs.append({
+            "name": f"{title}.txt",
+            "content": f"{it.get('title','')}\n{it.get('link','')}\n\n{it.get('snippet','')}\n"
+        })
+    ids = _drive_generate_ids(headers, len(specs))
+    for spec, file_id in zip(specs, ids):
+        spec["id"] = file_id
+
+    def upload(idx):
+        spec = specs[idx]
+        return _drive_upload_text_file(access_token, folder_id, spec["name"], spec["content"], spec.get("id"))
+
+    outcome = run_in_retry_rounds(range(len(specs)), upload, DRIVE_UPLOAD_CONCURRENCY, DRIVE_UPLOAD_RETRIES)
+    files_created, results = [], []
+    for idx, spec in enumerate(specs):
+        o = outcome[idx]
+        if o["ok"]:
+            created = o["value"]
             files_created.append({"id": created.get("id"), "name": created.get("name"), "mimeType": created.get("mimeType")})
+            results.append({"name": spec["name"], "status": "created", "attempts": o["attempts"], "id": created.get("id")})
         else:
-            # try to continue but note the failure
-            print("Drive file upload failed:", ur.status_code, ur.text)
-    return folder_id, files_created
+            # keep going with the rest; the failure is reported per file
+            print("Drive file upload failed:", spec["name"], o["value"])
+            results.append({"name": spec["name"], "status": "failed", "attempts": o["attempts"], "error": o["value"]})
+    return folder_id, files_created, results
 
 
 @app.route("/api/google/create-folder", methods=["POST"])
@@ -1501,13 +3808,15 @@ def google_create_folder():
 
     # create folder and files
     try:
-        folder_id, created_files = _drive_create_folder_and_files(google_access_token, folder_name, items)
+        folder_id, created_files, results = _drive_create_folder_and_files(google_access_token, folder_name, items)
         folder_url = f"https://drive.google.com/drive/folders/{folder_id}"
         return jsonify({
             "success": True,
             "folderId": folder_id,
             "folderUrl": folder_url,
-            "files": created_files
+            "files": created_files,
+            "results": results,
+            "failed": sum(1 for res in results if res["status"] == "failed")
         }), 201
     except Exception as e:
         # if Google reports insufficient scope, surface hint to re-consent
@@ -1523,12 +3832,7 @@ def google_create_folder():
 
 # --- BACKEND: new helper + route (insert into your server file) ---
 
-def gemini_generate_project_document(repo_details):
-    """
-    Use Gemini to generate a detailed, multi-section project document.
-    Returns: (title: str, content: str) where content is plain text (markdown-style sections).
-    """
-
+def _project_document_prompt(repo_details):
     # Build a plain string prompt (avoid embedding JSON braces inside Python format placeholders)
     name = repo_details.get("name", "")
     description = repo_details.get("description", "")
@@ -1537,7 +3841,12 @@ def gemini_generate_project_document(repo_details):
     commits = repo_details.get("commits") or []
 
     # Compose commit summary (most recent few messages)
-    recent_commits = "\n".join([f"- {c.get('date','?')}: {c.get('message','')}" for c in (commits[:6] if commits else [])])
+    fitted = fit_prompt_sections("project_document", [
+        {"name": "description", "items": [description or ""], "priority": 0, "max_tokens": 300},
+        {"name": "commits", "items": [f"- {c.get('date','?')}: {c.get('message','')}" for c in commits[:6]], "priority": 1, "separator": "\n"},
+    ])
+    description = fitted["description"]
+    recent_commits = fitted["commits"]
 
     prompt = (
         "You are an expert technical writer and engineer. Produce a detailed, polished project document "
@@ -1556,11 +3865,18 @@ def gemini_generate_project_document(repo_details):
         f"Recent commits (if any):\n{recent_commits}\n\n"
         "JSON:"
     )
+    log_prompt_tokens("project_document", prompt)
+    return prompt
+
 
+def _project_document_from_text(repo_details, text):
+    """Parses the model output into (title, content); text=None (generation failed) gives the overview fallback."""
+    if text is None:
+        return (f"{repo_details.get('name') or 'Project'} — Overview", repo_details.get('description') or "")
+    name = repo_details.get("name", "")
+    description = repo_details.get("description", "")
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        text = resp.text.strip()
+        text = (text or "").strip()
         text = text.replace("*", " ")
         # robustly extract the first JSON object found
         start = text.find("{")
@@ -1586,6 +3902,47 @@ def gemini_generate_project_document(repo_details):
         print("gemini_generate_project_document error:", e)
         return (f"{repo_details.get('name') or 'Project'} — Overview", repo_details.get('description') or "")
 
+
+def gemini_generate_project_document(repo_details, regenerate=False):
+    """
+    Use Gemini to generate a detailed, multi-section project document.
+    Returns: (title: str, content: str) where content is plain text (markdown-style sections).
+    """
+    try:
+        text = gemini_generate_text(_project_document_prompt(repo_details), regenerate=regenerate)
+    except Exception as e:
+        print("gemini_generate_project_document error:", e)
+        text = None
+    return _project_document_from_text(repo_details, text)
+
+
+@app.route("/api/google/project-document", methods=["POST"])
+def google_project_document_preview():
+    """
+    POST { loginId?, repoName, regenerate?, stream? }
+    Returns { title, content } of the generated project document without creating a Doc, or with
+    stream=true an NDJSON/SSE event stream whose final "done" event carries { title, content }.
+    A completed generation is cached, so a following /api/google/create-doc-and-share reuses it.
+    """
+    body = request.get_json() or {}
+    login_id = body.get("loginId")
+    repo_name = body.get("repoName")
+    if not repo_name:
+        return jsonify({"error": "repoName required"}), 400
+    regenerate = bool(body.get("regenerate"))
+    if body.get("stream"):
+        def prepare():
+            repo_details = fetch_local_repo_details(login_id, repo_name)
+
+            def finish(text):
+                title, content = _project_document_from_text(repo_details, text)
+                return {"title": title, "content": content}
+            return _project_document_prompt(repo_details), finish
+        return event_stream_response(stream_gemini_generation(prepare, regenerate=regenerate))
+    repo_details = fetch_local_repo_details(login_id, repo_name)
+    title, content = gemini_generate_project_document(repo_details, regenerate=regenerate)
+    return jsonify({"title": title, "content": content}), 200
+
 def create_google_doc(access_token: str, title: str):
     """
     Creates a Google Doc with the given title. Returns (documentId, documentUrl) or raises.
@@ -1594,7 +3951,7 @@ def create_google_doc(access_token: str, title: str):
     url = "https://docs.googleapis.com/v1/documents"
     headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
     payload = {"title": title}
-    r = requests.post(url, headers=headers, json=payload, timeout=10)
+    r = http_post(url, headers=headers, json=payload, timeout=10)
     if r.status_code not in (200, 201):
         raise Exception(f"Failed to create doc: {r.status_code} {r.text}")
     d = r.json()
@@ -1604,42 +3961,79 @@ def create_google_doc(access_token: str, title: str):
     doc_url = f"https://docs.google.com/document/d/{doc_id}/edit"
     return doc_id, doc_url
 
-def write_doc_content(access_token: str, document_id: str, content: str):
-    """
-    Writes plain text content into the document using the Docs batchUpdate API.
-    Requires https://www.googleapis.com/auth/documents scope.
-    """
-    url = f"https://docs.googleapis.com/v1/documents/{document_id}:batchUpdate"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    # Insert text at index 1 (document has initial body). This is simple but effective for most uses.
-    requests_payload = {
-        "requests": [
-            {"insertText": {"location": {"index": 1}, "text": content}}
-        ]
-    }
-    r = requests.post(url, headers=headers, json=requests_payload, timeout=12)
-    if r.status_code not in (200, 201):
-        raise Exception(f"Failed to write doc content: {r.status_code} {r.text}")
-    return r.json()
+DRIVE_SHARE_RETRIES = 2
+DRIVE_WRITE_ROLES = ("owner", "organizer", "fileOrganizer", "writer")
+
+
+def _drive_existing_permissions(headers, file_id: str):
+    """Returns {email (lowercased): role} for the user/group permissions already on the file."""
+    existing = {}
+    params = {"fields": "nextPageToken,permissions(emailAddress,role,type)", "pageSize": 100, "supportsAllDrives": "true"}
+    while True:
+        r = http_get(f"https://www.googleapis.com/drive/v3/files/{file_id}/permissions", headers=headers, params=params, timeout=10)
+        if r.status_code != 200:
+            raise Exception(f"Drive permissions.list failed: {r.status_code} {r.text[:300]}")
+        data = r.json()
+        for perm in data.get("permissions") or []:
+            if perm.get("emailAddress"):
+                existing[perm["emailAddress"].lower()] = perm.get("role")
+        if not data.get("nextPageToken"):
+            return existing
+        params["pageToken"] = data["nextPageToken"]
+
+
+def _drive_share_retryable(status: int, payload):
+    # sharingRateLimitExceeded (too many notification emails) does not clear within a request's lifetime
+    return status == 0 or status == 429 or status >= 500 or _google_error_payload_reason(payload) in DRIVE_RETRYABLE_REASONS
+
+
+def _drive_create_permission(headers, file_id: str, params: dict, email: str):
+    """One permissions.create for `email`; returns (status, payload), status 0 on a connection error."""
+    body = {"role": "writer", "type": "user", "emailAddress": email}
+    try:
+        r = http_post(f"https://www.googleapis.com/drive/v3/files/{file_id}/permissions",
+                      headers=headers, params=params, json=body, timeout=10, retries=0)
+    except requests.exceptions.RequestException as e:
+        return 0, {"error": str(e)}
+    try:
+        return r.status_code, r.json()
+    except Exception:
+        return r.status_code, r.text
+
 
 def share_file_with_emails(access_token: str, file_id: str, emails: list, send_notification=True):
     """
-    Create 'writer' permissions for each email on the Drive file.
+    Grant 'writer' on the Drive file to every email that doesn't already have write access.
+    One permissions.list call finds existing access; the remaining creates run one after another, because
+    Drive does not support concurrent permission changes on one file (parallel or batched creates can be
+    silently dropped, only the last one applied). Rate-limited and transient failures are retried with
+    backoff (a repeated create for the same user is harmless).
     Requires https://www.googleapis.com/auth/drive (or drive.file + documents?) and the Drive API enabled.
-    Returns a dict mapping email -> (status_code, response_text_or_json)
+    Returns a dict mapping email -> {"result": granted|already_shared|failed, "status", "response"}
     """
     results = {}
     headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    base = f"https://www.googleapis.com/drive/v3/files/{file_id}/permissions"
+    emails = list(dict.fromkeys(e.strip() for e in emails if e and e.strip()))
+    try:
+        existing = _drive_existing_permissions(headers, file_id)
+    except Exception as e:
+        print("Drive existing permissions lookup failed:", e)
+        existing = {}
+
+    params = {"sendNotificationEmail": "true" if send_notification else "false", "fields": "id,emailAddress,role"}
     for email in emails:
-        body = {"role": "writer", "type": "user", "emailAddress": email}
-        params = {"sendNotificationEmail": "true" if send_notification else "false"}
-        r = requests.post(base, headers=headers, params=params, json=body, timeout=10)
-        try:
-            parsed = r.json()
-        except Exception:
-            parsed = r.text
-        results[email] = {"status": r.status_code, "response": parsed}
+        role = existing.get(email.lower())
+        if role in DRIVE_WRITE_ROLES:
+            results[email] = {"result": "already_shared", "status": None, "response": {"role": role}}
+            continue
+        for attempt in range(DRIVE_SHARE_RETRIES + 1):
+            if attempt:
+                time.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt)))
+            status, payload = _drive_create_permission(headers, file_id, params, email)
+            if status in (200, 201) or not _drive_share_retryable(status, payload):
+                break
+        ok = status in (200, 201)
+        results[email] = {"result": "granted" if ok else "failed", "status": status, "response": payload}
     return results
 
 
@@ -1680,216 +4074,354 @@ def try_parse_title_and_content_from_json_blob(maybe_json_str):
             return None
     return None
 
-def _split_into_blocks_from_markdown(md_text):
-    """
-    Very small Markdown-ish parser that yields blocks:
-      - {'type': 'heading', 'level': n, 'text': '...'}
-      - {'type': 'paragraph', 'text': '...'}
-      - {'type': 'list', 'style': 'bulleted'|'numbered', 'items': [...]}
-      - {'type': 'code', 'text': '...'}
-    """
-    lines = md_text.splitlines()
-    i = 0
-    blocks = []
-
-    while i < len(lines):
-        line = lines[i]
-
-        # code fence
-        if line.strip().startswith("```"):
-            lang = line.strip()[3:].strip()
-            i += 1
-            code_lines = []
-            while i < len(lines) and not lines[i].strip().startswith("```"):
-                code_lines.append(lines[i])
-                i += 1
-            # skip closing fence
-            if i < len(lines) and lines[i].strip().startswith("```"):
-                i += 1
-            blocks.append({"type": "code", "text": "\n".join(code_lines), "lang": lang})
-            continue
+# -------------------------
+# Markdown -> Google Docs request compiler
+# -------------------------
+# Docs body indexes count UTF-16 code units, so every offset here is measured in that space
+# (an emoji is 2 units, not 1). The compiler emits one insertText for the whole document followed by
+# style requests over ranges of that text; style requests never shift indexes, so their order is free.
+_MD_LINE_RE = re.compile(
+    r"^(?:"
+    r"(?P<fence>\s*```)(?P<lang>.*)"
+    r"|(?P<hashes>#{1,6})\s+(?P<heading>.*)"
+    r"|(?P<rule>\s*(?:(?:-\s*){3,}|(?:\*\s*){3,}|(?:_\s*){3,}))"
+    r"|\s*[-*+]\s+(?P<bullet>.*)"
+    # a list marker is at most 3 digits and needs content, so "2024. was a good year" stays a paragraph
+    r"|\s*\d{1,3}[.)]\s+(?P<number>\S.*)"
+    r"|(?P<blank>\s*)"
+    r"|(?P<text>.+)"
+    r")$"
+)
+# underscore emphasis only opens/closes at a word boundary, never inside a path, attribute or call, and never
+# on a dunder name, so identifiers like __init__, snake_case_name and pkg/__init__.py stay literal
+_MD_UNDERSCORE_OPEN = r"(?<![\w./\\])(?!__[a-z][a-z0-9_]*__)"
+_MD_UNDERSCORE_CLOSE = r"(?![\w(]|\.\w)"
+_MD_INLINE_RE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\*\*(?P<bold>\S(?:.*?\S)?)\*\*"
+    r"|" + _MD_UNDERSCORE_OPEN + r"__(?P<bold_>\S(?:.*?\S)?)__" + _MD_UNDERSCORE_CLOSE +
+    r"|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\)"
+    r"|(?<![\w*])\*(?P<italic>\S(?:[^*\n]*?\S)?)\*(?![\w*])"
+    r"|" + _MD_UNDERSCORE_OPEN + r"(?<!_)_(?P<italic_>\S(?:[^_\n]*?\S)?)_(?!_)" + _MD_UNDERSCORE_CLOSE
+)
+_MD_INLINE_HINT_RE = re.compile(r"[*_`\[]")
+# characters the Docs API rejects in insertText
+_DOCS_INVALID_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_DOCS_LINK_SCHEMES = ("http://", "https://", "mailto:")
+DOCS_CODE_FONT = "Courier New"
+
+
+def utf16_len(text: str) -> int:
+    """Length of text in UTF-16 code units, the unit of Google Docs indexes."""
+    return len(text) if text.isascii() else len(text.encode("utf-16-le")) // 2
+
+
+def _markdown_inline_segments(text, styles=()):
+    """Yields (text, styles, link_url) runs for one line of inline markdown; styles is a tuple of bold/italic/code."""
+    pos = 0
+    for m in _MD_INLINE_RE.finditer(text):
+        if m.start() > pos:
+            yield text[pos:m.start()], styles, None
+        kind = m.lastgroup
+        if kind == "code":
+            yield m.group("code"), styles + ("code",), None
+        elif kind == "link_url":
+            url = m.group("link_url")
+            for seg, seg_styles, _ in _markdown_inline_segments(m.group("link_text"), styles):
+                # relative links would make the whole batchUpdate fail, so they stay plain text
+                yield seg, seg_styles, url if url.lower().startswith(_DOCS_LINK_SCHEMES) else None
+        else:
+            yield from _markdown_inline_segments(m.group(kind), styles + ("bold",) if kind.startswith("bold") else styles + ("italic",))
+        pos = m.end()
+    if pos < len(text):
+        yield text[pos:], styles, None
 
-        # headings (#, ##, ###)
-        m = re.match(r'^(#{1,6})\s+(.*)$', line)
-        if m:
-            level = len(m.group(1))
-            text = m.group(2).strip()
-            blocks.append({"type": "heading", "level": level, "text": text})
-            i += 1
-            continue
 
-        # lists (bulleted or numbered)
-        m_bullet = re.match(r'^\s*[-*]\s+(.*)$', line)
-        m_number = re.match(r'^\s*\d+\.\s+(.*)$', line)
-        if m_bullet or m_number:
-            items = []
-            style = "bulleted" if m_bullet else "numbered"
-            while i < len(lines):
-                lb = lines[i]
-                mb = re.match(r'^\s*[-*]\s+(.*)$', lb)
-                mn = re.match(r'^\s*\d+\.\s+(.*)$', lb)
-                if mb:
-                    items.append(mb.group(1).rstrip())
-                    i += 1
-                elif mn:
-                    items.append(mn.group(1).rstrip())
-                    i += 1
-                else:
-                    break
-            blocks.append({"type": "list", "style": style, "items": items})
+def compile_markdown_to_docs(md_text, title=None, start_index=1):
+    """
+    Compiles markdown into (text, style_requests) for documents.batchUpdate in one pass over the lines.
+    text is inserted at start_index; style_requests address ranges of it in UTF-16 units.
+    Supports headings, paragraphs, bulleted/numbered lists, fenced code, rules and inline
+    **bold**, *italic*, `code` and [links](https://...).
+    """
+    pieces = []
+    pos = start_index
+    paragraph_styles = []  # (start, end, namedStyleType)
+    bullets = []  # (start, end, preset)
+    code_blocks = []  # [start, end] paragraphs to indent
+    text_ranges = {"bold": [], "italic": [], "code": []}
+    links = []  # (start, end, url)
+
+    def add_range(ranges, start, end):
+        if end <= start:
+            return
+        if ranges and ranges[-1][1] >= start:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    def put(text):
+        nonlocal pos
+        start = pos
+        pieces.append(text)
+        pos += utf16_len(text)
+        return start
+
+    def put_inline(text):
+        start = pos
+        if not _MD_INLINE_HINT_RE.search(text):  # most lines carry no inline markup
+            put(text)
+            return start
+        for seg, styles, url in _markdown_inline_segments(text):
+            seg_start = put(seg)
+            for style in styles:
+                add_range(text_ranges[style], seg_start, pos)
+            if url:
+                links.append((seg_start, pos, url))
+        return start
+
+    def put_paragraph(text, named=None):
+        start = put_inline(text)
+        put("\n")
+        if named:
+            paragraph_styles.append((start, pos, named))
+        return start
+
+    lines = _DOCS_INVALID_CHARS_RE.sub("", md_text or "").splitlines()
+    if title and title.strip():
+        put_paragraph(title.strip(), "TITLE")
+        put("\n")
+
+    list_start = list_preset = None
+    para = []
+    code = None  # lines of the open fenced block
+
+    def close_paragraph():
+        if para:
+            put_paragraph("\n".join(para))
+            put("\n")
+            para.clear()
+
+    def close_list():
+        nonlocal list_start, list_preset
+        if list_start is not None:
+            bullets.append((list_start, pos, list_preset))
+            list_start = list_preset = None
+
+    for line in lines:
+        if code is not None:
+            if line.lstrip().startswith("```"):
+                if code:
+                    start = put("\n".join(code) + "\n")
+                    code_blocks.append([start, pos])
+                    add_range(text_ranges["code"], start, pos - 1)
+                put("\n")
+                code = None
+            else:
+                code.append(line.rstrip())
             continue
 
-        # blank line
-        if line.strip() == "":
-            i += 1
+        m = _MD_LINE_RE.match(line)
+        bullet, number = m.group("bullet"), m.group("number")
+        if bullet is not None or number is not None:
+            close_paragraph()
+            preset = "BULLET_DISC_CIRCLE_SQUARE" if bullet is not None else "NUMBERED_DECIMAL_ALPHA_ROMAN"
+            if list_preset != preset:
+                close_list()
+                list_start, list_preset = pos, preset
+            put_paragraph((bullet if bullet is not None else number).strip())
             continue
+        close_list()
+        if m.group("fence") is not None:
+            close_paragraph()
+            code = []
+        elif m.group("hashes") is not None:
+            close_paragraph()
+            level = len(m.group("hashes"))
+            heading = m.group("heading").strip().rstrip("#").strip()
+            if heading:
+                put_paragraph(heading, f"HEADING_{level}")
+        elif m.group("rule") is not None or m.group("blank") is not None:
+            close_paragraph()
+        else:
+            para.append(line.strip())
+    close_paragraph()
+    close_list()
+    if code:  # unterminated fence: keep the code
+        start = put("\n".join(code) + "\n")
+        code_blocks.append([start, pos])
+        add_range(text_ranges["code"], start, pos - 1)
 
-        # paragraph
-        para_lines = [line]
-        i += 1
-        while (
-            i < len(lines)
-            and lines[i].strip() != ""
-            and not re.match(r'^(#{1,6})\s+(.*)$', lines[i])
-            and not re.match(r'^\s*[-*]\s+(.*)$', lines[i])
-            and not re.match(r'^\s*\d+\.\s+(.*)$', lines[i])
-            and not lines[i].strip().startswith("```")
-        ):
-            para_lines.append(lines[i])
-            i += 1
-        blocks.append({"type": "paragraph", "text": "\n".join(para_lines).strip()})
-
-    return blocks
+    reqs = []
+    for start, end, named in paragraph_styles:
+        reqs.append({"updateParagraphStyle": {
+            "range": {"startIndex": start, "endIndex": end},
+            "paragraphStyle": {"namedStyleType": named},
+            "fields": "namedStyleType"
+        }})
+    for start, end in code_blocks:
+        reqs.append({"updateParagraphStyle": {
+            "range": {"startIndex": start, "endIndex": end},
+            "paragraphStyle": {"indentStart": {"magnitude": 18, "unit": "PT"}},
+            "fields": "indentStart"
+        }})
+    for start, end, preset in bullets:
+        reqs.append({"createParagraphBullets": {"range": {"startIndex": start, "endIndex": end}, "bulletPreset": preset}})
+    text_styles = {
+        "bold": ({"bold": True}, "bold"),
+        "italic": ({"italic": True}, "italic"),
+        "code": ({"weightedFontFamily": {"fontFamily": DOCS_CODE_FONT}}, "weightedFontFamily"),
+    }
+    for style, (text_style, fields) in text_styles.items():
+        for start, end in text_ranges[style]:
+            reqs.append({"updateTextStyle": {
+                "range": {"startIndex": start, "endIndex": end}, "textStyle": text_style, "fields": fields
+            }})
+    for start, end, url in links:
+        reqs.append({"updateTextStyle": {
+            "range": {"startIndex": start, "endIndex": end}, "textStyle": {"link": {"url": url}}, "fields": "link"
+        }})
+    return "".join(pieces), reqs
+
+
+DOCS_BATCH_MAX_BYTES = int(os.getenv("DOCS_BATCH_MAX_BYTES", str(200 * 1024)))  # JSON bytes per batchUpdate call
+DOCS_BATCH_MAX_REQUESTS = int(os.getenv("DOCS_BATCH_MAX_REQUESTS", "400"))
+DOCS_BATCH_TIMEOUT = 30
+DOCS_WRITE_RETRIES = 3  # per batch, for 5xx and connection errors (429 is retried by http_request)
+
+
+def _docs_text_pieces(text: str, max_bytes: int):
+    """Splits text into pieces on paragraph ends whose JSON encoding fits max_bytes; a longer paragraph is cut."""
+    piece, piece_bytes = [], 0
+    for para in text.splitlines(keepends=True):
+        size = len(json.dumps(para)) - 2
+        if size > max_bytes:
+            if piece:
+                yield "".join(piece)
+                piece, piece_bytes = [], 0
+            step = max(1, max_bytes // 12)  # 😀 is the worst case: 12 bytes per code point
+            for i in range(0, len(para), step):
+                yield para[i:i + step]
+            continue
+        if piece and piece_bytes + size > max_bytes:
+            yield "".join(piece)
+            piece, piece_bytes = [], 0
+        piece.append(para)
+        piece_bytes += size
+    if piece:
+        yield "".join(piece)
 
 
-def build_docs_requests_from_markdown(md_text):
+def plan_docs_batches(text: str, style_reqs, start_index=1, max_bytes=DOCS_BATCH_MAX_BYTES, max_requests=DOCS_BATCH_MAX_REQUESTS):
     """
-    Returns a list of docs API 'requests' suitable for documents.batchUpdate.
+    Splits one large write into ordered documents.batchUpdate calls of at most max_bytes / max_requests.
+    All text is inserted first, each piece appended after the previous one, then the style requests
+    follow; styles are applied only once every index they address exists, and inserted text never
+    inherits a style meant for its neighbour.
+    Returns [{"requests": [...], "units": UTF-16 units the batch inserts}].
     """
-    blocks = _split_into_blocks_from_markdown(md_text)
-    reqs = []
-    current_index = 1  # insert at doc start
-
-    for block in blocks:
-        if block["type"] == "heading":
-            heading_text = block["text"].rstrip() + "\n"
-            reqs.append({"insertText": {"location": {"index": current_index}, "text": heading_text}})
-            start, end = current_index, current_index + len(heading_text)
-            if block["level"] <= 2:
-                named = "HEADING_1" if block["level"] == 1 else "HEADING_2"
-            elif block["level"] == 3:
-                named = "HEADING_3"
-            else:
-                named = "NORMAL_TEXT"
-            reqs.append({
-                "updateParagraphStyle": {
-                    "range": {"startIndex": start, "endIndex": end},
-                    "paragraphStyle": {"namedStyleType": named},
-                    "fields": "namedStyleType"
-                }
-            })
-            current_index = end
-
-        elif block["type"] == "paragraph":
-            para_text = block["text"].rstrip() + "\n\n"
-            reqs.append({"insertText": {"location": {"index": current_index}, "text": para_text}})
-            current_index += len(para_text)
-
-        elif block["type"] == "code":
-            code_text = block["text"].rstrip() + "\n\n"
-            reqs.append({"insertText": {"location": {"index": current_index}, "text": code_text}})
-            start, end = current_index, current_index + len(code_text)
-            reqs.append({
-                "updateTextStyle": {
-                    "range": {"startIndex": start, "endIndex": end},
-                    "textStyle": {"weightedFontFamily": {"fontFamily": "Courier New"}},
-                    "fields": "weightedFontFamily"
-                }
-            })
-            reqs.append({
-                "updateParagraphStyle": {
-                    "range": {"startIndex": start, "endIndex": end},
-                    "paragraphStyle": {"indentStart": {"magnitude": 18, "unit": "PT"}},
-                    "fields": "indentStart"
-                }
-            })
-            current_index = end
-
-        elif block["type"] == "list":
-            start_list_index = current_index
-            for it in block["items"]:
-                item_text = it.rstrip() + "\n"
-                reqs.append({"insertText": {"location": {"index": current_index}, "text": item_text}})
-                current_index += len(item_text)
-            end_list_index = current_index
-            preset = "NUMBERED_DECIMAL" if block.get("style") == "numbered" else "BULLET_DISC_CIRCLE"
-            reqs.append({
-                "createParagraphBullets": {
-                    "range": {"startIndex": start_list_index, "endIndex": end_list_index},
-                    "bulletPreset": preset
-                }
-            })
-
-    return reqs
+    batches = []
+    index = start_index
+    for piece in _docs_text_pieces(text or "", max_bytes - 200):  # room for the request envelope
+        units = utf16_len(piece)
+        batches.append({"requests": [{"insertText": {"location": {"index": index}, "text": piece}}], "units": units})
+        index += units
+
+    current, current_bytes = [], 0
+    for req in style_reqs or []:
+        size = len(json.dumps(req)) + 2
+        if current and (current_bytes + size > max_bytes or len(current) >= max_requests):
+            batches.append({"requests": current, "units": 0})
+            current, current_bytes = [], 0
+        current.append(req)
+        current_bytes += size
+    if current:
+        batches.append({"requests": current, "units": 0})
+    return batches
+
+
+def _docs_end_index(headers, document_id: str):
+    """End index of the document body, or None if it cannot be read."""
+    try:
+        r = http_get(f"https://docs.googleapis.com/v1/documents/{document_id}", headers=headers,
+                     params={"fields": "body.content(endIndex)"}, timeout=10)
+        if r.status_code != 200:
+            return None
+        return max((c.get("endIndex") or 0 for c in r.json().get("body", {}).get("content", [])), default=None)
+    except Exception as e:
+        print("docs end index read failed:", e)
+        return None
 
 
-def write_doc_content_formatted(access_token: str, document_id: str, raw_content: str, title: str = None):
+def docs_batch_update_chunked(access_token: str, document_id: str, text: str, style_reqs=None, start_index=1,
+                              on_progress=None, max_bytes=DOCS_BATCH_MAX_BYTES, max_requests=DOCS_BATCH_MAX_REQUESTS):
     """
-    Build requests from markdown and push to Google Docs.
+    Writes text (inserted at start_index) and style_reqs to a document in size-bounded batches.
+    Each batch is atomic on Google's side, so a failed one is retried on its own (5xx, connection errors);
+    before retrying an insert the document length is checked, so a batch that was applied but whose
+    response was lost is not inserted twice.
+    on_progress(done, total) is called after every batch.
+    Returns {"batches", "requests", "retried"}; raises with the Google error once a batch runs out of retries.
     """
-    reqs = build_docs_requests_from_markdown(raw_content)
-
-    # Insert title at the very beginning
-    if title:
-        title_text = title.strip() + "\n\n"
-        reqs.insert(0, {
-            "insertText": {
-                "location": {"index": 1},
-                "text": title_text
-            }
-        })
-        reqs.insert(1, {
-            "updateParagraphStyle": {
-                "range": {"startIndex": 1, "endIndex": 1 + len(title_text)},
-                "paragraphStyle": {"namedStyleType": "HEADING_3"},
-                "fields": "namedStyleType"
-            }
-        })
-
-    if not reqs:
-        simple_text = (raw_content.strip() + "\n")
-        reqs = [{"insertText": {"location": {"index": 1}, "text": simple_text}}]
-
     url = f"https://docs.googleapis.com/v1/documents/{document_id}:batchUpdate"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    payload = {"requests": reqs}
-
-    resp = requests.post(url, headers=headers, json=payload)
-    if resp.status_code not in (200, 201):
-        print("Failed payload:", json.dumps(payload, indent=2))
-        raise Exception(f"Failed to write doc content: {resp.status_code} {resp.text}")
-    return resp.json()
-
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    batches = plan_docs_batches(text, style_reqs, start_index, max_bytes, max_requests)
+    # the document length before writing; only needed to tell a lost response from a failed insert
+    base_end = _docs_end_index(headers, document_id) if any(b["units"] for b in batches) else None
+    inserted = 0
+    retried = 0
+
+    for n, batch in enumerate(batches, start=1):
+        for attempt in range(DOCS_WRITE_RETRIES + 1):
+            resp = None
+            try:
+                resp = http_post(url, headers=headers, json={"requests": batch["requests"]}, timeout=DOCS_BATCH_TIMEOUT)
+                if resp.status_code in (200, 201):
+                    break
+                error = f"{resp.status_code} {resp.text}"
+                retryable = resp.status_code >= 500
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                error = str(ex)
+                retryable = True
+            failure = f"Failed to write doc content: {error} (batch {n}/{len(batches)})"
+            if not retryable or (batch["units"] and base_end is None):  # an insert we cannot verify is not repeated
+                print(f"Docs write failed on batch {n}/{len(batches)}:", error[:1000])
+                raise Exception(failure)
+            delay = _retry_after_seconds(resp) if resp is not None else None
+            time.sleep(min(HTTP_BACKOFF_MAX, delay if delay is not None else random.uniform(0, HTTP_BACKOFF_BASE * 2 ** attempt)))
+            if batch["units"] and _docs_end_index(headers, document_id) == base_end + inserted + batch["units"]:
+                break  # applied; only the response was lost
+            if attempt >= DOCS_WRITE_RETRIES:
+                print(f"Docs write failed on batch {n}/{len(batches)}:", error[:1000])
+                raise Exception(failure)
+            retried += 1
+        inserted += batch["units"]
+        if on_progress:
+            on_progress(n, len(batches))
+
+    return {"batches": len(batches), "requests": sum(len(b["requests"]) for b in batches), "retried": retried}
+
+
+def write_doc_content_formatted(access_token: str, document_id: str, raw_content: str, title: str = None, on_progress=None):
+    """
+    Compiles markdown (with an optional title) and writes it to the document in size-bounded batches.
+    on_progress(done, total) is called after every batch. Returns docs_batch_update_chunked's summary.
+    """
+    text, style_reqs = compile_markdown_to_docs(raw_content, title=title)
+    if not text:
+        return {"warning": "no content"}
+    return docs_batch_update_chunked(access_token, document_id, text, style_reqs, on_progress=on_progress)
 
 
 def requests_post_with_retry(url, headers=None, json=None, params=None, timeout=12, retries=1):
-    for attempt in range(retries + 1):
-        try:
-            return requests.post(url, headers=headers, params=params, json=json, timeout=timeout)
-        except requests.exceptions.RequestException as ex:
-            last_exc = ex
-            if attempt >= retries:
-                raise
-    raise last_exc
+    """POST that is also retried on 5xx/connection errors; only use it for requests safe to repeat."""
+    return http_post(url, headers=headers, params=params, json=json, timeout=timeout, retries=retries, idempotent=True)
 
 
 @app.route("/api/google/create-doc-and-share", methods=["POST"])
 def google_create_doc_and_share():
     """
-    Request body: { loginId, repoName }
+    Request body: { loginId, repoName, slackChannelId?, regenerate?, async? }
     Flow:
       - fetch repo details (local helper)
       - generate document (Gemini)
@@ -1897,75 +4429,80 @@ def google_create_doc_and_share():
       - create Google Doc + write content
       - fetch repo collaborators via GitHub outbound + map to emails in DB
       - share the doc with those emails (Drive permissions)
+      - optionally post the doc link to a Slack channel
+    With async: true returns 202 { jobId } and the result is read from /api/jobs/<id>.
     """
     body = request.get_json() or {}
+    if not body.get("loginId") or not body.get("repoName"):
+        return jsonify({"error": "loginId and repoName required"}), 400
+    return run_workflow_request("create_doc_and_share", body)
+
+
+@job_workflow("create_doc_and_share")
+def run_google_create_doc_and_share(body, job_id=None):
     login_id = body.get("loginId")
     repo_name = body.get("repoName")
-    if not login_id or not repo_name:
-        return jsonify({"error": "loginId and repoName required"}), 400
 
     # fetch repo details (local helper)
+    job_step(job_id, "repo_details")
     repo_details = fetch_local_repo_details(login_id, repo_name)
 
     # 1) generate large document content using Gemini
+    job_step(job_id, "generate_document")
     try:
-        title, content = gemini_generate_project_document(repo_details)
+        title, content = gemini_generate_project_document(repo_details, regenerate=bool(body.get("regenerate")))
        
     except Exception as e:
-        return jsonify({"error": "gemini_failed", "detail": str(e)}), 500
+        return 500, {"error": "gemini_failed", "detail": str(e)}
 
     # 2) get Google outbound token from Descope
+    job_step(job_id, "google_token")
     try:
         token_json = get_outbound_token(GOOGLE_DRIVE_OUTBOUND_APP_ID, login_id)
         google_access_token = extract_access_token(token_json)
         if not google_access_token:
-            return jsonify({"error": "no_google_access_token", "detail": token_json}), 500
+            return 500, {"error": "no_google_access_token", "detail": token_json}
     except Exception as e:
-        return jsonify({"error": "failed_to_get_google_token", "detail": str(e)}), 500
+        return 500, {"error": "failed_to_get_google_token", "detail": str(e)}
 
     # 3) create Google Doc
+    job_step(job_id, "create_doc")
     try:
         doc_id, doc_url = create_google_doc(google_access_token, title)
     except Exception as e:
         # detect insufficient scopes from Google error strings and normalize response
         emsg = str(e)
         if "insufficient" in emsg.lower() or "permission_denied" in emsg.lower() or "insufficientPermissions" in emsg:
-            return jsonify({"error": "google_insufficient_scope", "message": "Google token lacks required docs/drive scopes", "detail": emsg}), 403
-        return jsonify({"error": "create_doc_failed", "detail": emsg}), 500
+            return 403, {"error": "google_insufficient_scope", "message": "Google token lacks required docs/drive scopes", "detail": emsg}
+        return 500, {"error": "create_doc_failed", "detail": emsg}
 
+    job_step(job_id, "write_doc")
     try:
     # doc_id and doc_url were created with create_google_doc(...)
         print("Created doc:", doc_id, doc_url)
-        write_resp = write_doc_content_formatted(google_access_token, doc_id,title, content)
+        write_resp = write_doc_content_formatted(google_access_token, doc_id, content, title=title,
+                                                 on_progress=lambda done, total: job_progress(job_id, done, total, step="write_doc"))
     except Exception as e:
         emsg = str(e)
         if "insufficient" in emsg.lower() or "permission_denied" in emsg.lower():
-            return jsonify({"error": "google_insufficient_scope", "message": "Google token lacks required docs/drive scopes", "detail": emsg}), 403
-        return jsonify({"error": "write_doc_failed", "detail": emsg}), 500
+            return 403, {"error": "google_insufficient_scope", "message": "Google token lacks required docs/drive scopes", "detail": emsg}
+        return 500, {"error": "write_doc_failed", "detail": emsg}
 
     # 5) determine collaborator emails:
+    job_step(job_id, "collaborators")
     shared_emails = []
     try:
         # fetch GitHub collaborators via outbound token (requires github outbound)
         gh_token_json = get_outbound_token("github", login_id)
         gh_access_token = extract_access_token(gh_token_json)
         if gh_access_token:
-            owner_login, collaborators = fetch_github_user_and_collaborators(gh_access_token, repo_name)
-            collab_logins = [c.get("login") for c in (collaborators or []) if c.get("login")]
-            # look up emails in DB
-            if collab_logins:
-                docs = users_collection.find({"connectedAccounts.github.login": {"$in": collab_logins}})
-                for d in docs:
-                    em = d.get("email")
-                    if em:
-                        shared_emails.append(em)
+            shared_emails = collaborator_roster(gh_access_token, repo_name, login_id)["emails"]
     except Exception as ex:
         # non-fatal; we can still return docUrl and indicate that sharing failed/was skipped
         print("Warning: failed to fetch collaborator emails:", ex)
 
-    shared_emails = list(dict.fromkeys(shared_emails))  # dedupe
-
     # 6) share with collaborators (if any)
+    job_step(job_id, "share_doc")
     permission_results = {}
     if shared_emails:
         try:
@@ -1979,6 +4516,7 @@ def google_create_doc_and_share():
     slack_post_result = None
     slack_channel_id = body.get("slackChannelId") or body.get("channelId")
     if slack_channel_id:
+        job_step(job_id, "slack_post")
         try:
             # Obtain Slack access token via Descope outbound (SLACK_OUTBOUND_APP_ID)
             slack_token_json = get_outbound_token(SLACK_OUTBOUND_APP_ID, login_id)
@@ -2001,14 +4539,15 @@ def google_create_doc_and_share():
     # --- END Slack post integration ---
 
     # Finally, return the existing response plus slack_post_result
-    return jsonify({
+    return 200, {
         "success": True,
         "documentId": doc_id,
         "documentUrl": doc_url,
         "sharedWith": shared_emails,
         "permissionResults": permission_results,
         "slackPost": slack_post_result
-    }), 200
+    }
+
 
 def slack_post_message(slack_token: str, channel_id: str, text: str, blocks: list = None):
     """
@@ -2020,7 +4559,7 @@ def slack_post_message(slack_token: str, channel_id: str, text: str, blocks: lis
     body = {"channel": channel_id, "text": text}
     if blocks:
         body["blocks"] = blocks
-    r = requests.post(url, headers=headers, json=body, timeout=12)
+    r = http_post(url, headers=headers, json=body, timeout=12)
     try:
         return r.status_code, r.json()
     except Exception:
@@ -2054,41 +4593,19 @@ def _extract_first_json_block(text: str):
 # --- Helper: sample repository files (like you used elsewhere) ---
 def _sample_repo_code_for_analysis(access_token: str, owner: str, repo_name: str, max_files=8):
     """Return list of short file snippets useful for analysis"""
-    headers = {"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json", "User-Agent": "descope-demo-app"}
-    tree_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/trees/main?recursive=1"
-    r = requests.get(tree_url, headers=headers, timeout=10)
-    files = []
-    if r.status_code == 200:
-        tree = r.json().get("tree", [])
-        for item in tree:
-            if item.get("type") != "blob":
-                continue
-            path = item.get("path", "")
-            if any(path.endswith(s) for s in (".py", ".js", ".jsx", ".ts", ".tsx", ".md", ".java", ".go", ".rb", ".php", ".html", ".css", ".sh")):
-                # fetch content
-                file_url = f"https://api.github.com/repos/{owner}/{repo_name}/contents/{quote_plus(path)}"
-                fr = requests.get(file_url, headers=headers, timeout=8)
-                if fr.status_code == 200:
-                    fd = fr.json()
-                    content_b64 = fd.get("content") or ""
-                    try:
-                        snippet = base64.b64decode(content_b64).decode("utf-8", errors="ignore")
-                        # keep first N chars
-                        files.append({"path": path, "content": snippet[:1600]})
-                    except Exception:
-                        continue
-                if len(files) >= max_files:
-                    break
-    return files
+    sample = sample_repo_files(access_token, owner, repo_name, max_files=max_files)
+    return [{"path": f["path"], "content": f["content"]} for f in sample["files"]]
 
 # --- Gemini-based generator for feature ideas ---
-def _generate_feature_ideas_with_gemini(sample_files, repo_name: str, open_source: bool, top_k=8):
+def _generate_feature_ideas_with_gemini(sample_files, repo_name: str, open_source: bool, top_k=8, regenerate=False):
     """
     Given sampled files (list of {path, content}), ask Gemini to return JSON array of feature suggestions:
       [{ "title": "...", "description": "...", "labels": ["enhancement","docs"], "estimate": "2d" }, ...]
     Returns parsed list or fallback list of simple suggestions.
     """
-    sample_text = "\n\n".join([f"File: {f['path']}\n{f['content']}" for f in (sample_files or [])])
+    sample_text = fit_prompt_sections("feature_ideas", [
+        {"name": "files", "items": [f"File: {f['path']}\n{f['content']}" for f in (sample_files or [])]}
+    ])["files"]
     prompt = (
         "You are an expert engineering manager and product designer. Given the repository code snippets below, "
         "generate a prioritized list of practical, implementable feature ideas (not vague wishes) that would "
@@ -2098,10 +4615,9 @@ def _generate_feature_ideas_with_gemini(sample_files, repo_name: str, open_sourc
         '[{"title":"Add CI with GitHub Actions","description":"Add a GitHub Actions workflow that runs tests...","labels":["ci","automation"],"estimate":"1d"}, ...]\n\n'
         f"Repo name: {repo_name}\nOpen source: {open_source}\n\nCode samples:\n{sample_text}\n\nJSON:"
     )
+    log_prompt_tokens("feature_ideas", prompt)
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        text = (resp.text or "").strip()
+        text = gemini_generate_text(prompt, regenerate=regenerate).strip()
         parsed = _extract_first_json_block(text)
         if isinstance(parsed, list) and parsed:
             # normalize items
@@ -2154,10 +4670,7 @@ def github_features_generate():
 
     # identify owner/login (authenticated user)
     try:
-        user_resp = requests.get("https://api.github.com/user", headers={"Authorization": f"token {access_token}"}, timeout=8)
-        if user_resp.status_code != 200:
-            return jsonify({"error": "github_user_failed", "detail": user_resp.text}), 500
-        owner = user_resp.json().get("login")
+        owner = get_github_login(access_token, login_id)
     except Exception as e:
         return jsonify({"error": "github_user_failed", "detail": str(e)}), 500
 
@@ -2165,7 +4678,8 @@ def github_features_generate():
     sample_files = _sample_repo_code_for_analysis(access_token, owner, repo_name, max_files=8)
 
     # generate ideas with Gemini
-    features = _generate_feature_ideas_with_gemini(sample_files, repo_name, open_source, top_k=8)
+    features = _generate_feature_ideas_with_gemini(sample_files, repo_name, open_source, top_k=8,
+                                                   regenerate=bool(body.get("regenerate")))
 
     return jsonify({"features": features})
 
@@ -2183,7 +4697,7 @@ def _create_github_issues(access_token: str, owner: str, repo_name: str, issues:
         if it.get("labels"):
             payload["labels"] = it.get("labels")
         url = f"https://api.github.com/repos/{owner}/{repo_name}/issues"
-        r = requests.post(url, headers=headers, json=payload, timeout=12)
+        r = http_post(url, headers=headers, json=payload, timeout=12)
         if r.status_code in (200, 201):
             j = r.json()
             created.append({"title": payload["title"], "issueNumber": j.get("number"), "url": j.get("html_url")})
@@ -2213,10 +4727,10 @@ def github_features_create_issues():
         return jsonify({"error": "failed_to_get_github_token", "detail": str(e)}), 500
 
     # get owner login
-    user_resp = requests.get("https://api.github.com/user", headers={"Authorization": f"token {access_token}"}, timeout=8)
-    if user_resp.status_code != 200:
-        return jsonify({"error": "github_user_failed", "detail": user_resp.text}), 500
-    owner = user_resp.json().get("login")
+    try:
+        owner = get_github_login(access_token, login_id)
+    except Exception as e:
+        return jsonify({"error": "github_user_failed", "detail": str(e)}), 500
 
     # Create issues
     created, failed = _create_github_issues(access_token, owner, repo_name, issues)
@@ -2232,10 +4746,7 @@ def _get_github_owner_and_token(login_id):
     if not access_token:
         raise Exception(f"No github access token from Descope: {token_json}")
     # get user login
-    resp = requests.get("https://api.github.com/user", headers={"Authorization": f"token {access_token}"}, timeout=8)
-    if resp.status_code != 200:
-        raise Exception(f"GitHub user request failed: {resp.status_code} {resp.text}")
-    owner = resp.json().get("login")
+    owner = get_github_login(access_token, login_id)
     return owner, access_token
 
 
@@ -2258,7 +4769,7 @@ def github_readme_get():
 
     # Use the repo readme endpoint which finds README with different names
     url = f"https://api.github.com/repos/{owner}/{repo_name}/readme"
-    r = requests.get(url, headers={"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json"}, timeout=10)
+    r = http_get(url, headers={"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json"}, timeout=10)
     if r.status_code == 404:
         return jsonify({"exists": False})
     if r.status_code != 200:
@@ -2278,19 +4789,8 @@ def github_readme_get():
     })
 
 
-@app.route("/api/github/readme/suggest", methods=["POST"])
-def github_readme_suggest():
-    """
-    POST { loginId, repoName }
-    Returns: { suggested: "<markdown>" }
-    If loginId is missing or token retrieval fails, still uses _sample_repo_code_for_analysis fallback where possible.
-    """
-    body = request.get_json() or {}
-    login_id = body.get("loginId")
-    repo_name = body.get("repoName")
-    if not repo_name:
-        return jsonify({"error": "repoName required"}), 400
-
+def _readme_suggest_prompt(login_id, repo_name):
+    """Samples the repo (authenticated when possible) and builds the README generation prompt."""
     access_token = None
     owner = None
     try:
@@ -2305,32 +4805,15 @@ def github_readme_suggest():
     if access_token and owner:
         sample_files = _sample_repo_code_for_analysis(access_token, owner, repo_name, max_files=6)
     else:
-        # if unauthenticated, try unauthenticated repo content (best-effort)
-        try:
-            # try public repository's tree (best-effort, may 404)
-            tree_url = f"https://api.github.com/repos/{repo_name}/git/trees/main?recursive=1"
-            tr = requests.get(tree_url, timeout=8)
-            if tr.status_code == 200:
-                tree = tr.json().get("tree", [])
-                files = []
-                for item in tree:
-                    if item.get("type") != "blob":
-                        continue
-                    path = item.get("path", "")
-                    if any(path.endswith(s) for s in (".md", ".py", ".js", ".jsx", ".ts", ".tsx", ".html")):
-                        # attempt to fetch content via raw.githubusercontent
-                        raw_url = f"https://raw.githubusercontent.com/{repo_name}/main/{path}"
-                        fr = requests.get(raw_url, timeout=6)
-                        if fr.status_code == 200:
-                            files.append({"path": path, "content": fr.text[:1600]})
-                        if len(files) >= 4:
-                            break
-                sample_files = files
-        except Exception:
-            sample_files = []
+        # if unauthenticated, sample the public repository (best-effort, repoName given as "owner/repo")
+        if "/" in repo_name:
+            public_owner, public_repo = repo_name.split("/", 1)
+            sample_files = _sample_repo_code_for_analysis(None, public_owner, public_repo, max_files=6)
 
     # Build prompt for Gemini: ask for README.md in markdown with typical sections
-    sample_text = "\n\n".join([f"File: {f['path']}\n{f['content']}" for f in (sample_files or [])])
+    sample_text = fit_prompt_sections("readme_suggest", [
+        {"name": "files", "items": [f"File: {f['path']}\n{f['content']}" for f in (sample_files or [])]}
+    ])["files"]
     prompt = f"""
 You are an expert software engineer and technical writer. Given the repository name "{repo_name}" and the following code samples, write a concise, practical README.md in Markdown that a developer can read to understand the project, install and run it, see a simple usage example, run tests (if applicable), and contribute. Include sections where appropriate: Title, Short description (1-2 lines), Installation, Usage/Examples, Contributing, License (suggest MIT if unknown). Keep the README under ~1500-2000 words and produce valid Markdown only (no extra commentary). Do not add ```markdown blocks around the content; return raw markdown only. The readme should explain features and usage based on the code samples, but do not hallucinate features or details not inferable from the code. If the code is insufficient to determine usage, keep those sections brief and generic. Use GitHub-flavored markdown where appropriate. Do not explain the endpoints in detail.
 
@@ -2341,11 +4824,34 @@ Code samples (if any):
 
 README.md:
 """
+    log_prompt_tokens("readme_suggest", prompt)
+    return prompt
+
+
+@app.route("/api/github/readme/suggest", methods=["POST"])
+def github_readme_suggest():
+    """
+    POST { loginId, repoName, regenerate?, stream? }
+    Returns: { suggested: "<markdown>" }, or with stream=true an NDJSON/SSE event stream of markdown
+    deltas ending in {"done": true, "suggested": ...}.
+    If loginId is missing or token retrieval fails, still uses _sample_repo_code_for_analysis fallback where possible.
+    """
+    body = request.get_json() or {}
+    login_id = body.get("loginId")
+    repo_name = body.get("repoName")
+    if not repo_name:
+        return jsonify({"error": "repoName required"}), 400
+    regenerate = bool(body.get("regenerate"))
+
+    if body.get("stream"):
+        def prepare():
+            return _readme_suggest_prompt(login_id, repo_name), lambda text: {"suggested": (text or "No suggestion available.").strip()}
+        return event_stream_response(stream_gemini_generation(prepare, regenerate=regenerate))
+
+    prompt = _readme_suggest_prompt(login_id, repo_name)
     suggested = "No suggestion available."
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        suggested = (resp.text or "").strip()
+        suggested = gemini_generate_text(prompt, regenerate=regenerate).strip()
         # sanitize: ensure markdown-only
         # If Gemini returns extra commentary, take full text — client will render it as README.md
     except Exception as e:
@@ -2377,7 +4883,7 @@ def github_readme_apply():
 
     # Check if README exists to obtain sha for update
     readme_url = f"https://api.github.com/repos/{owner}/{repo_name}/readme"
-    r = requests.get(readme_url, headers={"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json"}, timeout=10)
+    r = http_get(readme_url, headers={"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json"}, timeout=10)
 
     sha = None
     path = "README.md"
@@ -2394,7 +4900,7 @@ def github_readme_apply():
     if sha:
         payload["sha"] = sha
 
-    put_resp = requests.put(put_url, headers={"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json"}, json=payload, timeout=15)
+    put_resp = http_put(put_url, headers={"Authorization": f"token {access_token}", "Accept": "application/vnd.github+json"}, json=payload, timeout=15)
     if put_resp.status_code not in (200, 201):
         return jsonify({"error": "failed_to_create_update_readme", "status": put_resp.status_code, "detail": put_resp.text}), 500
 
@@ -2407,25 +4913,27 @@ def github_readme_apply():
 # -------------------------
 # Helper: Gemini release notes generator
 # -------------------------
-def gemini_generate_release_notes(repo_details: dict, commits: list, max_commits=60):
-    """
-    Returns (title, markdown_text).
-    - repo_details: dict with 'name','description','languages','frameworks','url'
-    - commits: list of {"date","message","author"(optional),"files"(optional)}
-    """
+def _release_notes_prompt(repo_details: dict, commits: list, max_commits=60):
+    """Returns (title, prompt, commit_snippets) for the release notes generation."""
     name = repo_details.get("name") or "Repository"
-    desc = repo_details.get("description") or ""
+    title = f"{name} — Release Notes ({datetime.utcnow().strftime('%Y-%m-%d')})"
     languages = ", ".join(repo_details.get("languages") or [])
     frameworks = ", ".join(repo_details.get("frameworks") or [])
 
     # Build compact commit summary for prompt (limit length)
     commit_snippets = []
     for c in (commits or [])[:max_commits]:
-        when = c.get("date", "")[:19].replace("T", " ")
+        when = (c.get("date") or "")[:19].replace("T", " ")
         msg = (c.get("message") or "").split("\n")[0]
         author = c.get("author") or c.get("committer") or ""
         commit_snippets.append(f"- {when} | {author} | {msg}")
-    commit_block = "\n".join(commit_snippets) or "No recent commits available."
+    # the description is kept short so the commit list gets most of the budget
+    fitted = fit_prompt_sections("release_notes", [
+        {"name": "description", "items": [repo_details.get("description") or ""], "priority": 0, "max_tokens": 300},
+        {"name": "commits", "items": commit_snippets, "priority": 1, "separator": "\n"},
+    ])
+    desc = fitted["description"]
+    commit_block = fitted["commits"] or "No recent commits available."
 
     prompt = f"""
 You are an experienced release engineer and technical writer.
@@ -2453,7 +4961,7 @@ Format the Recent commits section as Markdown only. Example for a single commit
         
 
 - Do **NOT** include any extraneous commentary, debug info, or JSON — return **only** the Markdown changelog + Recent commits list.
-- Use the `{commit_block}` data provided below (each line in `{commit_block}` will contain the commit date, author, short message, and the list of changed files). Use that raw data to construct the "Recent commits" section exactly as specified.
+- Use the commit list provided below (each line contains the commit date, author, short message, and the list of changed files). Use that raw data to construct the "Recent commits" section exactly as specified.
 
 Repository:
 name: {name}
@@ -2463,28 +4971,37 @@ frameworks: {frameworks}
 repo_url: {repo_details.get('url','')}
 
 
-Recent commits (most recent first; data available in `{commit_block}` — each entry includes date, author, message, and changed file paths):
+Recent commits (most recent first; each entry includes date, author, message, and changed file paths):
 {commit_block}
 
 
 Markdown:
 """
+    log_prompt_tokens("release_notes", prompt)
+    return title, prompt, commit_snippets
+
+
+def _release_notes_from_text(title, text, commit_snippets):
+    """The generated markdown, or a minimal autogenerated changelog when generation failed or came back empty."""
+    md = (text or "").strip()
+    if md:
+        return md
+    return f"# {title}\n\n## Release summary\n\nNo automatic summary available.\n\n## Commits\n\n" + "\n".join(commit_snippets[:20])
+
+
+def gemini_generate_release_notes(repo_details: dict, commits: list, max_commits=60, regenerate=False):
+    """
+    Returns (title, markdown_text).
+    - repo_details: dict with 'name','description','languages','frameworks','url'
+    - commits: list of {"date","message","author"(optional),"files"(optional)}
+    """
+    title, prompt, commit_snippets = _release_notes_prompt(repo_details, commits, max_commits)
+    text = None
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        md = (resp.text or "").strip()
-        # Robust: try to extract the markdown block between first header or first 'Release summary' up to end
-        if md:
-            # ensure we return at least something reasonable
-            title = f"{name} — Release Notes ({datetime.utcnow().strftime('%Y-%m-%d')})"
-            return title, md
+        text = gemini_generate_text(prompt, regenerate=regenerate)
     except Exception as e:
         print("gemini_generate_release_notes error:", e)
-
-    # fallback: minimal autogenerated markdown
-    title = f"{name} — Release Notes ({datetime.utcnow().strftime('%Y-%m-%d')})"
-    fallback_md = f"# {title}\n\n## Release summary\n\nNo automatic summary available.\n\n## Commits\n\n" + "\n".join(commit_snippets[:20])
-    return title, fallback_md
+    return title, _release_notes_from_text(title, text, commit_snippets)
 
 # -------------------------
 # Helper: append or create README with doc link
@@ -2501,7 +5018,7 @@ def update_readme_with_doc_link(github_token: str, owner: str, repo_name: str, d
     }
     readme_url = f"https://api.github.com/repos/{owner}/{repo_name}/contents/README.md"
 
-    r = requests.get(readme_url, headers=headers, timeout=12)
+    r = http_get(readme_url, headers=headers, timeout=12)
     if r.status_code == 200:
         payload = r.json()
         sha = payload.get("sha")
@@ -2515,7 +5032,7 @@ def update_readme_with_doc_link(github_token: str, owner: str, repo_name: str, d
         new_text = existing.rstrip() + footer
         new_b64 = base64.b64encode(new_text.encode("utf-8")).decode("utf-8")
         put_payload = {"message": commit_message, "content": new_b64, "sha": sha}
-        put = requests.put(readme_url, headers=headers, json=put_payload, timeout=12)
+        put = http_put(readme_url, headers=headers, json=put_payload, timeout=12)
         try:
             return put.status_code, put.json()
         except Exception:
@@ -2525,7 +5042,7 @@ def update_readme_with_doc_link(github_token: str, owner: str, repo_name: str, d
         new_text = f"# {repo_name}\n\nThis README was created automatically.\n\n## Release notes\n\nAuto-generated release notes document: [View release notes]({doc_url})\n"
         new_b64 = base64.b64encode(new_text.encode("utf-8")).decode("utf-8")
         put_payload = {"message": commit_message, "content": new_b64}
-        put = requests.put(readme_url, headers=headers, json=put_payload, timeout=12)
+        put = http_put(readme_url, headers=headers, json=put_payload, timeout=12)
         try:
             return put.status_code, put.json()
         except Exception:
@@ -2540,15 +5057,31 @@ def update_readme_with_doc_link(github_token: str, owner: str, repo_name: str, d
 @app.route("/api/github/generate-release-notes", methods=["POST"])
 def api_generate_release_notes():
     """
-    Request body: { loginId?, repoName }
-    Returns: { title, release_notes_markdown }
+    Request body: { loginId?, repoName, regenerate?, stream? }
+    Returns: { title, release_notes }, or with stream=true an NDJSON/SSE event stream of markdown
+    deltas ending in {"done": true, "title": ..., "release_notes": ...}.
     """
     body = request.get_json() or {}
     login_id = body.get("loginId")
     repo_name = body.get("repoName")
     if not repo_name:
         return jsonify({"error": "repoName required"}), 400
+    regenerate = bool(body.get("regenerate"))
+
+    if body.get("stream"):
+        def prepare():
+            repo_details, commits = _release_notes_inputs(login_id, repo_name)
+            title, prompt, commit_snippets = _release_notes_prompt(repo_details, commits)
+            return prompt, lambda text: {"title": title, "release_notes": _release_notes_from_text(title, text, commit_snippets)}
+        return event_stream_response(stream_gemini_generation(prepare, regenerate=regenerate))
 
+    repo_details, commits = _release_notes_inputs(login_id, repo_name)
+    title, md = gemini_generate_release_notes(repo_details, commits, regenerate=regenerate)
+    return jsonify({"title": title, "release_notes": md}), 200
+
+
+def _release_notes_inputs(login_id, repo_name):
+    """Returns (repo_details, commits); falls back to loading commits with the user's GitHub token."""
     # fetch local repo details including commits (reuses existing helper)
     repo_details = fetch_local_repo_details(login_id, repo_name)
 
@@ -2560,72 +5093,13 @@ def api_generate_release_notes():
             gh_token = extract_access_token(token_json) or token_json.get("token", {}).get("accessToken")
             if gh_token:
                 # fetch recent commits (public/simple)
-                user_resp = requests.get("https://api.github.com/user", headers={"Authorization": f"token {gh_token}"}, timeout=8)
-                owner = user_resp.json().get("login") if user_resp.status_code == 200 else None
+                owner = get_github_login(gh_token, login_id)
                 if owner:
-                    cr = requests.get(f"https://api.github.com/repos/{owner}/{repo_name}/commits?per_page=100", headers={"Authorization": f"token {gh_token}"}, timeout=12)
-                    if cr.status_code == 200:
-                        commits = []
-                        for c in cr.json():
-                            commit = c.get("commit", {})
-                            commits.append({
-                                "date": commit.get("author", {}).get("date"),
-                                "message": commit.get("message"),
-                                "author": c.get("author", {}).get("login") if c.get("author") else commit.get("author", {}).get("name"),
-                                "files": []  # not fetching files for preview
-                            })
+                    gh_headers = {"Authorization": f"token {gh_token}", "Accept": "application/vnd.github+json", "User-Agent": "descope-demo-app"}
+                    commits, _ = load_repo_commits(gh_headers, owner, repo_name, limit=100)
         except Exception as ex:
             print("fallback commit fetch failed:", ex)
-
-    title, md = gemini_generate_release_notes(repo_details, commits)
-    return jsonify({"title": title, "release_notes": md}), 200
-
-# Replace your previous complex writer with this simpler, robust writer.
-def write_doc_content_simple(access_token: str, document_id: str, raw_content: str, title: str = None):
-    """
-    Simple, robust writer: inserts full markdown text in one insertText request.
-    Avoids index calculation bugs that lead to Google API failures.
-    Returns the parsed JSON response from the batchUpdate call.
-    """
-    if not raw_content and not title:
-        return {"warning": "no content"}
-
-    url = f"https://docs.googleapis.com/v1/documents/{document_id}:batchUpdate"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-
-    # Build a single text blob: title (if any) + two newlines + raw_content
-    pieces = []
-    if title:
-        pieces.append(title.rstrip())
-        pieces.append("\n\n")
-    pieces.append(raw_content if raw_content is not None else "")
-    pieces.append("\n")
-
-    full_text = "".join(pieces)
-
-    payload = {
-        "requests": [
-            {
-                "insertText": {
-                    "location": {"index": 1},
-                    "text": full_text
-                }
-            }
-        ]
-    }
-
-    r = requests.post(url, headers=headers, json=payload, timeout=20)
-    # Log Google response for debugging
-    try:
-        parsed = r.json()
-    except Exception:
-        parsed = {"text": r.text}
-    if r.status_code not in (200, 201):
-        # Surface the Google error to logs so you can inspect details
-        print("Docs write failed:", r.status_code, parsed)
-        raise Exception(f"Failed to write doc content: {r.status_code} {parsed}")
-    return parsed
-
+    return repo_details, commits
 
 # -------------------------
 # Endpoint: create google doc and append link to README
@@ -2633,86 +5107,89 @@ def write_doc_content_simple(access_token: str, document_id: str, raw_content: s
 @app.route("/api/github/release-notes/create-doc", methods=["POST"])
 def api_create_release_notes_doc_and_append():
     """
-    Request body: { loginId, repoName, releaseNotes (markdown string), shareWithCollaborators: bool (optional), commitMessage: str (optional) }
+    Request body: { loginId, repoName, releaseNotes (markdown string), shareWithCollaborators: bool (optional), commitMessage: str (optional), async? }
     Flow:
       - create Google Doc with release notes (requires Google token via Descope outbound)
       - write content into doc (formatted)
       - map collaborators to emails and share doc
       - append doc link to README using user's GitHub outbound token
+    With async: true returns 202 { jobId } and the result is read from /api/jobs/<id>.
     """
     body = request.get_json() or {}
+    if not body.get("repoName") or not body.get("releaseNotes"):
+        return jsonify({"error": "repoName and releaseNotes required"}), 400
+    return run_workflow_request("release_notes_create_doc", body)
+
+
+@job_workflow("release_notes_create_doc")
+def run_release_notes_create_doc(body, job_id=None):
     login_id = body.get("loginId")
     repo_name = body.get("repoName")
     release_notes_md = body.get("releaseNotes")
     share_with_collab = bool(body.get("shareWithCollaborators", True))
     commit_message = body.get("commitMessage") or f"Add release notes link ({datetime.utcnow().strftime('%Y-%m-%d')})"
 
-    if not repo_name or not release_notes_md:
-        return jsonify({"error": "repoName and releaseNotes required"}), 400
-
     # 1) get repo details for title
+    job_step(job_id, "repo_details")
     repo_details = fetch_local_repo_details(login_id, repo_name)
     doc_title = f"{repo_details.get('name') or repo_name} — Release Notes ({datetime.utcnow().strftime('%Y-%m-%d')})"
 
     # 2) get Google token (use your outbound app id that has docs/drive scopes)
+    job_step(job_id, "google_token")
     try:
         token_json = get_outbound_token(GOOGLE_DRIVE_OUTBOUND_APP_ID, login_id)
         google_access_token = extract_access_token(token_json)
         if not google_access_token:
-            return jsonify({"error": "no_google_access_token", "detail": token_json}), 500
+            return 500, {"error": "no_google_access_token", "detail": token_json}
     except Exception as e:
-        return jsonify({"error": "failed_to_retrieve_google_token", "detail": str(e)}), 500
+        return 500, {"error": "failed_to_retrieve_google_token", "detail": str(e)}
 
     # 3) create Google Doc
+    job_step(job_id, "create_doc")
     try:
         doc_id, doc_url = create_google_doc(google_access_token, doc_title)
     except Exception as e:
-        return jsonify({"error": "create_doc_failed", "detail": str(e)}), 500
+        return 500, {"error": "create_doc_failed", "detail": str(e)}
 
     # 4) write formatted content (markdown -> docs via your helper)
+    job_step(job_id, "write_doc")
     try:
-        # write_doc_content_formatted(access_token, document_id, raw_content, title=None)
-        write_doc_content_simple(google_access_token, doc_id, release_notes_md, title=doc_title)
+        write_doc_content_formatted(google_access_token, doc_id, release_notes_md, title=doc_title,
+                                    on_progress=lambda done, total: job_progress(job_id, done, total, step="write_doc"))
     except Exception as e:
-        return jsonify({"error": "write_doc_failed", "detail": str(e)}), 500
+        return 500, {"error": "write_doc_failed", "detail": str(e)}
 
     # 5) share doc with collaborator emails (best-effort)
     shared_emails = []
     permission_results = {}
     if share_with_collab and login_id:
+        job_step(job_id, "share_doc")
         try:
             # get collaborator logins
             gh_token_json = get_outbound_token("github", login_id)
             gh_access_token = extract_access_token(gh_token_json)
-            owner_login, collaborators = fetch_github_user_and_collaborators(gh_access_token, repo_name)
-            collab_logins = [c.get("login") for c in (collaborators or []) if c.get("login")]
-            if collab_logins:
-                docs = users_collection.find({"connectedAccounts.github.login": {"$in": collab_logins}})
-                for d in docs:
-                    em = d.get("email")
-                    if em:
-                        shared_emails.append(em)
-                shared_emails = list(dict.fromkeys(shared_emails))
-                if shared_emails:
-                    permission_results = share_file_with_emails(google_access_token, doc_id, shared_emails, send_notification=True)
+            shared_emails = collaborator_roster(gh_access_token, repo_name, login_id)["emails"]
+            if shared_emails:
+                permission_results = share_file_with_emails(google_access_token, doc_id, shared_emails, send_notification=True)
         except Exception as e:
             print("share doc warning:", e)
             permission_results = {"warning": str(e)}
 
     # 6) update README using user's GitHub token
+    job_step(job_id, "update_readme")
     readme_update_status = {}
     try:
         # obtain a GitHub token for repo write
         gh_token_json = get_outbound_token("github", login_id)
         github_access_token = extract_access_token(gh_token_json) or gh_token_json.get("token", {}).get("accessToken")
         if not github_access_token:
-            return jsonify({"error": "no_github_access_token", "detail": gh_token_json}), 500
+            return 500, {"error": "no_github_access_token", "detail": gh_token_json}
 
         # determine owner (authenticated user)
-        user_resp = requests.get("https://api.github.com/user", headers={"Authorization": f"token {github_access_token}"}, timeout=8)
-        if user_resp.status_code != 200:
-            return jsonify({"error": "failed_to_fetch_github_user", "detail": user_resp.text}), 500
-        owner = user_resp.json().get("login")
+        try:
+            owner = get_github_login(github_access_token, login_id)
+        except Exception as e:
+            return 500, {"error": "failed_to_fetch_github_user", "detail": str(e)}
 
         status_code, resp_json = update_readme_with_doc_link(github_access_token, owner, repo_name, doc_url, commit_message=commit_message)
         readme_update_status = {"status": status_code, "response": resp_json}
@@ -2720,15 +5197,14 @@ def api_create_release_notes_doc_and_append():
         print("README update failed:", e)
         readme_update_status = {"error": str(e)}
 
-    return jsonify({
+    return 200, {
         "success": True,
         "documentUrl": doc_url,
         "documentId": doc_id,
         "sharedWith": shared_emails,
         "permissionResults": permission_results,
         "readmeUpdate": readme_update_status
-    }), 200
-
+    }
 
 
 def slack_lookup_user_id_by_email(slack_token: str, email: str):
@@ -2738,8 +5214,7 @@ def slack_lookup_user_id_by_email(slack_token: str, email: str):
     url = "https://slack.com/api/users.lookupByEmail"
     headers = {"Authorization": f"Bearer {slack_token}"}
     params = {"email": email}
-    r = requests.get(url, headers=headers, params=params, timeout=8)
-    print(r.json())
+    r = http_get(url, headers=headers, params=params, timeout=8)
     try:
         payload = r.json()
     except Exception:
@@ -2749,6 +5224,212 @@ def slack_lookup_user_id_by_email(slack_token: str, email: str):
         return None, payload
     return payload.get("user", {}).get("id"), payload
 
+# -------------------------
+# Slack workspace directory (email -> user id per team)
+# -------------------------
+# Built from paginated users.list (Tier 2, 200 members per call) instead of one Tier-3 users.lookupByEmail per
+# collaborator. Members are stored per team in MongoDB; each process keeps the team's email map in memory.
+# Emails missing from the directory (people who joined after the last build) are looked up individually and
+# added, and a full rebuild happens once the stored directory is older than SLACK_DIRECTORY_TTL.
+# A build is paged across requests (SLACK_DIRECTORY_PAGES_PER_CALL users.list pages each, cursor kept in MongoDB),
+# so no request stalls on a large workspace; until the first build completes, emails are looked up individually.
+# A failed page backs the build off exponentially (SLACK_DIRECTORY_BACKOFF_BASE .. SLACK_DIRECTORY_BACKOFF_MAX).
+SLACK_DIRECTORY_TTL = int(os.getenv("SLACK_DIRECTORY_TTL", str(24 * 3600)))
+SLACK_DIRECTORY_RELOAD = int(os.getenv("SLACK_DIRECTORY_RELOAD", "600"))  # seconds before memory re-reads MongoDB
+SLACK_DIRECTORY_MISS_TTL = int(os.getenv("SLACK_DIRECTORY_MISS_TTL", "3600"))  # don't re-lookup unknown emails sooner
+SLACK_DIRECTORY_PAGES_PER_CALL = int(os.getenv("SLACK_DIRECTORY_PAGES_PER_CALL", "3"))
+SLACK_DIRECTORY_BACKOFF_BASE = 60  # Tier-2 limits reset per minute
+SLACK_DIRECTORY_BACKOFF_MAX = 3600
+SLACK_TEAM_CACHE_SIZE = int(os.getenv("SLACK_TEAM_CACHE_SIZE", "1024"))  # tokens -> team id
+SLACK_DIRECTORY_CACHE_SIZE = int(os.getenv("SLACK_DIRECTORY_CACHE_SIZE", "32"))  # directories held in memory
+SLACK_LOOKUP_FALLBACK_MAX = 10  # individual lookups per call for emails the directory doesn't know
+SLACK_LOOKUP_CONCURRENCY = 4
+slack_directory_collection = db["slack_directory"]  # one doc per member: {teamId, email, userId, syncedAt, expireAt}
+# one doc per team: {_id: teamId, builtAt, build: {cursor, startedAt}, failures, retryAt}
+slack_directory_state_collection = db["slack_directory_state"]
+
+_slack_team_ids = BoundedLRU(SLACK_TEAM_CACHE_SIZE)  # sha256(token) -> team id
+# team id -> {"emails": {email: user id}, "builtAt", "loadedAt", "complete", "retryAt", "misses": {email: epoch}}
+_slack_directories = BoundedLRU(SLACK_DIRECTORY_CACHE_SIZE)
+_slack_directory_locks = striped_locks()
+
+
+def _slack_directory_lock(team_id):
+    return stripe_lock(_slack_directory_locks, team_id)
+
+
+def slack_team_id(slack_token: str):
+    """Workspace id for a token via auth.test (cached per token in a bounded LRU)."""
+    fp = hashlib.sha256(slack_token.encode("utf-8")).hexdigest()
+    team_id = _slack_team_ids.get(fp)
+    if team_id:
+        return team_id
+    r = http_post("https://slack.com/api/auth.test", headers={"Authorization": f"Bearer {slack_token}"}, timeout=8, idempotent=True)
+    payload = r.json() if r.status_code == 200 else {}
+    if not payload.get("ok"):
+        raise Exception(f"Slack auth.test failed: {r.status_code} {payload.get('error') or r.text}")
+    team_id = payload.get("team_id")
+    _slack_team_ids[fp] = team_id
+    return team_id
+
+
+def _slack_list_members_page(slack_token: str, cursor=None):
+    """
+    One users.list page of active human members with an email: ({email (lowercased): user id}, next cursor or None).
+    Not retried here: a rate-limited build backs off instead of holding the request.
+    """
+    params = {"limit": 200}
+    if cursor:
+        params["cursor"] = cursor
+    r = http_get("https://slack.com/api/users.list", headers={"Authorization": f"Bearer {slack_token}"}, params=params,
+                 timeout=15, retries=0)
+    payload = r.json() if r.status_code == 200 else {}
+    if not payload.get("ok"):
+        raise Exception(f"Slack users.list failed: {r.status_code} {payload.get('error') or r.text}")
+    members = {}
+    for m in payload.get("members") or []:
+        email = ((m.get("profile") or {}).get("email") or "").lower()
+        if email and not m.get("deleted") and not m.get("is_bot"):
+            members[email] = m.get("id")
+    return members, (payload.get("response_metadata") or {}).get("next_cursor") or None
+
+
+def _slack_directory_store(team_id, members: dict):
+    """Upserts members for the team."""
+    if not members:
+        return
+    now = datetime.utcnow()
+    expire_at = now + timedelta(seconds=SLACK_DIRECTORY_TTL * 7)
+    slack_directory_collection.bulk_write([
+        pymongo.UpdateOne({"teamId": team_id, "email": email},
+                          {"$set": {"userId": uid, "syncedAt": now, "expireAt": expire_at}}, upsert=True)
+        for email, uid in members.items()
+    ], ordered=False)
+
+
+def _slack_directory_advance(slack_token: str, team_id: str, entry: dict, state: dict, now: float):
+    """
+    Runs up to SLACK_DIRECTORY_PAGES_PER_CALL pages of the team's (re)build, adding members to entry as they
+    arrive. A finished build prunes members it didn't list and marks the directory complete; a failure
+    schedules the next attempt with exponential backoff.
+    """
+    build = state.get("build") or {"cursor": None, "startedAt": now}
+    try:
+        for _ in range(SLACK_DIRECTORY_PAGES_PER_CALL):
+            members, build["cursor"] = _slack_list_members_page(slack_token, build["cursor"])
+            entry["emails"].update(members)
+            _slack_directory_store(team_id, members)
+            if not build["cursor"]:
+                break
+    except Exception as e:
+        failures = state.get("failures", 0) + 1
+        retry_at = now + min(SLACK_DIRECTORY_BACKOFF_MAX, SLACK_DIRECTORY_BACKOFF_BASE * 2 ** (failures - 1))
+        if "invalid_cursor" in str(e):
+            build = None  # start over on the next attempt
+        entry["retryAt"] = retry_at
+        print(f"slack directory build for {team_id} failed ({failures}x), retrying in {int(retry_at - now)}s:", e)
+        slack_directory_state_collection.update_one(
+            {"_id": team_id}, {"$set": {"build": build, "failures": failures, "retryAt": retry_at}}, upsert=True)
+        return
+
+    if build["cursor"]:
+        slack_directory_state_collection.update_one(
+            {"_id": team_id}, {"$set": {"build": build, "failures": 0, "retryAt": None}}, upsert=True)
+        return
+    slack_directory_collection.delete_many({"teamId": team_id, "syncedAt": {"$lt": datetime.utcfromtimestamp(build["startedAt"])}})
+    slack_directory_state_collection.update_one(
+        {"_id": team_id}, {"$set": {"builtAt": now, "build": None, "failures": 0, "retryAt": None}}, upsert=True)
+    entry.update(builtAt=now, complete=True)
+    print(f"slack directory for {team_id} rebuilt: {len(entry['emails'])} members")
+
+
+def slack_directory(slack_token: str, team_id: str):
+    """
+    The team's directory entry in memory, loaded from MongoDB. When the stored copy is missing or older than
+    SLACK_DIRECTORY_TTL, each call advances the rebuild by a few users.list pages (one call per team at a
+    time in a process; others use what is loaded). entry["complete"] is False until a first build finished.
+    """
+    now = time.time()
+    entry = _slack_directories.get(team_id)
+    if entry and now - entry["loadedAt"] < SLACK_DIRECTORY_RELOAD and (
+            (entry["complete"] and now - entry["builtAt"] < SLACK_DIRECTORY_TTL) or entry["retryAt"] > now):
+        return entry
+    lock = _slack_directory_lock(team_id)
+    if not lock.acquire(blocking=False):
+        return entry
+    try:
+        state = slack_directory_state_collection.find_one({"_id": team_id}) or {}
+        if not entry or now - entry["loadedAt"] >= SLACK_DIRECTORY_RELOAD:
+            emails = {d["email"]: d["userId"] for d in slack_directory_collection.find(
+                {"teamId": team_id}, {"_id": 0, "email": 1, "userId": 1})}
+            entry = {"emails": emails, "builtAt": state.get("builtAt") or 0, "loadedAt": now, "complete": bool(state.get("builtAt")),
+                     "retryAt": state.get("retryAt") or 0, "misses": entry["misses"] if entry else {}}
+            _slack_directories[team_id] = entry
+        if now - entry["builtAt"] >= SLACK_DIRECTORY_TTL and entry["retryAt"] <= now:
+            _slack_directory_advance(slack_token, team_id, entry, state, now)
+        return entry
+    finally:
+        lock.release()
+
+
+def slack_resolve_user_ids(slack_token: str, emails: list):
+    """
+    Maps emails to Slack user ids through the workspace directory.
+    Emails the directory doesn't know are looked up with users.lookupByEmail (at most
+    SLACK_LOOKUP_FALLBACK_MAX per call, skipping recent misses) and hits are added to the directory.
+    Falls back to per-email lookups when the directory can't be built (e.g. no users:read scope).
+    Returns (found: {email: user id}, missing: [email], details: {email: {...}}).
+    """
+    found, details, unknown = {}, {}, []
+    entry = None
+    try:
+        team_id = slack_team_id(slack_token)
+        entry = slack_directory(slack_token, team_id)
+    except Exception as e:
+        print("slack directory unavailable, using per-email lookups:", e)
+    now = time.time()
+    for email in emails:
+        uid = entry["emails"].get(email.lower()) if entry else None
+        if uid:
+            found[email] = uid
+            details[email] = {"source": "directory", "userId": uid}
+        elif entry and now - entry["misses"].get(email.lower(), 0) < SLACK_DIRECTORY_MISS_TTL:
+            details[email] = {"source": "directory", "error": "users_not_found"}
+        else:
+            unknown.append(email)
+
+    # a directory that never finished a build can't tell "not a member" from "not listed yet"
+    complete = entry is not None and entry["complete"]
+    to_lookup = unknown[:SLACK_LOOKUP_FALLBACK_MAX] if complete else unknown
+    if to_lookup:
+        def lookup(email):
+            try:
+                return email, slack_lookup_user_id_by_email(slack_token, email)
+            except Exception as e:
+                return email, (None, {"error": str(e)})
+
+        added = {}
+        with ThreadPoolExecutor(max_workers=min(SLACK_LOOKUP_CONCURRENCY, len(to_lookup))) as pool:
+            for email, (uid, resp) in pool.map(lookup, to_lookup):
+                details[email] = {"source": "lookup", "userId": uid} if uid else {"source": "lookup", **(resp or {})}
+                if uid:
+                    found[email] = uid
+                    added[email.lower()] = uid
+                elif entry is not None and (resp or {}).get("error") == "users_not_found":
+                    entry["misses"][email.lower()] = now
+        if entry is not None and added:
+            entry["emails"].update(added)
+            try:
+                _slack_directory_store(team_id, added)
+            except Exception as e:
+                print("slack directory write failed:", e)
+    for email in unknown[len(to_lookup):]:
+        details[email] = {"source": "directory", "error": "lookup_limit_reached"}
+
+    missing = [email for email in emails if email not in found]
+    return found, missing, details
+
+
 def slack_create_channel(slack_token: str, channel_name: str, is_private=False):
     """
     Creates a Slack channel (conversations.create). Returns (channel_id, response_json).
@@ -2758,7 +5439,7 @@ def slack_create_channel(slack_token: str, channel_name: str, is_private=False):
     # Slack expects lowercase name, no spaces
     name = channel_name.strip().lower().replace(" ", "-")
     body = {"name": name, "is_private": bool(is_private)}
-    r = requests.post(url, headers=headers, json=body, timeout=10)
+    r = http_post(url, headers=headers, json=body, timeout=10)
     print(r.json())
     try:
         payload = r.json()
@@ -2780,7 +5461,7 @@ def slack_invite_users_to_channel(slack_token: str, channel_id: str, user_ids: l
     url = "https://slack.com/api/conversations.invite"
     headers = {"Authorization": f"Bearer {slack_token}", "Content-Type": "application/json"}
     body = {"channel": channel_id, "users": ",".join(user_ids)}
-    r = requests.post(url, headers=headers, json=body, timeout=12)
+    r = http_post(url, headers=headers, json=body, timeout=12)
     try:
         payload = r.json()
     except Exception:
@@ -2793,7 +5474,7 @@ def slack_invite_users_to_channel(slack_token: str, channel_id: str, user_ids: l
 @app.route("/api/slack/create-channel", methods=["POST"])
 def api_slack_create_channel():
     """
-    Request body: { loginId, repoName, channelName, isPrivate? }
+    Request body: { loginId, repoName, channelName, isPrivate?, async? }
     Flow:
       - obtain Slack access token via Descope outbound app for Slack
       - obtain GitHub token and list collaborators
@@ -2802,77 +5483,61 @@ def api_slack_create_channel():
       - create channel
       - invite mapped Slack users (existing)
       - return a report { channelId, invited: [...], missingEmails: [...], slackResponses... }
+    With async: true returns 202 { jobId } and the report is read from /api/jobs/<id>.
     """
     body = request.get_json() or {}
+    if not body.get("loginId") or not body.get("repoName") or not body.get("channelName"):
+        return jsonify({"error": "loginId, repoName, channelName required"}), 400
+    return run_workflow_request("slack_create_channel", body)
+
+
+@job_workflow("slack_create_channel")
+def run_slack_create_channel(body, job_id=None):
     login_id = body.get("loginId")
     repo_name = body.get("repoName")
     channel_name = body.get("channelName")
     is_private = bool(body.get("isPrivate", False))
 
-    if not login_id or not repo_name or not channel_name:
-        return jsonify({"error": "loginId, repoName, channelName required"}), 400
-
     # 1) get Slack token from Descope outbound
+    job_step(job_id, "slack_token")
     try:
         slack_token_json = get_outbound_token(SLACK_OUTBOUND_APP_ID, login_id)
         slack_access_token = extract_access_token(slack_token_json)
         if not slack_access_token:
-            return jsonify({"error": "no_slack_access_token", "detail": slack_token_json}), 500
+            return 500, {"error": "no_slack_access_token", "detail": slack_token_json}
     except Exception as e:
-        return jsonify({"error": "failed_to_retrieve_slack_token", "detail": str(e)}), 500
+        return 500, {"error": "failed_to_retrieve_slack_token", "detail": str(e)}
 
     # 2) get GitHub token + collaborators
+    job_step(job_id, "collaborators")
     try:
         gh_token_json = get_outbound_token("github", login_id)
         gh_access_token = extract_access_token(gh_token_json)
         if not gh_access_token:
-            return jsonify({"error": "no_github_access_token", "detail": gh_token_json}), 500
+            return 500, {"error": "no_github_access_token", "detail": gh_token_json}
     except Exception as e:
-        return jsonify({"error": "failed_to_retrieve_github_token", "detail": str(e)}), 500
+        return 500, {"error": "failed_to_retrieve_github_token", "detail": str(e)}
 
+    # 3) + 4) collaborator emails joined from users_collection, then Slack ids
+    # (workspace directory, per-email lookups only for unknown emails)
     try:
-        owner_login, collaborators = fetch_github_user_and_collaborators(gh_access_token, repo_name)
+        roster = collaborator_roster(gh_access_token, repo_name, login_id, slack_token=slack_access_token)
     except Exception as e:
-        return jsonify({"error": "failed_to_list_collaborators", "detail": str(e)}), 500
-
-    collab_logins = [c.get("login") for c in (collaborators or []) if c.get("login")]
-    # 3) map to emails from your users_collection
-    emails = []
-    if collab_logins:
-        try:
-            docs = users_collection.find({"connectedAccounts.github.login": {"$in": collab_logins}})
-            for d in docs:
-                em = d.get("email")
-                if em:
-                    emails.append(em)
-        except Exception as e:
-            print("DB lookup error mapping collaborators to emails:", e)
-
-    emails = list(dict.fromkeys(emails))  # dedupe
-
-    # 4) map emails to slack user ids
-    slack_user_ids = []
-    missing_emails = []
-    lookup_details = {}
-    for em in emails:
-        try:
-            uid, resp = slack_lookup_user_id_by_email(slack_access_token, em)
-            lookup_details[em] = resp
-            if uid:
-                slack_user_ids.append(uid)
-            else:
-                missing_emails.append(em)
-        except Exception as e:
-            lookup_details[em] = {"error": str(e)}
-            missing_emails.append(em)
+        return 500, {"error": "failed_to_list_collaborators", "detail": str(e)}
+    job_step(job_id, "slack_lookup")
+    emails = roster["emails"]
+    found, missing_emails, lookup_details = roster["slackUserIds"], roster["missingEmails"], roster["lookupDetails"]
+    slack_user_ids = list(dict.fromkeys(found[em] for em in emails if em in found))
 
     # 5) create channel
+    job_step(job_id, "create_channel")
     try:
         channel_id, create_resp = slack_create_channel(slack_access_token, channel_name, is_private)
     except Exception as e:
-        return jsonify({"error": "slack_create_failed", "detail": str(e)}), 500
+        return 500, {"error": "slack_create_failed", "detail": str(e)}
 
     # 6) invite users (best-effort)
+    job_step(job_id, "invite_users")
     invite_result = None
     try:
         if slack_user_ids:
@@ -2881,7 +5546,7 @@ def api_slack_create_channel():
     except Exception as e:
         invite_result = {"error": str(e)}
 
-    return jsonify({
+    return 200, {
         "success": True,
         "channelId": channel_id,
         "createdChannelResponse": create_resp,
@@ -2890,9 +5555,162 @@ def api_slack_create_channel():
         "emailsMapped": emails,
         "missingEmails": missing_emails,
         "lookupDetails": lookup_details
-    }), 200
+    }
+
+
+# -------------------------
+# MongoDB index bootstrap
+# -------------------------
+# Indexes are built once per deploy with `python app.py --ensure-indexes`. MONGO_ENSURE_INDEXES=true also
+# builds them from a background thread on each cold start, for long-running servers without a deploy step.
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "false").lower() in ("1", "true", "yes")
+MONGO_INDEX_RETRY_INTERVAL = int(os.getenv("MONGO_INDEX_RETRY_INTERVAL", "60"))  # seconds between bootstrap retries
+
+# (collection, keys, options) for every query the app runs on a hot path
+MONGO_INDEXES = [
+    # user_register / github link / github identity lookups; queries go through user_filter() to match the partial filter
+    (users_collection, [("userId", 1)], {"unique": True, "partialFilterExpression": {"userId": {"$type": "string"}}}),
+    (users_collection, [("email", 1)], {}),
+    # collaborator -> email mapping for meet, doc sharing, release notes and slack
+    (users_collection, [("connectedAccounts.github.login", 1)], {}),
+    (outbound_tokens_collection, [("appId", 1), ("userId", 1)], {"unique": True}),
+    (outbound_tokens_collection, [("expireAt", 1)], {"expireAfterSeconds": 0}),
+    (gemini_cache_collection, [("key", 1)], {"unique": True}),
+    (gemini_cache_collection, [("expireAt", 1)], {"expireAfterSeconds": 0}),
+    (repo_analysis_collection, [("owner", 1), ("repo", 1), ("treeSha", 1)], {"unique": True}),
+    (repo_commits_collection, [("owner", 1), ("repo", 1), ("sha", 1)], {"unique": True}),
+    (repo_commits_collection, [("owner", 1), ("repo", 1), ("date", -1), ("sha", -1)], {}),
+    (repo_commit_sync_collection, [("owner", 1), ("repo", 1)], {"unique": True}),
+    (youtube_quota_collection, [("expireAt", 1)], {"expireAfterSeconds": 0}),
+    (jobs_collection, [("expireAt", 1)], {"expireAfterSeconds": 0}),
+    (jobs_collection, [("status", 1), ("updatedAt", 1)], {}),
+    (search_cache_collection, [("key", 1)], {"unique": True}),
+    (search_cache_collection, [("expireAt", 1)], {"expireAfterSeconds": 0}),
+    (slack_directory_collection, [("teamId", 1), ("email", 1)], {"unique": True}),
+    (slack_directory_collection, [("expireAt", 1)], {"expireAfterSeconds": 0}),
+]
+
+_mongo_indexes_ready = False  # also set once the only failures left are duplicate-key conflicts
+_mongo_index_conflicts = set()  # "collection.keys" of unique indexes the existing data violates
+_mongo_indexes_attempted_at = 0.0
+_mongo_indexes_lock = threading.Lock()
+
+
+def ensure_indexes():
+    """
+    Creates every index in MONGO_INDEXES and verifies each one is present afterwards, with the same uniqueness.
+    create_index is a no-op for indexes that already exist, so this is safe on every start.
+    Returns the list of "collection.keys" entries that could not be created or verified. Unique indexes that
+    fail on duplicate keys in the existing data are also recorded in _mongo_index_conflicts.
+    """
+    def label(collection, keys):
+        return f"{collection.name}." + ",".join(f"{k}:{d}" for k, d in keys)
+
+    for collection, keys, options in MONGO_INDEXES:
+        try:
+            collection.create_index(keys, **options)
+        except pymongo.errors.ConnectionFailure:
+            raise
+        except pymongo.errors.DuplicateKeyError as e:
+            _mongo_index_conflicts.add(label(collection, keys))
+            print(f"index create failed for {label(collection, keys)}: existing documents have duplicate keys, "
+                  "remove them and redeploy:", e)
+        except Exception as e:
+            # e.g. an index with the same keys but other options
+            print(f"index create failed for {label(collection, keys)}:", e)
+
+    missing = []
+    present = {}  # collection name -> (key list, unique) of its indexes
+    for collection, keys, options in MONGO_INDEXES:
+        try:
+            if collection.name not in present:
+                present[collection.name] = [
+                    ([(k, int(d)) for k, d in info.get("key", [])], bool(info.get("unique")))
+                    for info in collection.index_information().values()
+                ]
+        except pymongo.errors.ConnectionFailure:
+            raise
+        except Exception as e:
+            print(f"index verify failed for {collection.name}:", e)
+            present[collection.name] = []
+        # an older non-unique index with the same keys blocks creating the unique one, so it counts as missing
+        if ([(k, int(d)) for k, d in keys], bool(options.get("unique"))) not in present[collection.name]:
+            missing.append(label(collection, keys))
+    if not _user_lookup_uses_index():
+        missing.append("users.userId:1 (not used by user_filter)")
+    if missing:
+        print("mongo indexes missing:", missing)
+    else:
+        print(f"mongo indexes verified: {len(MONGO_INDEXES)}")
+    return missing
+
+
+def _plan_index_names(plan):
+    names = set()
+    if isinstance(plan, dict):
+        if plan.get("stage") == "IXSCAN":
+            names.add(plan.get("indexName"))
+        for child in plan.values():
+            names |= _plan_index_names(child)
+    elif isinstance(plan, list):
+        for child in plan:
+            names |= _plan_index_names(child)
+    return names
+
+
+def _user_lookup_uses_index():
+    """Confirms with explain() that a user_filter() lookup is planned as an IXSCAN on the partial userId index."""
+    try:
+        plan = users_collection.find(user_filter("index-check")).explain()
+    except pymongo.errors.ConnectionFailure:
+        raise
+    except Exception as e:
+        print("users lookup explain failed:", e)
+        return False
+    return "userId_1" in _plan_index_names((plan.get("queryPlanner") or {}).get("winningPlan"))
+
+
+def _bootstrap_indexes():
+    """
+    Runs ensure_indexes until it succeeds, at most once per MONGO_INDEX_RETRY_INTERVAL. Duplicate-key
+    conflicts are permanent until the data is cleaned up, so they are logged once and not retried.
+    """
+    global _mongo_indexes_ready, _mongo_indexes_attempted_at
+    if _mongo_indexes_ready or not MONGO_ENSURE_INDEXES:
+        return
+    # never make a request wait on a bootstrap that is already running
+    if not _mongo_indexes_lock.acquire(blocking=False):
+        return
+    try:
+        if _mongo_indexes_ready or time.time() - _mongo_indexes_attempted_at < MONGO_INDEX_RETRY_INTERVAL:
+            return
+        _mongo_indexes_attempted_at = time.time()
+        # the user_filter() explain entry starts with the userId index label, so it follows that index
+        retryable = [m for m in ensure_indexes() if m.split(" ")[0] not in _mongo_index_conflicts]
+        _mongo_indexes_ready = not retryable
+        if _mongo_indexes_ready and _mongo_index_conflicts:
+            print("mongo index bootstrap stopped; duplicate keys block:", sorted(_mongo_index_conflicts))
+    except Exception as e:
+        print("mongo index bootstrap failed:", e)
+    finally:
+        _mongo_indexes_lock.release()
+
+
+@app.before_request
+def _ensure_indexes_before_request():
+    # retries the startup bootstrap when MongoDB was unreachable or an index could not be verified
+    if (not _mongo_indexes_ready and MONGO_ENSURE_INDEXES
+            and time.time() - _mongo_indexes_attempted_at >= MONGO_INDEX_RETRY_INTERVAL):
+        threading.Thread(target=_bootstrap_indexes, daemon=True).start()
+
 
+# startup: runs in the background so an unreachable MongoDB does not block the import
+if MONGO_ENSURE_INDEXES:
+    threading.Thread(target=_bootstrap_indexes, daemon=True).start()
 
 
 if __name__ == "__main__":
+    if "--ensure-indexes" in sys.argv:
+        # deploy step: build and verify the indexes once, exit non-zero if any is missing
+        sys.exit(1 if ensure_indexes() else 0)
     app.run(debug=True, port=int(os.environ.get("PORT", 5000)))
\ No newline at end of file
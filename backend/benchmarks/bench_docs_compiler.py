@@ -0,0 +1,277 @@
+"""
+Benchmark for the Markdown -> Google Docs compiler (compile_markdown_to_docs) against the
+previous block parser + per-block insertText builder, on long generated documents.
+
+    python benchmarks/bench_docs_compiler.py [--pages 100] [--repeat 5] [--seed 11]
+
+Run from backend/. No network or MongoDB access is needed.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+os.environ.setdefault("MONGO_ENSURE_INDEXES", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+import app as A  # noqa: E402
+
+LINES_PER_PAGE = 45
+WORDS = ("commit", "release", "fix", "parser", "docs", "cache", "retry", "index", "async", "worker",
+         "token", "schema", "deploy", "metrics", "budget", "stream", "batch", "queue", "🚀", "✅", "naïve")
+
+
+def legacy_split_blocks(md_text):
+    """
+    The parser compile_markdown_to_docs replaced. Very small Markdown-ish parser that yields blocks:
+      - {'type': 'heading', 'level': n, 'text': '...'}
+      - {'type': 'paragraph', 'text': '...'}
+      - {'type': 'list', 'style': 'bulleted'|'numbered', 'items': [...]}
+      - {'type': 'code', 'text': '...'}
+    """
+    lines = md_text.splitlines()
+    i = 0
+    blocks = []
+
+    while i < len(lines):
+        line = lines[i]
+
+        # code fence
+        if line.strip().startswith("```"):
+            lang = line.strip()[3:].strip()
+            i += 1
+            code_lines = []
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code_lines.append(lines[i])
+                i += 1
+            # skip closing fence
+            if i < len(lines) and lines[i].strip().startswith("```"):
+                i += 1
+            blocks.append({"type": "code", "text": "\n".join(code_lines), "lang": lang})
+            continue
+
+        # headings (#, ##, ###)
+        m = re.match(r'^(#{1,6})\s+(.*)$', line)
+        if m:
+            level = len(m.group(1))
+            text = m.group(2).strip()
+            blocks.append({"type": "heading", "level": level, "text": text})
+            i += 1
+            continue
+
+        # lists (bulleted or numbered)
+        m_bullet = re.match(r'^\s*[-*]\s+(.*)$', line)
+        m_number = re.match(r'^\s*\d+\.\s+(.*)$', line)
+        if m_bullet or m_number:
+            items = []
+            style = "bulleted" if m_bullet else "numbered"
+            while i < len(lines):
+                lb = lines[i]
+                mb = re.match(r'^\s*[-*]\s+(.*)$', lb)
+                mn = re.match(r'^\s*\d+\.\s+(.*)$', lb)
+                if mb:
+                    items.append(mb.group(1).rstrip())
+                    i += 1
+                elif mn:
+                    items.append(mn.group(1).rstrip())
+                    i += 1
+                else:
+                    break
+            blocks.append({"type": "list", "style": style, "items": items})
+            continue
+
+        # blank line
+        if line.strip() == "":
+            i += 1
+            continue
+
+        # paragraph
+        para_lines = [line]
+        i += 1
+        while (
+            i < len(lines)
+            and lines[i].strip() != ""
+            and not re.match(r'^(#{1,6})\s+(.*)$', lines[i])
+            and not re.match(r'^\s*[-*]\s+(.*)$', lines[i])
+            and not re.match(r'^\s*\d+\.\s+(.*)$', lines[i])
+            and not lines[i].strip().startswith("```")
+        ):
+            para_lines.append(lines[i])
+            i += 1
+        blocks.append({"type": "paragraph", "text": "\n".join(para_lines).strip()})
+
+    return blocks
+
+
+def legacy_build_requests(md_text):
+    """
+    The builder compile_markdown_to_docs replaced (indexes via len(), not UTF-16). Returns a list of docs API 'requests' suitable for documents.batchUpdate.
+    """
+    blocks = legacy_split_blocks(md_text)
+    reqs = []
+    current_index = 1  # insert at doc start
+
+    for block in blocks:
+        if block["type"] == "heading":
+            heading_text = block["text"].rstrip() + "\n"
+            reqs.append({"insertText": {"location": {"index": current_index}, "text": heading_text}})
+            start, end = current_index, current_index + len(heading_text)
+            if block["level"] <= 2:
+                named = "HEADING_1" if block["level"] == 1 else "HEADING_2"
+            elif block["level"] == 3:
+                named = "HEADING_3"
+            else:
+                named = "NORMAL_TEXT"
+            reqs.append({
+                "updateParagraphStyle": {
+                    "range": {"startIndex": start, "endIndex": end},
+                    "paragraphStyle": {"namedStyleType": named},
+                    "fields": "namedStyleType"
+                }
+            })
+            current_index = end
+
+        elif block["type"] == "paragraph":
+            para_text = block["text"].rstrip() + "\n\n"
+            reqs.append({"insertText": {"location": {"index": current_index}, "text": para_text}})
+            current_index += len(para_text)
+
+        elif block["type"] == "code":
+            code_text = block["text"].rstrip() + "\n\n"
+            reqs.append({"insertText": {"location": {"index": current_index}, "text": code_text}})
+            start, end = current_index, current_index + len(code_text)
+            reqs.append({
+                "updateTextStyle": {
+                    "range": {"startIndex": start, "endIndex": end},
+                    "textStyle": {"weightedFontFamily": {"fontFamily": "Courier New"}},
+                    "fields": "weightedFontFamily"
+                }
+            })
+            reqs.append({
+                "updateParagraphStyle": {
+                    "range": {"startIndex": start, "endIndex": end},
+                    "paragraphStyle": {"indentStart": {"magnitude": 18, "unit": "PT"}},
+                    "fields": "indentStart"
+                }
+            })
+            current_index = end
+
+        elif block["type"] == "list":
+            start_list_index = current_index
+            for it in block["items"]:
+                item_text = it.rstrip() + "\n"
+                reqs.append({"insertText": {"location": {"index": current_index}, "text": item_text}})
+                current_index += len(item_text)
+            end_list_index = current_index
+            preset = "NUMBERED_DECIMAL" if block.get("style") == "numbered" else "BULLET_DISC_CIRCLE"
+            reqs.append({
+                "createParagraphBullets": {
+                    "range": {"startIndex": start_list_index, "endIndex": end_list_index},
+                    "bulletPreset": preset
+                }
+            })
+
+    return reqs
+
+
+def synthetic_markdown(pages, seed):
+    """Release-notes style markdown of roughly `pages` pages with lists, code, inline styles and emoji."""
+    rng = random.Random(seed)
+
+    def sentence(n):
+        words = [rng.choice(WORDS) for _ in range(n)]
+        if rng.random() < 0.3:
+            i = rng.randrange(n)
+            words[i] = f"**{words[i]}**"
+        if rng.random() < 0.2:
+            words.append(f"[PR #{rng.randint(1, 999)}](https://github.com/o/r/pull/{rng.randint(1, 999)})")
+        if rng.random() < 0.2:
+            words.append(f"`{rng.choice(WORDS)}()`")
+        return " ".join(words).capitalize() + "."
+
+    lines = ["# Release notes"]
+    while len(lines) < pages * LINES_PER_PAGE:
+        lines += ["", f"## {sentence(3)}", sentence(rng.randint(12, 30))]
+        for _ in range(rng.randint(3, 12)):
+            lines.append(f"- {sentence(rng.randint(5, 14))}")
+        if rng.random() < 0.3:
+            lines += ["", "1. " + sentence(6), "2. " + sentence(6)]
+        if rng.random() < 0.2:
+            lines += ["", "```python"] + [f"    value_{i} = compute({i})  # {rng.choice(WORDS)}" for i in range(rng.randint(3, 10))] + ["```"]
+    return "\n".join(lines)
+
+
+def misaligned_paragraph_ranges(reqs):
+    """
+    Counts paragraph-level ranges (headings, code indents, bullets) that do not start and end on paragraph
+    boundaries once the inserted text is measured in UTF-16 units, as the Docs API measures it.
+    Each of these is styled at the wrong place or rejected by documents.batchUpdate.
+    """
+    text = "".join(r["insertText"]["text"] for r in reqs if "insertText" in r)  # every insert lands at the end
+    units = text.encode("utf-16-le")
+
+    def unit(index):  # the code unit at a 1-based Docs index
+        return units[(index - 1) * 2:index * 2]
+
+    bad = 0
+    for r in reqs:
+        kind, body = next(iter(r.items()))
+        if kind not in ("updateParagraphStyle", "createParagraphBullets"):
+            continue
+        start, end = body["range"]["startIndex"], body["range"]["endIndex"]
+        if not ((start == 1 or unit(start - 1) == "\n".encode("utf-16-le")) and unit(end - 1) == "\n".encode("utf-16-le")):
+            bad += 1
+    return bad
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, samples
+
+
+def compiled_requests(md_text, title=None):
+    """compile_markdown_to_docs output as one request list (one insertText, then style requests), like the legacy builder."""
+    text, style_reqs = A.compile_markdown_to_docs(md_text, title=title)
+    if not text:
+        return []
+    return [{"insertText": {"location": {"index": 1}, "text": text}}] + style_reqs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    md = synthetic_markdown(args.pages, args.seed)
+    print(f"document: {args.pages} pages, {md.count(chr(10)) + 1} lines, {len(md.encode('utf-8')) / 1e3:.0f} KB\n")
+
+    legacy, t_legacy = timed(lambda: legacy_build_requests(md), args.repeat)
+    compiled, t_new = timed(lambda: compiled_requests(md, title="Release notes"), args.repeat)
+
+    print(f"{'':<28}{'median ms':>12}{'requests':>10}{'inserts':>9}{'payload KB':>12}{'misaligned':>12}")
+    for name, reqs, samples in (("legacy builder", legacy, t_legacy), ("compile_markdown_to_docs", compiled, t_new)):
+        inserts = sum(1 for r in reqs if "insertText" in r)
+        payload_kb = len(json.dumps({"requests": reqs})) / 1e3
+        print(f"{name:<28}{statistics.median(samples):12.2f}{len(reqs):10d}{inserts:10d}{payload_kb:12.0f}{misaligned_paragraph_ranges(reqs):12d}")
+
+    text, style_reqs = A.compile_markdown_to_docs(md, title="Release notes")
+    batches = A.plan_docs_batches(text, style_reqs)
+    largest = max(len(json.dumps({"requests": b["requests"]})) for b in batches) / 1e3
+    print(f"\nchunked write plan: {len(batches)} batchUpdate calls "
+          f"({sum(1 for b in batches if b['units'])} insert, {sum(1 for b in batches if not b['units'])} style), "
+          f"largest {largest:.0f} KB (limits: {A.DOCS_BATCH_MAX_BYTES / 1e3:.0f} KB, {A.DOCS_BATCH_MAX_REQUESTS} requests)")
+
+
+if __name__ == "__main__":
+    main()
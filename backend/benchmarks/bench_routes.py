@@ -0,0 +1,166 @@
+"""
+Route benchmark: runs the Flask app against the offline upstream fakes in benchmarks/harness.py and reports,
+per scenario, p50/p95 latency and the upstream calls (GitHub, Google, Slack, LinkedIn, Descope, Gemini, MongoDB)
+made per request.
+
+    python benchmarks/bench_routes.py [--scenario NAME ...] [--cold 3] [--requests 20] [--concurrency 4]
+                                      [--latency-scale 1.0] [--json results.json] [--verbose] [--list]
+
+Run from backend/. Each scenario runs a cold phase (sequential, every in-process and stored cache emptied
+before each request) and a warm phase (concurrent, after one unmeasured priming request). --latency-scale 0.1
+gives a quick run with the same call counts. No network or MongoDB access is needed.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("MONGO_ENSURE_INDEXES", "false")
+for _name, _value in (("GOOGLE_DRIVE_OUTBOUND_APP_ID", "google-drive"), ("GOOGLE_CALENDAR_OUTBOUND_APP_ID", "google-calendar"),
+                      ("SLACK_OUTBOUND_APP_ID", "slack"), ("LINKEDIN_OUTBOUND_APP_ID", "linkedin"),
+                      ("YOUTUBE_API_KEY", "bench"), ("CUSTOM_SEARCH_API_KEY", "bench"), ("GOOGLE_SEARCH_CX", "bench")):
+    os.environ.setdefault(_name, _value)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+import app as A  # noqa: E402
+import harness  # noqa: E402
+from harness import LARGE_REPO, LOGIN_ID, SMALL_REPO  # noqa: E402
+
+RELEASE_NOTES = harness.synthetic_markdown(3, 11)
+TECH = {"languages": ["Python", "TypeScript"], "frameworks": ["Flask", "React"]}
+
+# name -> (path, body(i) for the i-th request, expected status)
+SCENARIOS = {
+    "github_minimal": ("/api/github/minimal", lambda i: {"loginId": LOGIN_ID}, 200),
+    "github_minimal_precise": ("/api/github/minimal", lambda i: {"loginId": LOGIN_ID, "preciseLastCommit": True}, 200),
+    "repo_details_large": ("/api/github/repo/details", lambda i: {"loginId": LOGIN_ID, "repoName": LARGE_REPO}, 200),
+    "repo_details_small": ("/api/github/repo/details", lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO}, 200),
+    "repo_collaborators": ("/api/github/repo/collaborators", lambda i: {"loginId": LOGIN_ID, "repoName": LARGE_REPO}, 200),
+    "generate_release_notes": ("/api/github/generate-release-notes", lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO}, 200),
+    "release_notes_create_doc": ("/api/github/release-notes/create-doc",
+                                 lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO, "releaseNotes": RELEASE_NOTES}, 200),
+    "create_doc_and_share": ("/api/google/create-doc-and-share", lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO}, 200),
+    "meet_create_and_invite": ("/api/meet/create-and-invite", lambda i: {"loginId": LOGIN_ID, "repoName": LARGE_REPO}, 200),
+    "slack_create_channel": ("/api/slack/create-channel",
+                             lambda i: {"loginId": LOGIN_ID, "repoName": LARGE_REPO, "channelName": f"bench-{i}"}, 200),
+    "linkedin_preview": ("/api/linkedin/preview", lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO}, 200),
+    "linkedin_createpost": ("/api/linkedin/createpost",
+                            lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO, "postText": f"Benchmark post {i}"}, 201),
+    "youtube_suggestions": ("/api/youtube/suggestions", lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO, **TECH}, 200),
+    "google_suggestions": ("/api/google/suggestions", lambda i: {"loginId": LOGIN_ID, "repoName": SMALL_REPO, **TECH}, 200),
+}
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile; exact for the small sample counts used here."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def post(path, body):
+    start = time.perf_counter()
+    resp = A.app.test_client().post(path, json=body)
+    data = resp.get_data()  # streamed bodies are only produced while reading
+    return resp.status_code, (time.perf_counter() - start) * 1000, data
+
+
+def run_phase(env, scenario, phase, n, concurrency):
+    """Runs n requests of a scenario and returns the phase summary."""
+    path, body, expected = SCENARIOS[scenario]
+    results = []
+    calls = Counter()
+    if phase == "cold":
+        for i in range(n):
+            env.reset()
+            before = env.counter.snapshot()
+            results.append(post(path, body(i)))
+            calls.update(env.counter.since(before))
+    else:
+        post(path, body(-1))  # primes every cache the route uses
+        before = env.counter.snapshot()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda i: post(path, body(i)), range(n)))
+        calls = env.counter.since(before)
+    latencies = [ms for _, ms, _ in results]
+    errors = [(status, data[:300].decode("utf-8", "replace")) for status, _, data in results if status != expected]
+    return {
+        "scenario": scenario, "path": path, "phase": phase, "requests": n, "errors": len(errors),
+        "firstError": errors[0] if errors else None,
+        "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "max": max(latencies),
+        "callsPerRequest": {label: count / n for label, count in sorted(calls.items())},
+    }
+
+
+def report(row, out):
+    per_request = row["callsPerRequest"]
+    upstream = sum(v for k, v in per_request.items() if not k.startswith("mongo."))
+    mongo = sum(v for k, v in per_request.items() if k.startswith("mongo."))
+    print(f"{row['scenario']:<26} {row['phase']:<5} {row['requests']:>4} {row['errors']:>4} "
+          f"{row['p50']:>10.1f} {row['p95']:>10.1f} {row['max']:>10.1f} {upstream:>9.1f} {mongo:>7.1f}", file=out)
+    print("    " + ("  ".join(f"{label} {count:g}" for label, count in per_request.items()) or "(no upstream calls)"),
+          file=out)
+    if row["firstError"]:
+        print(f"    first error: {row['firstError'][0]} {row['firstError'][1]}", file=out)
+    out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repeatable; default: all")
+    parser.add_argument("--cold", type=int, default=3, help="sequential cold-cache requests per scenario")
+    parser.add_argument("--requests", type=int, default=20, help="warm requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every simulated latency (0 disables them)")
+    parser.add_argument("--commits", type=int, default=harness.WORLD_DEFAULTS["commits"])
+    parser.add_argument("--collaborators", type=int, default=harness.WORLD_DEFAULTS["collaborators"])
+    parser.add_argument("--large-files", type=int, default=harness.WORLD_DEFAULTS["large_files"])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's log output")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (path, _, _) in SCENARIOS.items():
+            print(f"{name:<26} POST {path}")
+        return
+
+    env = harness.install(A, latency_scale=args.latency_scale, seed=args.seed, commits=args.commits,
+                          collaborators=args.collaborators, large_files=args.large_files)
+    out = sys.stdout
+    print(f"latency scale {args.latency_scale}, {args.commits} commits, {args.collaborators} collaborators, "
+          f"{args.large_files} files in {LARGE_REPO}; cold n={args.cold}, warm n={args.requests} x{args.concurrency}\n")
+    print(f"{'scenario':<26} {'phase':<5} {'n':>4} {'err':>4} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} "
+          f"{'calls/req':>9} {'mongo':>7}")
+
+    rows = []
+    # the app logs with print(), sometimes from worker threads that outlive the request
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet as log:
+        for scenario in args.scenario or SCENARIOS:
+            for phase, n in (("cold", args.cold), ("warm", args.requests)):
+                if n <= 0:
+                    continue
+                row = run_phase(env, scenario, phase, n, args.concurrency)
+                rows.append(row)
+                report(row, out)
+                if log is not None:
+                    log.seek(0)
+                    log.truncate()
+    unmatched = sum(row["callsPerRequest"].get("unmatched", 0) for row in rows)
+    if unmatched:
+        print("\nwarning: some upstream calls had no fake endpoint (label 'unmatched'); extend harness.FakeUpstreams")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latencyScale": args.latency_scale, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
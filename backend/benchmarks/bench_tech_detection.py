@@ -0,0 +1,161 @@
+"""
+Micro-benchmark for the technology detector (detect_technologies) against the previous
+nested-loop detector, over synthetic repositories.
+
+    python benchmarks/bench_tech_detection.py [--files 10000] [--repeat 5] [--seed 7]
+
+Run from backend/. No network or MongoDB access is needed.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("MONGO_ENSURE_INDEXES", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+import app as A  # noqa: E402
+
+# (extension, share of files, header lines, body lines) for the synthetic repo;
+# headers carry the imports/markers, bodies are plain code
+FILE_MIX = [
+    (".py", 0.22, ["import os", "from flask import Flask"], ["def handler(event):", "    return {'ok': True}", "CMD = 'run'", "    x = compute(y)"]),
+    (".ts", 0.18, ["import { Component } from '@angular/core';"], ["export const x: number = 1;", "  this.items.push(item);"]),
+    (".tsx", 0.12, ["import React from 'react';"], ["export default function App() { return <div/>; }", "  const [a, setA] = useState(0);"]),
+    (".js", 0.12, ["const express = require('express');"], ["function start() { let a = 1; }", "app.get('/', handler);"]),
+    (".go", 0.08, ["package main", "import \"github.com/gin-gonic/gin\""], ["func main() {}", "\tif err != nil { return err }"]),
+    (".java", 0.06, ["import org.springframework.boot.SpringApplication;"], ["public class App {}", "    private int count = 0;"]),
+    (".md", 0.08, ["# Title"], ["## Section", "Some prose about FROM and CMD."]),
+    (".css", 0.06, [], [".btn { color: red; background: blue; }"]),
+    (".json", 0.04, [], ['{"name": "pkg", "version": "1.0.0"}']),
+    (".png", 0.04, [], ["\x89PNG"]),
+]
+SPECIAL_FILES = [
+    ("Dockerfile", "FROM python:3.11\nCMD [\"python\", \"app.py\"]\n"),
+    ("package.json", '{"dependencies": {"react": "^18.0.0", "express": "^4.0.0"}}\n'),
+    ("requirements.txt", "flask==3.0.0\nrequests\n"),
+    ("node_modules/lodash/lodash.js", "function lodash() {}\n" * 200),
+]
+
+
+def legacy_detect(blobs):
+    """The detector detect_technologies replaced: first matching pattern wins, by content length."""
+    tech_patterns = [
+        ("React", ["import React", "from 'react'", "from \"react\"", ".jsx", ".tsx"]),
+        ("Angular", ["@angular/core", "angular.module", "ng-controller", ".component.ts"]),
+        ("Vue", ["<template>", "export default {", "from 'vue'", "from \"vue\""]),
+        ("Ionic", ["@ionic/", "ionic-angular", "import { Ionic"]),
+        ("Flutter", ["import 'package:flutter/", "void main() {", "Flutter"]),
+        ("Docker", ["FROM ", "docker-compose", "CMD ", "ENTRYPOINT "]),
+        ("Jenkins", ["pipeline {", "Jenkinsfile", "node {", "stage("]),
+        ("TypeScript", [".ts", ".tsx"]),
+        ("JavaScript", [".js", "function ", "const ", "let "]),
+        ("Python", [".py", "def ", "import "]),
+        ("Java", [".java", "public class ", "import java."]),
+        ("Go", [".go", "package main", "func "]),
+        ("Ruby", [".rb", "def ", "end"]),
+        ("PHP", [".php", "<?php"]),
+        ("C++", [".cpp", "#include", "std::"]),
+        ("C#", [".cs", "namespace ", "using System"]),
+        ("HTML", [".html", "<html", "<div"]),
+        ("CSS", [".css", "{", "color:", "background:"]),
+        ("Markdown", [".md", "# ", "## "]),
+        ("Shell", [".sh", "#!/bin/bash", "echo "]),
+        ("Other", [])
+    ]
+    tech_counts = {}
+    for blob in blobs:
+        path = blob["path"].lower()
+        content = blob.get("content", "")
+        found = False
+        for tech, patterns in tech_patterns:
+            for pattern in patterns:
+                if pattern.startswith("."):
+                    if path.endswith(pattern):
+                        tech_counts[tech] = tech_counts.get(tech, 0) + len(content)
+                        found = True
+                        break
+                else:
+                    if pattern in content:
+                        tech_counts[tech] = tech_counts.get(tech, 0) + len(content)
+                        found = True
+                        break
+            if found:
+                break
+        if not found:
+            tech_counts["Other"] = tech_counts.get("Other", 0) + len(content)
+    return {k: v for k, v in tech_counts.items() if v > 0}
+
+
+def synthetic_repo(n_files, seed):
+    """Returns (files, tree_items) for a repo of n_files files with realistic paths and bodies."""
+    rng = random.Random(seed)
+    exts = [e for e, _, _, _ in FILE_MIX]
+    weights = [w for _, w, _, _ in FILE_MIX]
+    headers = {e: lines for e, _, lines, _ in FILE_MIX}
+    bodies = {e: lines for e, _, _, lines in FILE_MIX}
+    dirs = ["src", "src/components", "src/api", "lib", "pkg/server", "services/auth", "docs", "tests", "web/styles"]
+    files = []
+    for i in range(n_files - len(SPECIAL_FILES)):
+        ext = rng.choices(exts, weights)[0]
+        lines = headers[ext] + [rng.choice(bodies[ext]) for _ in range(rng.randint(20, 400))]
+        body = "\n".join(lines) + "\n"
+        files.append({"path": f"{rng.choice(dirs)}/file_{i}{ext}", "content": body})
+    files.extend({"path": p, "content": c} for p, c in SPECIAL_FILES)
+    tree_items = [{"path": f["path"], "type": "blob", "size": len(f["content"])} for f in files]
+    return files, tree_items
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, samples
+
+
+def report(name, samples, n_files):
+    median = statistics.median(samples)
+    print(f"{name:<34} median {median:9.2f} ms   min {min(samples):9.2f} ms   {n_files / (median / 1000):12,.0f} files/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    files, tree_items = synthetic_repo(args.files, args.seed)
+    total_bytes = sum(len(f["content"]) for f in files)
+    print(f"synthetic repo: {len(files)} files, {total_bytes / 1e6:.1f} MB\n")
+
+    legacy, t_legacy = timed(lambda: legacy_detect(files), args.repeat)
+    by_content, t_content = timed(lambda: A.detect_technologies(files), args.repeat)
+    by_tree, t_tree = timed(lambda: A.detect_technologies(tree_items=tree_items), args.repeat)
+    _, t_paths = timed(lambda: [A.classify_path(it["path"]) for it in tree_items], args.repeat)
+
+    report("legacy nested-loop (content)", t_legacy, len(files))
+    report("detect_technologies (content)", t_content, len(files))
+    report("detect_technologies (tree only)", t_tree, len(files))
+    report("classify_path", t_paths, len(files))
+
+    # the legacy detector stops at the first pattern hit per file, which is why it is both cheaper on
+    # content and wrong (see "Docker" below); the tree-only path is what large repos use
+    print("\nlegacy:          ", dict(sorted(legacy.items(), key=lambda kv: -kv[1])))
+    print("content:         ", A.summarize_technologies(by_content))
+    print("tree sizes only: ", A.summarize_technologies(by_tree))
+
+    # regression the index fixes: a Python file mentioning CMD is Python, not Docker
+    probe = [{"path": "tools/run.py", "content": "CMD = 'serve'\nFROM = None\n"}]
+    assert "Python" in A.detect_technologies(probe)["languages"], "python file misclassified"
+    assert "Docker" not in A.detect_technologies(probe)["frameworks"], "python file labelled Docker"
+    assert "Docker" in legacy_detect(probe), "legacy behaviour changed"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1117 @@
+"""
+Offline stand-ins for every upstream the API calls, so routes can be benchmarked without network access.
+
+- FakeUpstreams: a requests transport adapter mounted on app's pooled per-host sessions (http_session). It
+  answers GitHub, Google (Docs, Drive, Calendar, YouTube, Custom Search), Slack, LinkedIn and Descope calls from
+  a deterministic synthetic world (large trees, 10k-commit histories, 100 collaborators, a big Slack
+  workspace), sleeps a per-endpoint latency plus transfer time, and counts every call.
+- FakeGenerativeModel (via make_model_class): replaces genai.GenerativeModel with a slow, prompt-aware model,
+  streaming included.
+- MemoryDatabase: an in-memory, indexed stand-in for the MongoDB collections, with a per-operation round trip.
+
+install(A) wires all three into an imported app module; benchmarks/bench_routes.py drives the routes.
+"""
+import base64
+import hashlib
+import io
+import itertools
+import json
+import random
+import re
+import tarfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pymongo
+from bson import ObjectId
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from bench_docs_compiler import synthetic_markdown
+from bench_tech_detection import FILE_MIX, SPECIAL_FILES
+
+LOGIN_ID = "bench-user"
+OWNER = "bench-owner"
+OWNER_EMAIL = "owner@bench.example"
+LARGE_REPO = "big-repo"  # tree above TECH_DETECT_LARGE_REPO_FILES and above the tarball size cap
+SMALL_REPO = "app-repo"  # sampled through one tarball and analysed by the model
+HEAD_DATE = datetime(2026, 9, 30, 12, 0, 0)
+
+WORLD_DEFAULTS = {
+    "repos": 250,  # repositories visible to the user (/user/repos pages of 100)
+    "large_files": 12000,
+    "small_files": 400,
+    "commits": 10000,  # history length of the large repo
+    "small_commits": 1500,
+    "collaborators": 100,
+    "linked_share": 0.7,  # collaborators that linked their GitHub account here (have an email)
+    "slack_members": 2000,
+    "slack_share": 0.8,  # linked collaborators that are also in the Slack workspace
+}
+
+# seconds per call before transfer time; roughly what these APIs answer in from a US region
+LATENCY = {
+    "descope.token": 0.15,
+    "github.user": 0.12, "github.repos": 0.35, "github.graphql": 0.45, "github.repo": 0.12,
+    "github.tree": 0.4, "github.tarball": 0.6, "github.blob": 0.1, "github.commits": 0.3, "github.compare": 0.25, "github.branch": 0.12,
+    "github.collaborators": 0.2, "github.contents": 0.15, "github.contents_put": 0.5, "github.issues": 0.4,
+    "docs.create": 0.6, "docs.get": 0.15, "docs.batch_update": 0.4,
+    "drive.permissions_list": 0.15, "drive.permissions_create": 0.3,
+    "calendar.insert": 0.7, "youtube.search": 0.35, "customsearch": 0.3,
+    "slack.auth_test": 0.1, "slack.users_list": 0.35, "slack.lookup": 0.12, "slack.create": 0.25,
+    "slack.invite": 0.3, "slack.post": 0.2,
+    "linkedin.userinfo": 0.2, "linkedin.post": 0.5,
+    "unmatched": 0.05,
+}
+TRANSFER_BYTES_PER_SECOND = 25e6
+MONGO_LATENCY = 0.002  # one round trip to a same-region cluster
+GEMINI_FIRST_TOKEN = 0.7  # seconds
+GEMINI_TOKENS_PER_SECOND = 200
+GEMINI_CHARS_PER_TOKEN = 4
+
+
+class CallCounter:
+    """Thread-safe call counts by label; snapshot() / since() give per-phase deltas."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, label):
+        with self._lock:
+            self._counts[label] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self._counts)
+
+    def since(self, snapshot):
+        now = self.snapshot()
+        now.subtract(snapshot)
+        return Counter({k: v for k, v in now.items() if v > 0})
+
+
+class Latency:
+    """Sleeps scaled, jittered latencies; the log-normal jitter keeps the median at the base value."""
+
+    def __init__(self, scale=1.0, seed=7):
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, base, size=0):
+        if self.scale <= 0:
+            return
+        with self._lock:
+            jitter = self._rng.lognormvariate(0, 0.25)
+        time.sleep(self.scale * (base * jitter + size / TRANSFER_BYTES_PER_SECOND))
+
+
+# -------------------------
+# Synthetic world
+# -------------------------
+_MIX_BY_EXT = {ext: (headers, bodies) for ext, _, headers, bodies in FILE_MIX}
+_SPECIAL_CONTENT = {path: content.encode("ascii", "replace") for path, content in SPECIAL_FILES}
+_DIRS = ["src", "src/components", "src/api", "lib", "pkg/server", "services/auth", "docs", "tests", "web/styles"]
+_COMMIT_VERBS = ("Fix", "Add", "Refactor", "Update", "Remove", "Document", "Speed up", "Rename")
+_COMMIT_NOUNS = ("parser", "cache", "login flow", "release script", "docs", "retry logic", "index", "worker pool")
+
+
+def _sha(*parts):
+    return hashlib.sha1(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def file_content(path, size):
+    """Deterministic ASCII content of exactly `size` bytes for a synthetic tree path."""
+    if path in _SPECIAL_CONTENT:
+        return _SPECIAL_CONTENT[path]
+    ext = path[path.rfind("."):]
+    headers, bodies = _MIX_BY_EXT.get(ext, ([], ["data"]))
+    rng = random.Random(path)
+    lines = list(headers)
+    total = sum(len(line) + 1 for line in lines)
+    while total < size:
+        line = rng.choice(bodies)
+        lines.append(line)
+        total += len(line) + 1
+    return ("\n".join(lines) + "\n").encode("ascii", "replace")[:size]
+
+
+def build_tree(repo, n_files, seed):
+    """Recursive git tree entries ({path, type, sha, size}) for a repo of n_files files."""
+    rng = random.Random(f"{seed}:{repo}")
+    exts = [e for e, _, _, _ in FILE_MIX]
+    weights = [w for _, w, _, _ in FILE_MIX]
+    items = [{"path": d, "mode": "040000", "type": "tree", "sha": _sha(repo, d)} for d in _DIRS]
+    for i in range(n_files - len(SPECIAL_FILES)):
+        path = f"{rng.choice(_DIRS)}/file_{i}{rng.choices(exts, weights)[0]}"
+        items.append({"path": path, "mode": "100644", "type": "blob", "sha": _sha(repo, path), "size": rng.randint(600, 12000)})
+    for path, content in _SPECIAL_CONTENT.items():
+        items.append({"path": path, "mode": "100644", "type": "blob", "sha": _sha(repo, path), "size": len(content)})
+    return items
+
+
+class World:
+    """The upstream data every fake answers from. Built once; Docs documents are the only mutable state."""
+
+    def __init__(self, seed=7, **options):
+        opts = {**WORLD_DEFAULTS, **options}
+        self.opts = opts
+        rng = random.Random(seed)
+        self.repos = []
+        for i in range(opts["repos"]):
+            name = (LARGE_REPO, SMALL_REPO)[i] if i < 2 else f"repo-{i:03d}"
+            owner = OWNER if i < 2 or rng.random() < 0.8 else f"org-{i % 7}"
+            self.repos.append({
+                "id": 1000 + i, "name": name, "full_name": f"{owner}/{name}", "owner": {"login": owner},
+                "html_url": f"https://github.com/{owner}/{name}", "private": rng.random() < 0.3,
+                "fork": owner != OWNER and rng.random() < 0.5, "default_branch": "main",
+                "description": f"Synthetic repository {name} used by the offline benchmarks.",
+                "pushed_at": (HEAD_DATE - timedelta(hours=i * 5)).isoformat() + "Z",
+            })
+        self.repo_by_name = {r["name"]: r for r in self.repos}
+        self.trees = {LARGE_REPO: build_tree(LARGE_REPO, opts["large_files"], seed),
+                      SMALL_REPO: build_tree(SMALL_REPO, opts["small_files"], seed)}
+        self.blob_paths = {repo: {it["sha"]: it for it in items if it["type"] == "blob"} for repo, items in self.trees.items()}
+        self.commit_counts = {LARGE_REPO: opts["commits"], SMALL_REPO: opts["small_commits"]}
+
+        self.collaborators = [{
+            "login": f"collab-{i:03d}", "id": 5000 + i, "type": "User", "site_admin": False,
+            "avatar_url": f"https://avatars.githubusercontent.com/u/{5000 + i}",
+            "permissions": {"admin": i == 0, "push": True, "pull": True}, "role_name": "admin" if i == 0 else "write",
+        } for i in range(opts["collaborators"])]
+        linked = [c for c in self.collaborators if rng.random() < opts["linked_share"]]
+        # users collection seed: the signed-in user plus collaborators that linked GitHub here
+        self.users = [{"userId": LOGIN_ID, "email": OWNER_EMAIL, "name": "Bench Owner",
+                       "connectedAccounts": {"github": {"login": OWNER, "id": 1}}}]
+        self.users += [{"userId": f"user-{c['login']}", "email": f"{c['login']}@bench.example", "name": c["login"],
+                        "connectedAccounts": {"github": {"login": c["login"], "id": c["id"]}}} for c in linked]
+
+        in_slack = [u["email"] for u in self.users[1:] if rng.random() < opts["slack_share"]]
+        self.slack_members = [{"id": f"U{i:07d}", "name": f"member{i}", "deleted": i % 97 == 0, "is_bot": i % 89 == 0,
+                               "profile": {"email": f"member{i}@bench.example"}} for i in range(opts["slack_members"])]
+        self.slack_members += [{"id": f"UC{i:06d}", "name": email.split("@")[0], "deleted": False, "is_bot": False,
+                                "profile": {"email": email}} for i, email in enumerate(in_slack)]
+        self.slack_by_email = {m["profile"]["email"]: m["id"] for m in self.slack_members}
+
+        self.documents = {}  # documentId -> body end index
+        self._tarballs = {}
+        self._tree_json = {}
+        self._build_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self, prefix):
+        with self._lock:
+            return f"{prefix}{next(self._ids):06d}"
+
+    def commit(self, repo, i):
+        date = HEAD_DATE - timedelta(minutes=37 * i)
+        author = self.collaborators[i % len(self.collaborators)]["login"] if self.collaborators else OWNER
+        message = f"{_COMMIT_VERBS[i % len(_COMMIT_VERBS)]} {_COMMIT_NOUNS[(i * 7) % len(_COMMIT_NOUNS)]} (#{i})"
+        iso = date.isoformat() + "Z"
+        return {
+            "sha": _sha(repo, "commit", i), "html_url": f"https://github.com/{OWNER}/{repo}/commit/{_sha(repo, 'commit', i)}",
+            "commit": {"message": message, "author": {"name": author, "date": iso}, "committer": {"name": author, "date": iso}},
+            "author": {"login": author},
+        }
+
+    def tree_json(self, repo):
+        """Serialized recursive tree response (bytes), so the fake's own JSON encoding is not measured."""
+        with self._build_lock:
+            if repo in self.trees and repo not in self._tree_json:
+                self._tree_json[repo] = json.dumps({"sha": _sha(repo, "tree"), "tree": self.trees[repo], "truncated": False}).encode("utf-8")
+            return self._tree_json.get(repo)
+
+    def tarball(self, repo):
+        """gzip'd tar of the whole repo, entries prefixed "<owner>-<repo>-<sha>/" like GitHub's; built once."""
+        with self._build_lock:
+            if repo not in self._tarballs:
+                buf = io.BytesIO()
+                prefix = f"{OWNER}-{repo}-{_sha(repo)[:7]}/"
+                with tarfile.open(fileobj=buf, mode="w:gz", compresslevel=1) as tf:
+                    for it in self.trees[repo]:
+                        if it["type"] != "blob":
+                            continue
+                        data = file_content(it["path"], it["size"])
+                        info = tarfile.TarInfo(prefix + it["path"])
+                        info.size = len(data)
+                        tf.addfile(info, io.BytesIO(data))
+                self._tarballs[repo] = buf.getvalue()
+            return self._tarballs[repo]
+
+
+# -------------------------
+# Fake HTTP upstreams
+# -------------------------
+def _utf16_len(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _page_links(url, query, page, last_page):
+    """GitHub-style Link header for page `page` of `last_page`."""
+    links = []
+    for rel, p in (("next", page + 1), ("last", last_page)):
+        if page < last_page:
+            links.append(f'<{url}?{urlencode({**query, "page": p})}>; rel="{rel}"')
+    return ", ".join(links)
+
+
+class FakeUpstreams:
+    """Routes (method, host, path) to a handler; every handler returns (status, body, headers)."""
+
+    def __init__(self, world, latency, counter):
+        self.world = world
+        self.latency = latency
+        self.counter = counter
+        w = world
+        gh = "api.github.com"
+        repo = r"/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)"
+        self.routes = [
+            ("POST", "api.descope.com", r"/v1/mgmt/outbound/app/user/token/latest", self.descope_token, "descope.token"),
+            ("GET", gh, r"/user", self.github_user, "github.user"),
+            ("GET", gh, r"/user/repos", self.github_repos, "github.repos"),
+            ("POST", gh, r"/graphql", self.github_graphql, "github.graphql"),
+            ("GET", gh, repo, self.github_repo, "github.repo"),
+            ("GET", gh, repo + r"/git/trees/(?P<ref>[^/]+)", self.github_tree, "github.tree"),
+            ("GET", gh, repo + r"/branches/(?P<branch>[^/]+)", self.github_branch, "github.branch"),
+            ("GET", gh, repo + r"/tarball(?:/(?P<ref>[^/]+))?", self.github_tarball, "github.tarball"),
+            ("GET", gh, repo + r"/git/blobs/(?P<sha>\w+)", self.github_blob, "github.blob"),
+            ("GET", gh, repo + r"/commits", self.github_commits, "github.commits"),
+            ("GET", gh, repo + r"/compare/(?P<base>\w+)\.\.\.(?P<head>\w+)", self.github_compare, "github.compare"),
+            ("GET", gh, repo + r"/collaborators", self.github_collaborators, "github.collaborators"),
+            ("GET", gh, repo + r"/contents/(?P<path>.+)", self.github_contents, "github.contents"),
+            ("PUT", gh, repo + r"/contents/(?P<path>.+)", self.github_contents_put, "github.contents_put"),
+            ("POST", gh, repo + r"/issues", self.github_issue, "github.issues"),
+            ("POST", "docs.googleapis.com", r"/v1/documents", self.docs_create, "docs.create"),
+            ("GET", "docs.googleapis.com", r"/v1/documents/(?P<doc>[^/:]+)", self.docs_get, "docs.get"),
+            ("POST", "docs.googleapis.com", r"/v1/documents/(?P<doc>[^/:]+):batchUpdate", self.docs_batch_update, "docs.batch_update"),
+            ("GET", "www.googleapis.com", r"/drive/v3/files/(?P<file>[^/]+)/permissions", self.drive_permissions, "drive.permissions_list"),
+            ("POST", "www.googleapis.com", r"/drive/v3/files/(?P<file>[^/]+)/permissions", self.drive_permission_create, "drive.permissions_create"),
+            ("POST", "www.googleapis.com", r"/calendar/v3/calendars/primary/events", self.calendar_insert, "calendar.insert"),
+            ("GET", "www.googleapis.com", r"/youtube/v3/search", self.youtube_search, "youtube.search"),
+            ("GET", "www.googleapis.com", r"/customsearch/v1", self.custom_search, "customsearch"),
+            ("POST", "slack.com", r"/api/auth\.test", lambda ctx: (200, {"ok": True, "team_id": "TBENCH"}, {}), "slack.auth_test"),
+            ("GET", "slack.com", r"/api/users\.list", self.slack_users_list, "slack.users_list"),
+            ("GET", "slack.com", r"/api/users\.lookupByEmail", self.slack_lookup, "slack.lookup"),
+            ("POST", "slack.com", r"/api/conversations\.create", self.slack_create, "slack.create"),
+            ("POST", "slack.com", r"/api/conversations\.invite", self.slack_invite, "slack.invite"),
+            ("POST", "slack.com", r"/api/chat\.postMessage", lambda ctx: (200, {"ok": True, "ts": str(time.time())}, {}), "slack.post"),
+            ("GET", "api.linkedin.com", r"/v2/userinfo", lambda ctx: (200, {"sub": "li-bench", "name": "Bench Owner"}, {}), "linkedin.userinfo"),
+            ("POST", "api.linkedin.com", r"/v2/ugcPosts", lambda ctx: (201, {"id": f"urn:li:share:{w.next_id('')}"}, {}), "linkedin.post"),
+        ]
+        self.routes = [(m, h, re.compile(p + r"/?$"), fn, label) for m, h, p, fn, label in self.routes]
+
+    def handle(self, request):
+        """Returns (status, headers, body bytes, label) for a PreparedRequest."""
+        url = urlparse(request.url)
+        for method, host, pattern, fn, label in self.routes:
+            m = pattern.match(url.path) if method == request.method and host == url.hostname else None
+            if m:
+                break
+        else:
+            label, fn, m = "unmatched", (lambda ctx: (404, {"message": "Not Found"}, {})), None
+        body = request.body or b""
+        ctx = SimpleNamespace(
+            url=request.url, base=f"{url.scheme}://{url.hostname}{url.path}", headers=request.headers,
+            query={k: v[-1] for k, v in parse_qs(url.query).items()}, body=body.encode("utf-8") if isinstance(body, str) else body,
+            match=m.groupdict() if m else {},
+        )
+        status, payload, headers = fn(ctx)
+        if isinstance(payload, (bytes, bytearray)):
+            data = bytes(payload)
+            headers.setdefault("Content-Type", "application/octet-stream")
+        elif isinstance(payload, str):
+            data = payload.encode("utf-8")
+            headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+        else:
+            data = json.dumps(payload).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json; charset=utf-8")
+        self.counter.add(label)
+        self.latency.wait(LATENCY[label], len(data) + len(ctx.body))
+        return status, headers, data, label
+
+    def _json_body(self, ctx):
+        try:
+            return json.loads(ctx.body or b"{}")
+        except ValueError:
+            return {}
+
+    # --- Descope ---
+    def descope_token(self, ctx):
+        body = self._json_body(ctx)
+        return 200, {"token": {
+            "accessToken": f"tok-{body.get('appId')}-{body.get('userId')}",
+            "accessTokenExpiry": int(time.time()) + 3600, "scopes": ["repo", "read:user"],
+        }}, {}
+
+    # --- GitHub ---
+    def _etag(self, ctx, *parts):
+        """(etag, is_not_modified) for a listing whose content only depends on parts."""
+        etag = f'W/"{_sha(*parts)}"'
+        return etag, ctx.headers.get("If-None-Match") == etag
+
+    def github_user(self, ctx):
+        etag, not_modified = self._etag(ctx, "user", OWNER)
+        if not_modified:
+            return 304, b"", {"ETag": etag}
+        return 200, {"login": OWNER, "id": 1, "email": OWNER_EMAIL}, {"ETag": etag}
+
+    def github_repos(self, ctx):
+        per_page = int(ctx.query.get("per_page", 30))
+        page = int(ctx.query.get("page", 1))
+        repos = self.world.repos
+        last = max(1, -(-len(repos) // per_page))
+        return 200, repos[(page - 1) * per_page:page * per_page], {"Link": _page_links(ctx.base, {"per_page": per_page}, page, last)}
+
+    def github_graphql(self, ctx):
+        query = self._json_body(ctx).get("query", "")
+        data = {}
+        for alias, owner, name in re.findall(r'(r\d+): repository\(owner: "([^"]*)", name: "([^"]*)"\)', query):
+            repo = self.world.repo_by_name.get(name)
+            data[alias] = repo and {"nameWithOwner": f"{owner}/{name}",
+                                    "defaultBranchRef": {"target": {"committedDate": repo["pushed_at"]}}}
+        return 200, {"data": data}, {}
+
+    def _repo(self, ctx):
+        return self.world.repo_by_name.get(ctx.match["repo"])
+
+    def github_repo(self, ctx):
+        repo = self._repo(ctx)
+        return (200, repo, {}) if repo else (404, {"message": "Not Found"}, {})
+
+    def github_tree(self, ctx):
+        body = self.world.tree_json(ctx.match["repo"])
+        if body is None:
+            return 404, {"message": "Not Found"}, {}
+        return 200, body, {"Content-Type": "application/json; charset=utf-8"}
+
+    def github_branch(self, ctx):
+        repo = ctx.match["repo"]
+        if repo not in self.world.trees:
+            return 404, {"message": "Branch not found"}, {}
+        head = self.world.commit(repo, 0)
+        return 200, {"name": ctx.match["branch"], "commit": {"sha": head["sha"], "commit": {
+            **head["commit"], "tree": {"sha": _sha(repo, "tree")}}}, "protected": False}, {}
+
+    def github_tarball(self, ctx):
+        if ctx.match["repo"] not in self.world.trees:
+            return 404, {"message": "Not Found"}, {}
+        return 200, self.world.tarball(ctx.match["repo"]), {"Content-Type": "application/x-gzip"}
+
+    def github_blob(self, ctx):
+        it = self.world.blob_paths.get(ctx.match["repo"], {}).get(ctx.match["sha"])
+        if it is None:
+            return 404, {"message": "Not Found"}, {}
+        return 200, file_content(it["path"], it["size"]), {"Content-Type": "application/vnd.github.raw"}
+
+    def github_commits(self, ctx):
+        repo = ctx.match["repo"]
+        total = self.world.commit_counts.get(repo, 30 if repo in self.world.repo_by_name else 0)
+        if not total:
+            return 404, {"message": "Not Found"}, {}
+        since = ctx.query.get("since")
+        if since:
+            # history is static: only commits at or after `since` match, i.e. the stored head itself
+            oldest = (HEAD_DATE - datetime.fromisoformat(since.rstrip("Z"))).total_seconds() // (37 * 60)
+            total = min(total, max(0, int(oldest) + 1))
+        etag, not_modified = self._etag(ctx, repo, "commits", since, total)
+        if not_modified:
+            return 304, b"", {"ETag": etag}
+        per_page = int(ctx.query.get("per_page", 30))
+        page = int(ctx.query.get("page", 1))
+        commits = [self.world.commit(repo, i) for i in range((page - 1) * per_page, min(total, page * per_page))]
+        query = {k: v for k, v in ctx.query.items() if k != "page"}
+        return 200, commits, {"ETag": etag, "Link": _page_links(ctx.base, query, page, max(1, -(-total // per_page)))}
+
+    def github_compare(self, ctx):
+        # history is static and never rewritten: the stored head is always an ancestor of the branch head
+        if not self._repo(ctx):
+            return 404, {"message": "Not Found"}, {}
+        same = ctx.match["base"] == ctx.match["head"]
+        return 200, {"status": "identical" if same else "ahead", "ahead_by": 0 if same else 1, "behind_by": 0,
+                     "commits": [], "files": []}, {}
+
+    def github_collaborators(self, ctx):
+        if not self._repo(ctx):
+            return 404, {"message": "Not Found"}, {}
+        etag, not_modified = self._etag(ctx, ctx.match["repo"], "collaborators", len(self.world.collaborators))
+        if not_modified:
+            return 304, b"", {"ETag": etag}
+        per_page = int(ctx.query.get("per_page", 30))
+        page = int(ctx.query.get("page", 1))
+        collaborators = self.world.collaborators
+        last = max(1, -(-len(collaborators) // per_page))
+        return 200, collaborators[(page - 1) * per_page:page * per_page], {
+            "ETag": etag, "Link": _page_links(ctx.base, {"per_page": per_page}, page, last)}
+
+    def github_contents(self, ctx):
+        if not self._repo(ctx):
+            return 404, {"message": "Not Found"}, {}
+        text = f"# {ctx.match['repo']}\n\n" + "Synthetic readme paragraph.\n" * 40
+        return 200, {"path": ctx.match["path"], "sha": _sha(ctx.match["repo"], "readme"), "encoding": "base64",
+                     "content": base64.b64encode(text.encode("utf-8")).decode("ascii")}, {}
+
+    def github_contents_put(self, ctx):
+        return 200, {"content": {"path": ctx.match["path"], "sha": self.world.next_id("blob")},
+                     "commit": {"sha": self.world.next_id("commit")}}, {}
+
+    def github_issue(self, ctx):
+        number = int(self.world.next_id(""))
+        return 201, {"number": number, "html_url": f"https://github.com/{OWNER}/{ctx.match['repo']}/issues/{number}"}, {}
+
+    # --- Google Docs / Drive / Calendar / Search ---
+    def docs_create(self, ctx):
+        doc_id = self.world.next_id("doc")
+        with self.world._lock:
+            self.world.documents[doc_id] = 2  # a new document holds one empty paragraph
+        return 200, {"documentId": doc_id, "title": self._json_body(ctx).get("title")}, {}
+
+    def docs_get(self, ctx):
+        end = self.world.documents.get(ctx.match["doc"])
+        if end is None:
+            return 404, {"error": {"code": 404, "status": "NOT_FOUND"}}, {}
+        return 200, {"body": {"content": [{"endIndex": 1}, {"startIndex": 1, "endIndex": end}]}}, {}
+
+    def docs_batch_update(self, ctx):
+        """Applies inserts to the document length and rejects ranges past the end, like the real API."""
+        doc_id = ctx.match["doc"]
+        requests_ = self._json_body(ctx).get("requests") or []
+        with self.world._lock:
+            end = self.world.documents.get(doc_id)
+            if end is None:
+                return 404, {"error": {"code": 404, "status": "NOT_FOUND"}}, {}
+            for n, req in enumerate(requests_):
+                kind, spec = next(iter(req.items()))
+                if kind == "insertText":
+                    index = (spec.get("location") or {}).get("index", 1)
+                    if not 1 <= index < end:
+                        return 400, self._docs_error(n, f"Index {index} must be less than the end index {end}"), {}
+                    end += _utf16_len(spec.get("text") or "")
+                elif "range" in spec:
+                    rng = spec["range"]
+                    if not 1 <= rng.get("startIndex", 0) < rng.get("endIndex", 0) <= end:
+                        return 400, self._docs_error(n, f"Invalid range {rng} for end index {end}"), {}
+            self.world.documents[doc_id] = end
+        return 200, {"documentId": doc_id, "replies": [{} for _ in requests_]}, {}
+
+    @staticmethod
+    def _docs_error(n, message):
+        return {"error": {"code": 400, "message": f"Invalid requests[{n}]: {message}", "status": "INVALID_ARGUMENT"}}
+
+    def drive_permissions(self, ctx):
+        return 200, {"permissions": [{"emailAddress": OWNER_EMAIL, "role": "owner", "type": "user"}]}, {}
+
+    def drive_permission_create(self, ctx):
+        body = self._json_body(ctx)
+        return 200, {"id": self.world.next_id("perm"), "emailAddress": body.get("emailAddress"), "role": body.get("role")}, {}
+
+    def calendar_insert(self, ctx):
+        body = self._json_body(ctx)
+        event_id = self.world.next_id("evt")
+        event = {"id": event_id, "summary": body.get("summary"), "attendees": body.get("attendees") or []}
+        if "conferenceData" in body:
+            event["hangoutLink"] = f"https://meet.google.com/{event_id[-3:]}-bnch-{event_id[-4:]}"
+        return 200, event, {}
+
+    def youtube_search(self, ctx):
+        q = ctx.query.get("q", "")
+        n = int(ctx.query.get("maxResults", 5))
+        return 200, {"items": [{
+            "id": {"videoId": _sha("video", q, i)[:11]},
+            "snippet": {"title": f"{q} part {i + 1}", "description": f"Tutorial about {q}.", "channelTitle": "Bench Channel",
+                        "thumbnails": {"default": {"url": f"https://i.ytimg.com/vi/{_sha('video', q, i)[:11]}/default.jpg"}}},
+        } for i in range(n)]}, {}
+
+    def custom_search(self, ctx):
+        q = ctx.query.get("q", "")
+        n = int(ctx.query.get("num", 5))
+        return 200, {"items": [{"title": f"{q} guide {i + 1}", "link": f"https://docs.example.com/{_sha(q, i)[:8]}",
+                                "snippet": f"Everything about {q}."} for i in range(n)]}, {}
+
+    # --- Slack ---
+    def slack_users_list(self, ctx):
+        limit = int(ctx.query.get("limit", 100))
+        offset = int(ctx.query.get("cursor") or 0)
+        members = self.world.slack_members[offset:offset + limit]
+        cursor = str(offset + limit) if offset + limit < len(self.world.slack_members) else ""
+        return 200, {"ok": True, "members": members, "response_metadata": {"next_cursor": cursor}}, {}
+
+    def slack_lookup(self, ctx):
+        uid = self.world.slack_by_email.get((ctx.query.get("email") or "").lower())
+        if not uid:
+            return 200, {"ok": False, "error": "users_not_found"}, {}
+        return 200, {"ok": True, "user": {"id": uid}}, {}
+
+    def slack_create(self, ctx):
+        name = self._json_body(ctx).get("name")
+        return 200, {"ok": True, "channel": {"id": self.world.next_id("C"), "name": name}}, {}
+
+    def slack_invite(self, ctx):
+        body = self._json_body(ctx)
+        return 200, {"ok": True, "channel": {"id": body.get("channel")}, "invited": (body.get("users") or "").split(",")}, {}
+
+
+class FakeTransport(HTTPAdapter):
+    """Transport adapter answering every request from FakeUpstreams instead of opening a connection."""
+
+    def __init__(self, upstreams):
+        super().__init__(max_retries=0)
+        self.upstreams = upstreams
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        status, headers, data, _ = self.upstreams.handle(request)
+        raw = HTTPResponse(
+            body=io.BytesIO(data), headers=headers, status=status, reason="OK" if status < 400 else "Error",
+            preload_content=False, decode_content=False, request_method=request.method, request_url=request.url,
+        )
+        return self.build_response(request, raw)
+
+
+# -------------------------
+# Fake Gemini
+# -------------------------
+def _model_answer(prompt, seed):
+    """What the model would plausibly answer for each prompt the app sends."""
+    if "main programming languages and frameworks" in prompt:
+        return json.dumps({"languages": ["Python", "TypeScript", "Go"], "frameworks": ["Flask", "React", "Docker"]})
+    if 'keys: "title" (string) and "content"' in prompt:
+        return json.dumps({"title": "Project document", "content": synthetic_markdown(2, seed).replace("# Release notes", "# Overview", 1)})
+    if "release engineer" in prompt:
+        return synthetic_markdown(3, seed)
+    if "post_text" in prompt:
+        return json.dumps({"post_text": "Shipped a new release of the benchmark project. #opensource",
+                           "project_title": "Bench project", "project_description": "- fast\n- offline",
+                           "languages": ["Python"], "frameworks": ["Flask"], "repo_url": "https://github.com/bench"})
+    if "YouTube search queries" in prompt or "Google search queries" in prompt:
+        return json.dumps({"queries": [f"topic {i} tutorial" for i in range(6)], "notes": "synthetic",
+                           "playlist": {"title": "Learning path", "description": "Synthetic playlist."}})
+    return "{}"
+
+
+def make_model_class(latency, counter, seed=7):
+    """A genai.GenerativeModel replacement: first-token delay plus output tokens at GEMINI_TOKENS_PER_SECOND."""
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name=None, **kwargs):
+            self.model_name = model_name
+
+        def generate_content(self, prompt, stream=False, **kwargs):
+            text = _model_answer(str(prompt), seed)
+            if not stream:
+                counter.add("gemini.generate")
+                latency.wait(GEMINI_FIRST_TOKEN + len(text) / GEMINI_CHARS_PER_TOKEN / GEMINI_TOKENS_PER_SECOND)
+                return SimpleNamespace(text=text)
+            counter.add("gemini.stream")
+            return self._stream(text)
+
+        @staticmethod
+        def _stream(text, chunk_chars=400):
+            latency.wait(GEMINI_FIRST_TOKEN)
+            for i in range(0, len(text), chunk_chars):
+                chunk = text[i:i + chunk_chars]
+                if i:
+                    latency.wait(len(chunk) / GEMINI_CHARS_PER_TOKEN / GEMINI_TOKENS_PER_SECOND)
+                yield SimpleNamespace(text=chunk)
+
+        def count_tokens(self, prompt, **kwargs):
+            counter.add("gemini.count_tokens")
+            latency.wait(0.1)
+            return SimpleNamespace(total_tokens=len(str(prompt)) // GEMINI_CHARS_PER_TOKEN)
+
+    return FakeGenerativeModel
+
+
+# -------------------------
+# In-memory MongoDB
+# -------------------------
+_MISSING = object()
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _get(doc, path):
+    if "." not in path:
+        return doc.get(path, _MISSING) if isinstance(doc, dict) else _MISSING
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def _set(doc, path, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def _unset(doc, path):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(leaf, None)
+
+
+def _compare(op):
+    def check(value, arg):
+        if value is _MISSING or value is None:
+            return False
+        try:
+            return op(value, arg)
+        except TypeError:
+            return False
+    return check
+
+
+_TYPES = {"string": str, "int": int, "double": float, "bool": bool, "object": dict, "array": list, "date": datetime}
+_OPERATORS = {
+    "$eq": lambda v, arg: v == arg or (arg is None and v is _MISSING),
+    "$in": lambda v, arg: (None if v is _MISSING else v) in arg,
+    "$nin": lambda v, arg: (None if v is _MISSING else v) not in arg,
+    "$ne": lambda v, arg: (None if v is _MISSING else v) != arg,
+    "$exists": lambda v, arg: (v is not _MISSING) == bool(arg),
+    "$type": lambda v, arg: isinstance(v, _TYPES[arg]) and not (arg == "int" and isinstance(v, bool)),
+    "$gt": _compare(lambda v, a: v > a), "$gte": _compare(lambda v, a: v >= a),
+    "$lt": _compare(lambda v, a: v < a), "$lte": _compare(lambda v, a: v <= a),
+}
+
+
+def _is_operator_doc(cond):
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+
+def _equality(cond):
+    """The value a condition pins its field to ({"$eq": x, ...} counts), or _MISSING."""
+    if not _is_operator_doc(cond):
+        return cond
+    return cond.get("$eq", _MISSING)
+
+
+def _matches(doc, flt):
+    for key, cond in (flt or {}).items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$and":
+            if not all(_matches(doc, sub) for sub in cond):
+                return False
+        elif _is_operator_doc(cond):
+            value = _get(doc, key)
+            if not all(_OPERATORS[op](value, arg) for op, arg in cond.items()):
+                return False
+        else:
+            value = _get(doc, key)
+            if not (value == cond or (cond is None and value is _MISSING)):
+                return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return _copy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = [k for k, v in projection.items() if v and k != "_id"]
+    if not include:
+        out = _copy(doc)
+        for k, v in projection.items():
+            if not v:
+                _unset(out, k)
+        return out
+    out = {"_id": doc["_id"]} if projection.get("_id", 1) and "_id" in doc else {}
+    for path in include:
+        value = _get(doc, path)
+        if value is not _MISSING:
+            _set(out, path, _copy(value))
+    return out
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _sort_value(value):
+    # missing fields and None sort (and index) together, below every other value
+    return (0, None) if value is _MISSING or value is None else (1, value)
+
+
+def _index_keys(keys):
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return [(k, d) for k, d in keys]
+
+
+class MemoryCursor:
+    def __init__(self, collection, flt, projection):
+        self._collection = collection
+        self._filter = flt
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def explain(self):
+        index = self._collection._best_index(self._filter or {})
+        scan = {"stage": "IXSCAN", "indexName": index[0]} if index else {"stage": "COLLSCAN"}
+        return {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": scan} if index else scan}}
+
+    def __iter__(self):
+        docs = self._collection._select_sorted(self._filter, self._sort)
+        docs = docs[self._skip:self._skip + self._limit if self._limit else None]
+        return iter([_project(d, self._projection) for d in docs])
+
+
+class MemoryCollection:
+    """The subset of pymongo's Collection API the app uses; equality prefixes of created indexes are hash lookups."""
+
+    def __init__(self, name, latency, counter):
+        self.name = name
+        self._latency = latency
+        self._counter = counter
+        self._docs = {}  # _id -> document, in insertion order
+        self._indexes = {}  # name -> {"key", "options", "buckets": [{prefix tuple: {_id: None}}, ...]}
+        # sorted results per (filter, sort) until the next write, standing in for an index-ordered scan
+        self._sorted = {}
+        self._version = 0
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        self._counter.add(f"mongo.{self.name}")
+        self._latency.wait(MONGO_LATENCY)
+
+    # --- indexes ---
+    def create_index(self, keys, **options):
+        keys = _index_keys(keys)
+        name = options.get("name") or "_".join(f"{k}_{d}" for k, d in keys)
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = {"key": keys, "options": options, "buckets": [{} for _ in keys]}
+                for doc in self._docs.values():
+                    self._index_doc(self._indexes[name], doc, add=True)
+        return name
+
+    def index_information(self):
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for name, idx in self._indexes.items():
+            info[name] = {"key": idx["key"], **{k: v for k, v in idx["options"].items() if k != "name"}}
+        return info
+
+    def _index_doc(self, idx, doc, add):
+        values = tuple(_hashable(_sort_value(_get(doc, k))[-1]) for k, _ in idx["key"])
+        for n, bucket in enumerate(idx["buckets"]):
+            prefix = values[:n + 1]
+            if add:
+                bucket.setdefault(prefix, {})[doc["_id"]] = None
+            else:
+                ids = bucket.get(prefix)
+                if ids is not None:
+                    ids.pop(doc["_id"], None)
+                    if not ids:
+                        del bucket[prefix]
+
+    def _reindex(self, doc, add):
+        self._version += 1
+        for idx in self._indexes.values():
+            self._index_doc(idx, doc, add)
+
+    def _best_index(self, flt):
+        """(name, index, equality prefix) of the index pinning the most leading fields of flt, or None."""
+        best = None
+        for name, idx in self._indexes.items():
+            partial = idx["options"].get("partialFilterExpression") or {}
+            if not all(_is_operator_doc(flt.get(field)) and cond.items() <= flt[field].items()
+                       for field, cond in partial.items()):
+                # like MongoDB's planner: a partial index only serves queries that repeat its filter
+                continue
+            prefix = []
+            for field, _ in idx["key"]:
+                value = _equality(flt.get(field, _MISSING))
+                if value is _MISSING:
+                    break
+                prefix.append(_hashable(value))
+            if prefix and (best is None or len(prefix) > len(best[2])):
+                best = (name, idx, tuple(prefix))
+        return best
+
+    def _select(self, flt):
+        """Matching documents (not copies); caller holds no lock."""
+        flt = flt or {}
+        with self._lock:
+            if "_id" in flt and not _is_operator_doc(flt["_id"]):
+                candidates = [self._docs[flt["_id"]]] if flt["_id"] in self._docs else []
+            else:
+                best = self._best_index(flt)
+                if best:
+                    ids = best[1]["buckets"][len(best[2]) - 1].get(best[2], {})
+                    candidates = [self._docs[i] for i in ids]
+                else:
+                    candidates = list(self._docs.values())
+            return [d for d in candidates if _matches(d, flt)]
+
+    def _select_sorted(self, flt, sort):
+        if not sort:
+            return self._select(flt)
+        key = (repr(flt), tuple(sort))
+        with self._lock:
+            cached = self._sorted.get(key)
+            if cached and cached[0] == self._version:
+                return list(cached[1])
+            version = self._version
+        docs = self._select(flt)
+        if len({direction for _, direction in sort}) == 1:
+            docs.sort(key=lambda d: tuple(_sort_value(_get(d, f)) for f, _ in sort), reverse=sort[0][1] == -1)
+        else:
+            for field, direction in reversed(sort):
+                # stable sorts from the last key to the first; missing/None sorts lowest, like MongoDB
+                docs.sort(key=lambda d: _sort_value(_get(d, field)), reverse=direction == -1)
+        with self._lock:
+            self._sorted[key] = (version, docs)
+        return list(docs)
+
+    # --- reads ---
+    def find_one(self, flt=None, projection=None, **kwargs):
+        self._round_trip()
+        docs = self._select(flt)
+        return _project(docs[0], projection) if docs else None
+
+    def find(self, flt=None, projection=None, **kwargs):
+        self._round_trip()
+        return MemoryCursor(self, flt, projection)
+
+    def count_documents(self, flt, **kwargs):
+        self._round_trip()
+        return len(self._select(flt))
+
+    # --- writes ---
+    def _insert(self, doc, copy=True):
+        doc = _copy(doc) if copy else doc
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self._docs:
+            raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key _id {doc['_id']!r} in {self.name}")
+        self._docs[doc["_id"]] = doc
+        self._reindex(doc, add=True)
+        return doc
+
+    @staticmethod
+    def _apply(doc, update, inserting):
+        for path, value in (update.get("$set") or {}).items():
+            _set(doc, path, _copy(value))
+        if inserting:
+            for path, value in (update.get("$setOnInsert") or {}).items():
+                _set(doc, path, _copy(value))
+        for path in update.get("$unset") or {}:
+            _unset(doc, path)
+        for path, amount in (update.get("$inc") or {}).items():
+            current = _get(doc, path)
+            _set(doc, path, (0 if current is _MISSING else current) + amount)
+        for path, value in (update.get("$push") or {}).items():
+            current = _get(doc, path)
+            _set(doc, path, (current if isinstance(current, list) else []) + [_copy(value)])
+
+    def _touches_index(self, update):
+        fields = {path.split(".")[0] for op in update.values() for path in op}
+        return any(f.split(".")[0] in fields for idx in self._indexes.values() for f, _ in idx["key"])
+
+    def _update(self, flt, update, upsert, many=False):
+        """Returns (matched, upserted_id, [updated docs])."""
+        with self._lock:
+            docs = self._select(flt)
+            if not many:
+                docs = docs[:1]
+            reindex = self._touches_index(update)
+            for doc in docs:
+                if reindex:
+                    self._reindex(doc, add=False)
+                self._apply(doc, update, inserting=False)
+                if reindex:
+                    self._reindex(doc, add=True)
+                self._version += 1
+            if docs or not upsert:
+                return len(docs), None, docs
+            doc = {}
+            for path, value in (flt or {}).items():
+                value = _equality(value)
+                if not path.startswith("$") and value is not _MISSING:
+                    _set(doc, path, _copy(value))
+            self._apply(doc, update, inserting=True)
+            doc = self._insert(doc, copy=False)
+            return 0, doc["_id"], [doc]
+
+    def update_one(self, flt, update, upsert=False, **kwargs):
+        self._round_trip()
+        matched, upserted_id, _ = self._update(flt, update, upsert)
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted_id)
+
+    def update_many(self, flt, update, upsert=False, **kwargs):
+        self._round_trip()
+        matched, upserted_id, _ = self._update(flt, update, upsert, many=True)
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted_id)
+
+    def find_one_and_update(self, flt, update, projection=None, upsert=False,
+                            return_document=pymongo.ReturnDocument.BEFORE, **kwargs):
+        self._round_trip()
+        with self._lock:
+            before = [_copy(d) for d in self._select(flt)[:1]]
+            matched, _, docs = self._update(flt, update, upsert)
+            if return_document == pymongo.ReturnDocument.AFTER:
+                return _project(docs[0], projection) if docs else None
+            return _project(before[0], projection) if matched else None
+
+    def insert_one(self, doc, **kwargs):
+        self._round_trip()
+        with self._lock:
+            inserted = self._insert(doc)
+        doc.setdefault("_id", inserted["_id"])
+        return SimpleNamespace(inserted_id=inserted["_id"])
+
+    def _delete(self, flt, many):
+        with self._lock:
+            docs = self._select(flt)
+            if not many:
+                docs = docs[:1]
+            for doc in docs:
+                self._reindex(doc, add=False)
+                del self._docs[doc["_id"]]
+            return SimpleNamespace(deleted_count=len(docs))
+
+    def delete_one(self, flt, **kwargs):
+        self._round_trip()
+        return self._delete(flt, many=False)
+
+    def delete_many(self, flt, **kwargs):
+        self._round_trip()
+        return self._delete(flt, many=True)
+
+    def bulk_write(self, operations, ordered=True, **kwargs):
+        """UpdateOne / UpdateMany / InsertOne / DeleteOne / DeleteMany in one round trip."""
+        self._round_trip()
+        matched = upserted = inserted = deleted = 0
+        with self._lock:
+            for op in operations:
+                if isinstance(op, (pymongo.UpdateOne, pymongo.UpdateMany)):
+                    n, upserted_id, _ = self._update(op._filter, op._doc, op._upsert, many=isinstance(op, pymongo.UpdateMany))
+                    matched += n
+                    upserted += upserted_id is not None
+                elif isinstance(op, pymongo.InsertOne):
+                    self._insert(op._doc)
+                    inserted += 1
+                elif isinstance(op, (pymongo.DeleteOne, pymongo.DeleteMany)):
+                    deleted += self._delete(op._filter, many=isinstance(op, pymongo.DeleteMany)).deleted_count
+                else:
+                    raise NotImplementedError(f"bulk_write: {type(op).__name__}")
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_count=upserted,
+                               inserted_count=inserted, deleted_count=deleted)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            for idx in self._indexes.values():
+                idx["buckets"] = [{} for _ in idx["key"]]
+
+
+class MemoryDatabase:
+    def __init__(self, latency, counter):
+        self._latency = latency
+        self._counter = counter
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name, self._latency, self._counter)
+        return self.collections[name]
+
+    def clear(self):
+        for coll in self.collections.values():
+            coll.clear()
+
+
+# -------------------------
+# Wiring
+# -------------------------
+# in-process caches of the app module that a cold request must not see
+APP_CACHES = (
+    "_outbound_token_cache", "_github_identity_cache", "_collaborator_rosters", "_gemini_lru",
+    "_repo_analysis_lru", "_search_cache", "_slack_team_ids", "_slack_directories", "_youtube_search_cache",
+)
+
+
+def install(A, latency_scale=1.0, seed=7, **world_options):
+    """
+    Points the imported app module A at the fakes: every *_collection becomes an in-memory collection (with
+    the app's MONGO_INDEXES), genai.GenerativeModel becomes the fake model and every pooled session gets the
+    fake transport mounted. Returns a namespace with the world, the call counter and reset().
+    """
+    counter = CallCounter()
+    latency = Latency(latency_scale, seed)
+    world = World(seed, **world_options)
+    memdb = MemoryDatabase(latency, counter)
+
+    real = {}
+    for attr in dir(A):
+        coll = getattr(A, attr)
+        if attr.endswith("_collection") and isinstance(coll, pymongo.collection.Collection):
+            real[coll.name] = coll
+            setattr(A, attr, memdb[coll.name])
+    A.MONGO_INDEXES = [(memdb[coll.name], keys, opts) for coll, keys, opts in A.MONGO_INDEXES]
+    for coll, keys, opts in A.MONGO_INDEXES:
+        coll.create_index(keys, **opts)
+
+    A.genai.GenerativeModel = make_model_class(latency, counter, seed)
+
+    transport = FakeTransport(FakeUpstreams(world, latency, counter))
+    session_for_host = A.http_session
+    mount_lock = threading.Lock()
+
+    def http_session(host):
+        session = session_for_host(host)
+        with mount_lock:
+            if session.get_adapter("https://") is not transport:
+                session.mount("https://", transport)
+                session.mount("http://", transport)
+        return session
+
+    with A._http_sessions_lock:
+        A._http_sessions.clear()
+    A.http_session = http_session
+
+    def reset():
+        """Empties every cache (in-process and stored) and re-seeds the users collection."""
+        memdb.clear()
+        for attr in APP_CACHES:
+            getattr(A, attr).clear()
+        for user in world.users:
+            memdb["users"].insert_one(_copy(user))
+
+    reset()
+    return SimpleNamespace(world=world, counter=counter, latency=latency, db=memdb, reset=reset)
+
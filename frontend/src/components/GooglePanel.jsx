@@ -11,7 +11,8 @@ export default function GooglePanel({ languages = [], frameworks = [], repoName
     const [error, setError] = useState(null);
     const [regenerating, setRegenerating] = useState(false);
 
-    async function fetchSuggestions() {
+    // regenerate asks the backend to skip its cached Gemini queries
+    async function fetchSuggestions(regenerate = false) {
         setLoading(true);
         setError(null);
         setSuggestions(null);
@@ -25,7 +26,8 @@ export default function GooglePanel({ languages = [], frameworks = [], repoName
                     languages,
                     frameworks,
                     repoName,
-                    description: repoDescription
+                    description: repoDescription,
+                    regenerate
                 })
             });
             if (!res.ok) {
@@ -99,7 +101,7 @@ export default function GooglePanel({ languages = [], frameworks = [], repoName
     async function regenerate() {
         setRegenerating(true);
         setFolderUrl(null);
-        await fetchSuggestions();
+        await fetchSuggestions(true);
     }
 
     return (
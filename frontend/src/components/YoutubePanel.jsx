@@ -11,8 +11,8 @@ export default function YouTubePanel({ languages = [], frameworks = [], repoName
     const [error, setError] = useState(null);
     const [regenerating, setRegenerating] = useState(false);
 
-    // Fetch suggestions
-    async function fetchSuggestions() {
+    // Fetch suggestions; regenerate asks the backend to skip its cached Gemini queries
+    async function fetchSuggestions(regenerate = false) {
         setLoading(true);
         setError(null);
         try {
@@ -25,6 +25,7 @@ export default function YouTubePanel({ languages = [], frameworks = [], repoName
                     frameworks,
                     repoName,
                     description: repoDescription,
+                    regenerate,
                 }),
             });
             if (!res.ok) {
@@ -93,7 +94,7 @@ export default function YouTubePanel({ languages = [], frameworks = [], repoName
     async function regenerateSuggestionsAndPlaylist() {
         setRegenerating(true);
         setPlaylistUrl(null); // Remove old playlist
-        await fetchSuggestions();
+        await fetchSuggestions(true);
     }
 
     return (
@@ -5,6 +5,7 @@ import { useUser, useSession } from "@descope/react-sdk";
 import { useNavigate } from "react-router-dom";
 import ConnectPanel from "../components/ConnectPanel";
 import AuthModal from "../components/AuthModal"; // import modal
+import { readNdjson } from "../utils/helpers";
 
 function formatDate(dateStr) {
     if (!dateStr) return "Never";
@@ -26,10 +27,24 @@ export default function GithubDetails() {
             fetch("https://mcp-hackathon-7buc.vercel.app/api/github/minimal", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ loginId: user.userId }),
+                body: JSON.stringify({ loginId: user.userId, stream: true }),
             })
-                .then(res => res.json())
-                .then(data => setRepos(data.repos || []))
+                .then(async res => {
+                    if (!res.ok || !res.body) {
+                        const data = await res.json();
+                        setRepos(data.repos || []);
+                        return;
+                    }
+                    // repos arrive one page at a time; render each page as soon as it lands
+                    let received = [];
+                    await readNdjson(res, msg => {
+                        if (msg.repos) {
+                            received = received.concat(msg.repos);
+                            setRepos(received);
+                        }
+                    });
+                    setRepos(received);
+                })
                 .catch(() => setRepos([]))
                 .finally(() => setLoading(false));
         }
@@ -97,7 +112,7 @@ export default function GithubDetails() {
                 <div className="grid grid-cols-1 lg:grid-cols-3 gap-6">
                     <section className="lg:col-span-2">
                         <div className="rounded-xl p-4 bg-gradient-to-br from-gray-900/50 to-gray-800/50 border border-gray-800/50">
-                            {loading || repos === null ? (
+                            {repos === null || (loading && repos.length === 0) ? (
                                 <div className="p-8 text-gray-300">Loading repositories...</div>
                             ) : repos.length === 0 ? (
                                 <div className="p-8 text-gray-400 text-center">
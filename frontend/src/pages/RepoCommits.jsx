@@ -8,6 +8,7 @@ import 'chartjs-adapter-date-fns';
 import ReactMarkdown from "react-markdown";
 import { ToastContainer, toast } from "react-toastify";
 import "react-toastify/dist/ReactToastify.css";
+import { readNdjson } from "../utils/helpers";
 
 Chart.register(CategoryScale, LinearScale, PointElement, LineElement, TimeScale, Tooltip, Legend);
 
@@ -36,12 +37,26 @@ function RepoReleaseNotes({ repoName, commits }) {
       const res = await fetch("https://mcp-hackathon-7buc.vercel.app/api/github/generate-release-notes", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ loginId: user?.userId, repoName }),
+        body: JSON.stringify({ loginId: user?.userId, repoName, stream: true }),
       });
-      const payload = await res.json();
-      if (!res.ok) throw new Error(payload?.error || JSON.stringify(payload));
-      setPreviewData(payload);
-      setEditedMd(payload.release_notes || "");
+      if (!res.ok) {
+        const payload = await res.json().catch(() => ({}));
+        throw new Error(payload?.error || `Server ${res.status}`);
+      }
+      // render the markdown as it streams in; the final "done" event carries the complete payload
+      let draft = "";
+      let final = null;
+      await readNdjson(res, msg => {
+        if (msg.error) throw new Error(msg.detail || msg.error);
+        if (msg.delta) {
+          draft += msg.delta;
+          setPreviewData({ title: "Generating…", release_notes: draft });
+        }
+        if (msg.done) final = msg;
+      });
+      if (!final) throw new Error("stream ended early");
+      setPreviewData(final);
+      setEditedMd(final.release_notes || "");
       setEditing(true);
       toast.success("Preview generated.");
     } catch (err) {
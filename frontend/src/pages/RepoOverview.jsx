@@ -6,6 +6,7 @@ import ConnectPanel from "../components/ConnectPanel";
 import { useUser } from "@descope/react-sdk";
 import { ToastContainer, toast } from "react-toastify";
 import "react-toastify/dist/ReactToastify.css";
+import { readNdjson } from "../utils/helpers";
 
 export default function RepoOverview() {
   const { details, loading, error, repoName, setDetails } = useRepo();
@@ -163,8 +164,8 @@ export default function RepoOverview() {
     }
   }
 
-  // Ask server to generate a README suggestion using Gemini
-  async function generateReadmeSuggestion() {
+  // Ask server to generate a README suggestion using Gemini (regenerate skips the server's cached answer)
+  async function generateReadmeSuggestion(regenerate = false) {
     // Avoid duplicate concurrent generation
     if (suggestedLoading) return;
     setSuggestedLoading(true);
@@ -173,11 +174,25 @@ export default function RepoOverview() {
       const res = await fetch("https://mcp-hackathon-7buc.vercel.app/api/github/readme/suggest", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ loginId: user?.userId, repoName })
+        body: JSON.stringify({ loginId: user?.userId, repoName, stream: true, regenerate })
       });
-      const payload = await res.json().catch(() => ({}));
-      if (!res.ok) throw new Error(payload.error || `Server ${res.status}`);
-      setSuggestedReadme(payload.suggested || "");
+      if (!res.ok) {
+        const payload = await res.json().catch(() => ({}));
+        throw new Error(payload.error || `Server ${res.status}`);
+      }
+      // show the draft as it streams in; the final "done" event carries the cleaned-up markdown
+      let draft = "";
+      let final = null;
+      await readNdjson(res, msg => {
+        if (msg.error) throw new Error(msg.detail || msg.error);
+        if (msg.delta) {
+          draft += msg.delta;
+          setSuggestedReadme(draft);
+        }
+        if (msg.done) final = msg;
+      });
+      if (!final) throw new Error("stream ended early");
+      setSuggestedReadme(final.suggested || "");
       toast.success("Generated README suggestion.");
     } catch (e) {
       setSuggestedReadme("Failed to generate README suggestion.");
@@ -237,7 +252,7 @@ export default function RepoOverview() {
   if (error) return <div className="p-6 text-red-400">{error}</div>;
   if (!details) return <div className="p-6 text-gray-400">Repository details unavailable.</div>;
 
-  async function fetchDescriptionSuggestion() {
+  async function fetchDescriptionSuggestion(regenerate = false) {
     if (descLoading) return;
     setDescLoading(true);
     setDescSuggestion("");
@@ -245,7 +260,7 @@ export default function RepoOverview() {
       const res = await fetch("https://mcp-hackathon-7buc.vercel.app/api/github/description-suggest", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ loginId: user?.userId, repoName }),
+        body: JSON.stringify({ loginId: user?.userId, repoName, regenerate }),
       });
       const payload = await res.json().catch(() => ({}));
       if (!res.ok) throw new Error(payload?.error || payload?.message || `Server ${res.status}`);
@@ -294,7 +309,7 @@ export default function RepoOverview() {
                 <div className="text-sm text-gray-200">{descSuggestion}</div>
                 <div className="mt-4 flex gap-2">
                   <button onClick={applyDescription} disabled={descApplyLoading} className="px-4 py-2 rounded-xl bg-indigo-600 text-white font-semibold shadow hover:scale-[1.01] transition disabled:opacity-50">{descLoading ? "Applying..." : "Apply"}</button>
-                  <button onClick={fetchDescriptionSuggestion} disabled={descLoading} className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold shadow hover:scale-[1.01] transition disabled:opacity-50">{descLoading ? "Regenerating..." : "Regenerate"}</button>
+                  <button onClick={() => fetchDescriptionSuggestion(true)} disabled={descLoading} className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold shadow hover:scale-[1.01] transition disabled:opacity-50">{descLoading ? "Regenerating..." : "Regenerate"}</button>
                 </div>
               </motion.div>
             ) : (
@@ -410,7 +425,7 @@ export default function RepoOverview() {
                 <div className="mt-3 flex gap-2">
                   {/* Regenerate suggestion (creates a draft suggestion) */}
                   <button
-                    onClick={generateReadmeSuggestion}
+                    onClick={() => generateReadmeSuggestion(true)}
                     disabled={suggestedLoading}
                     className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold shadow disabled:opacity-50"
                   >
@@ -435,7 +450,7 @@ export default function RepoOverview() {
                       <button onClick={applyReadme} disabled={applyingReadme} className="px-4 py-2 rounded-xl bg-indigo-600 text-white font-semibold">
                         {applyingReadme ? "Applying..." : "Apply"}
                       </button>
-                      <button onClick={generateReadmeSuggestion} disabled={suggestedLoading || applyingReadme} className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold">
+                      <button onClick={() => generateReadmeSuggestion(true)} disabled={suggestedLoading || applyingReadme} className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold">
                         {suggestedLoading ? "Regenerating..." : "Regenerate"}
                       </button>
                     </div>
@@ -456,7 +471,7 @@ export default function RepoOverview() {
                       <button onClick={applyReadme} disabled={applyingReadme} className="px-4 py-2 rounded-xl bg-indigo-600 text-white font-semibold">
                         {applyingReadme ? "Applying..." : "Apply"}
                       </button>
-                      <button onClick={generateReadmeSuggestion} disabled={suggestedLoading || applyingReadme} className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold">
+                      <button onClick={() => generateReadmeSuggestion(true)} disabled={suggestedLoading || applyingReadme} className="px-4 py-2 rounded-xl bg-pink-600 text-white font-semibold">
                         {suggestedLoading ? "Regenerating..." : "Regenerate"}
                       </button>
                     </div>
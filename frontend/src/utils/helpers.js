@@ -11,4 +11,21 @@ export function getInitials(name, email) {
         return email[0].toUpperCase();
     }
     return "U";
-}
\ No newline at end of file
+}
+// Reads a newline-delimited JSON response body and calls onMessage for every parsed line.
+export async function readNdjson(res, onMessage) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (line.trim()) onMessage(JSON.parse(line));
+        }
+    }
+    if (buffer.trim()) onMessage(JSON.parse(buffer));
+}